@@ -0,0 +1,95 @@
+"""
+Cost of binding the routed remainder and request parameters to controller
+arguments, comparing the per-request ``argspec`` processing Pecan used to do
+with the ``ArgBinder`` compiled by ``expose``.
+
+Usage::
+
+    python benchmarks/arguments.py [iterations]
+"""
+from inspect import getargspec
+from timeit import Timer
+
+from pecan.decorators import ArgBinder
+
+import sys
+
+
+def legacy_get_args(all_params, remainder, argspec, im_self):
+    # the argument handling of Pecan.get_args before ArgBinder
+    args = []
+    kwargs = dict()
+    valid_args = argspec[0][1:]
+    if im_self is not None:
+        args.append(im_self)
+    if valid_args and remainder:
+        args.extend(remainder[:len(valid_args)])
+        remainder = remainder[len(valid_args):]
+        valid_args = valid_args[len(args):]
+    if remainder:
+        if not argspec[1]:
+            raise ValueError
+        args.extend(remainder)
+    if argspec[3]:
+        defaults = dict(zip(argspec[0][-len(argspec[3]):], argspec[3]))
+    else:
+        defaults = dict()
+    for name in valid_args:
+        if name in all_params:
+            args.append(all_params.pop(name))
+        elif name in defaults:
+            args.append(defaults[name])
+        else:
+            break
+    if argspec[2]:
+        for name, value in all_params.iteritems():
+            if name not in argspec[0]:
+                kwargs[name] = value
+    return args, kwargs
+
+
+def zero(self):
+    pass
+
+def three(self, a, b=None, c=None, **kw):
+    pass
+
+def ten(self, a, b, c, d, e, f=None, g=None, h=None, i=None, j=None, **kw):
+    pass
+
+CASES = [
+    ('0 args', zero, [], {}),
+    ('3 args', three, ['1'], {'b': '2', 'c': '3', 'extra': 'x'}),
+    ('10 args', ten, ['1', '2', '3'], dict(
+        [(name, name) for name in 'defghij'] + [('extra', 'x')]
+    )),
+]
+
+
+def main(iterations=100000):
+    print '%-8s %14s %14s %8s' % ('case', 'argspec (us)', 'binder (us)', 'speedup')
+    for name, f, remainder, params in CASES:
+        argspec = getargspec(f)
+        binder = ArgBinder(argspec)
+        assert legacy_get_args(dict(params), remainder, argspec, None) == \
+            binder.bind(dict(params), remainder)
+
+        legacy = Timer(
+            lambda: legacy_get_args(dict(params), remainder, argspec, None)
+        ).timeit(iterations)
+        compiled = Timer(
+            lambda: binder.bind(dict(params), remainder)
+        ).timeit(iterations)
+        print '%-8s %14.2f %14.2f %7.1fx' % (
+            name,
+            legacy / iterations * 1e6,
+            compiled / iterations * 1e6,
+            legacy / compiled
+        )
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
@@ -0,0 +1,71 @@
+"""
+Throughput of a Pecan application whose controllers wait on a slow
+downstream service, served one request at a time versus concurrently by a
+pool of worker threads. Each response is checked against the request that
+produced it, to make sure request state doesn't leak between workers.
+
+Usage::
+
+    python benchmarks/concurrency.py [requests] [latency in ms]
+"""
+from Queue import Queue
+from threading import Thread
+from time import sleep, time
+
+from webob import Request
+
+from pecan import expose, make_app
+
+import sys
+
+
+class RootController(object):
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    @expose()
+    def index(self, n):
+        # simulate a call to a slow downstream service
+        sleep(self.latency)
+        return n
+
+
+def call(app, n):
+    response = Request.blank('/?n=%d' % n).get_response(app)
+    assert response.body == str(n), 'response for %d leaked' % n
+
+
+def serve(app, requests, workers):
+    queue = Queue()
+    for n in range(requests):
+        queue.put(n)
+
+    def worker():
+        while True:
+            n = queue.get()
+            if n is None:
+                break
+            call(app, n)
+
+    threads = [Thread(target=worker) for i in range(workers)]
+    for thread in threads:
+        queue.put(None)
+    start = time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time() - start
+
+
+def main(requests=200, latency=10):
+    app = make_app(RootController(latency / 1000.0))
+    print '%-8s %10s %10s' % ('workers', 'time (s)', 'req/s')
+    for workers in (1, 4, 16, 64):
+        elapsed = serve(app, requests, workers)
+        print '%-8d %10.2f %10.1f' % (workers, elapsed, requests / elapsed)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,74 @@
+"""
+Cost of filling in forms that failed validation with ``formencode.htmlfill``
+versus the single pass ``pecan.formfill``, for each of the ``form_*.html``
+fixtures in ``tests/templates`` and for a large page made of many copies of
+them.
+
+Usage::
+
+    python benchmarks/htmlfill.py [iterations]
+"""
+from glob import glob
+from timeit import Timer
+
+from formencode import htmlfill
+from pecan import formfill
+
+import os
+import sys
+
+
+TEMPLATES = os.path.join(os.path.dirname(__file__), os.pardir, 'tests', 'templates')
+
+DEFAULTS = {
+    'colors-0': 'blue',
+    'colors-1': '',
+    'name': '',
+    'username': 'ryan',
+    'password': ''
+}
+ERRORS = {
+    'colors-1': 'Please enter a value',
+    'name': 'Please enter a value',
+    'password': 'Please enter a value'
+}
+
+
+def load_forms():
+    forms = []
+    for path in sorted(glob(os.path.join(TEMPLATES, 'form_*.html'))):
+        forms.append((os.path.basename(path), open(path).read()))
+    page = '<html><body>\n%s\n%s</body></html>' % (
+        '<p>Some text around the form</p>\n' * 500,
+        '\n'.join([form for name, form in forms]) * 20
+    )
+    forms.append(('large page', page))
+    return forms
+
+
+def main(iterations=2000):
+    print '%-28s %15s %15s %8s' % (
+        'form', 'htmlfill (us)', 'formfill (us)', 'speedup'
+    )
+    for name, form in load_forms():
+        options = dict(defaults=DEFAULTS, errors=ERRORS, auto_insert_errors=True)
+        assert htmlfill.render(form, **options) == formfill.render(form, **options)
+
+        n = iterations
+        if name == 'large page':
+            n = max(iterations / 100, 1)
+        legacy = Timer(lambda: htmlfill.render(form, **options)).timeit(n)
+        fast = Timer(lambda: formfill.render(form, **options)).timeit(n)
+        print '%-28s %15.2f %15.2f %7.1fx' % (
+            name,
+            legacy / n * 1e6,
+            fast / n * 1e6,
+            legacy / fast
+        )
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
@@ -0,0 +1,47 @@
+"""
+Time and peak memory of encoding a large export as one ``JSON`` string
+versus streaming it with ``pecan.jsonify.iterencode``. The streamed export
+is run first, as the peak memory of the process can only grow.
+
+Usage::
+
+    python benchmarks/json_streaming.py [rows]
+"""
+from resource import getrusage, RUSAGE_SELF
+from time import time
+
+from pecan.jsonify import encode, iterencode
+from pecan.templating import buffered
+
+import sys
+
+
+def rows(n):
+    for i in xrange(n):
+        yield dict(id=i, name='user %d' % i, email='user%d@example.com' % i)
+
+
+def peak_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return getrusage(RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def main(n=1000000):
+    print '%-10s %10s %10s %16s' % ('mode', 'rows', 'time (s)', 'peak RSS (MB)')
+    start = time()
+    size = 0
+    for chunk in buffered(iterencode(dict(rows=rows(n)))):
+        size += len(chunk)
+    print '%-10s %10d %10.2f %16.1f' % ('streamed', n, time() - start, peak_mb())
+
+    start = time()
+    body = encode(dict(rows=list(rows(n))))
+    assert len(body) == size
+    print '%-10s %10d %10.2f %16.1f' % ('buffered', n, time() - start, peak_mb())
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
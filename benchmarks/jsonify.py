@@ -0,0 +1,97 @@
+"""
+Cost of encoding lists of objects which JSON can't encode natively with
+``simplegeneric`` dispatch on every object (as ``pecan.jsonify.encode`` used
+to) versus the per-type dispatch cache, for each encoder backend.
+
+The generic encoder is built on simplejson when it is installed, which
+encodes ``Decimal`` objects natively, without converting them; the ``json``
+backend can't, so converts each of them to a ``float`` and is slower than
+that baseline for lists of ``Decimal`` objects.
+
+Usage::
+
+    python benchmarks/jsonify.py [iterations]
+"""
+from datetime import date
+from decimal import Decimal
+from json import loads
+from timeit import Timer
+
+from pecan.jsonify import jsonify, make_encoder, GenericJSON
+
+import sys
+
+
+class LegacyJSON(GenericJSON):
+    # the encoder of pecan.jsonify.encode before the dispatch cache
+    def default(self, obj):
+        return jsonify(obj)
+
+
+class Point(object):
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+    def __json__(self):
+        return dict(x=self.x, y=self.y)
+
+
+class Tagged(object):
+    def __init__(self, tag):
+        self.tag = tag
+
+
+@jsonify.when_type(Tagged)
+def jsonify_tagged(obj):
+    return obj.tag
+
+
+CASES = [
+    ('__json__', [Point(i, i) for i in range(1000)]),
+    ('when_type', [Tagged('tag-%d' % i) for i in range(1000)]),
+    ('date', [date(2012, 1, 1 + i % 28) for i in range(1000)]),
+    ('Decimal', [Decimal(i) / 4 for i in range(1000)]),
+    ('mixed', [
+        dict(point=Point(i, i), tagged=Tagged('tag'), day=date(2012, 1, 1), price=Decimal('1.5'))
+        for i in range(250)
+    ]),
+]
+
+
+def backends():
+    names = ['json']
+    try:
+        import simplejson
+        names.append('simplejson')
+    except ImportError:
+        pass
+    return names
+
+
+def main(iterations=200):
+    legacy_encoder = LegacyJSON()
+    print '%-12s %-11s %16s %16s %8s' % (
+        'case', 'backend', 'generic (ms)', 'cached (ms)', 'speedup'
+    )
+    for name, data in CASES:
+        legacy = Timer(lambda: legacy_encoder.encode(data)).timeit(iterations)
+        for backend in backends():
+            encoder = make_encoder(backend)
+            # simplejson encodes Decimals as they are, json as floats
+            assert loads(encoder.encode(data)) == loads(legacy_encoder.encode(data))
+            cached = Timer(lambda: encoder.encode(data)).timeit(iterations)
+            print '%-12s %-11s %16.3f %16.3f %7.1fx' % (
+                name,
+                backend,
+                legacy / iterations * 1e3,
+                cached / iterations * 1e3,
+                legacy / cached
+            )
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
@@ -0,0 +1,65 @@
+"""
+Cost of reading request attributes through the ``request`` proxy, comparing
+the original ``threading.local`` backed ``ObjectProxy`` with the current one,
+and with reading the object off of ``state`` directly.
+
+Usage::
+
+    python benchmarks/proxy.py [iterations]
+"""
+from threading import local
+from timeit import Timer
+
+from webob import Request
+
+from pecan.core import proxy, state
+
+import sys
+
+
+legacy_state = local()
+
+
+def legacy_proxy(key):
+    # the proxy Pecan used before attributes were compiled onto the class
+    class ObjectProxy(object):
+        def __getattr__(self, attr):
+            obj = getattr(legacy_state, key)
+            return getattr(obj, attr)
+        def __setattr__(self, attr, value):
+            obj = getattr(legacy_state, key)
+            return setattr(obj, attr, value)
+        def __delattr__(self, attr):
+            obj = getattr(legacy_state, key)
+            return delattr(obj, attr)
+    return ObjectProxy()
+
+
+def main(iterations=200000):
+    req = Request.blank('/')
+    req.pecan = dict(content_type=None)
+    legacy_state.request = state.request = req
+
+    legacy = legacy_proxy('request')
+    current = proxy('request')
+
+    print '%-8s %12s %12s %12s' % ('attr', 'legacy (us)', 'proxy (us)', 'direct (us)')
+    for attr in ('method', 'pecan', 'path'):
+        timings = [
+            min(Timer(lambda: getattr(target, attr)).repeat(3, iterations))
+            for target in (legacy, current)
+        ]
+        timings.append(min(
+            Timer(lambda: getattr(state.request, attr)).repeat(3, iterations)
+        ))
+        print '%-8s %12.3f %12.3f %12.3f' % tuple(
+            [attr] + [t / iterations * 1e6 for t in timings]
+        )
+    del state.request
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
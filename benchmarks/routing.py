@@ -0,0 +1,58 @@
+"""
+Per-depth routing cost for dynamic object dispatch (``lookup_controller``)
+versus the precompiled ``RouteTrie``.
+
+Usage::
+
+    python benchmarks/routing.py [iterations]
+"""
+from timeit import Timer
+
+from pecan import expose
+from pecan.routing import lookup_controller, RouteTrie
+
+import sys
+
+
+class LeafController(object):
+    @expose()
+    def index(self):
+        return 'index'
+
+    @expose()
+    def leaf(self):
+        return 'leaf'
+
+
+def make_tree(depth):
+    node = LeafController()
+    for i in range(depth - 1):
+        parent = LeafController()
+        parent.sub = node
+        node = parent
+    return node
+
+
+def main(iterations=20000):
+    print '%-6s %14s %14s %8s' % ('depth', 'dynamic (us)', 'trie (us)', 'speedup')
+    for depth in range(1, 9):
+        root = make_tree(depth)
+        trie = RouteTrie(root)
+        path = ['sub'] * (depth - 1) + ['leaf']
+        assert lookup_controller(root, path) == trie.lookup(path)
+
+        dynamic = Timer(lambda: lookup_controller(root, path)).timeit(iterations)
+        compiled = Timer(lambda: trie.lookup(path)).timeit(iterations)
+        print '%-6d %14.2f %14.2f %7.1fx' % (
+            depth,
+            dynamic / iterations * 1e6,
+            compiled / iterations * 1e6,
+            dynamic / compiled
+        )
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
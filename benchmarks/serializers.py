@@ -0,0 +1,78 @@
+"""
+Cost of encoding lists of SQLAlchemy mapped objects and of objects with a
+``__json__`` method, filtering each object's ``__dict__`` and dispatching
+on every object (as ``pecan.jsonify`` used to) versus the serializers
+compiled per class.
+
+Mapped objects are simulated (SQLAlchemy isn't needed): the class carries a
+``_sa_class_manager`` of its attribute names, and each object an
+``_sa_instance_state``, as mapped classes and objects do.
+
+Usage::
+
+    python benchmarks/serializers.py [iterations]
+"""
+from timeit import Timer
+
+from pecan.jsonify import jsonify, make_encoder, GenericJSON
+
+import sys
+
+
+class LegacyJSON(GenericJSON):
+    # the encoder of pecan.jsonify.encode before the dispatch cache
+    def default(self, obj):
+        return jsonify(obj)
+
+
+COLUMNS = ['id', 'first_name', 'last_name', 'email', 'created', 'active']
+
+
+class User(object):
+    _sa_class_manager = dict((name, None) for name in COLUMNS + ['addresses'])
+
+    def __init__(self, i):
+        self._sa_instance_state = object()
+        self.id = i
+        self.first_name = 'First %d' % i
+        self.last_name = 'Last %d' % i
+        self.email = 'user%d@example.com' % i
+        self.created = '2012-01-01'
+        self.active = True
+
+
+class Point(object):
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+    def __json__(self):
+        return dict(x=self.x, y=self.y)
+
+
+def main(iterations=20):
+    legacy_encoder = LegacyJSON()
+    encoder = make_encoder()
+    print '%-14s %8s %16s %16s %8s' % (
+        'objects', 'count', 'legacy (ms)', 'compiled (ms)', 'speedup'
+    )
+    for name, factory in (('mapped', User), ('__json__', lambda i: Point(i, i))):
+        for count in (100, 1000, 10000):
+            data = [factory(i) for i in range(count)]
+            assert encoder.encode(data) == legacy_encoder.encode(data)
+            legacy = Timer(lambda: legacy_encoder.encode(data)).timeit(iterations)
+            compiled = Timer(lambda: encoder.encode(data)).timeit(iterations)
+            print '%-14s %8d %16.3f %16.3f %7.1fx' % (
+                name,
+                count,
+                legacy / iterations * 1e3,
+                compiled / iterations * 1e3,
+                legacy / compiled
+            )
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
@@ -0,0 +1,61 @@
+"""
+Cold-start cost of the first render of the project template's
+``index.html`` (which inherits from ``layout.html``), compiling the
+templates in memory versus loading modules precompiled by
+``pecan compile-templates``.
+
+Usage::
+
+    python benchmarks/templates.py [iterations]
+"""
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import time
+
+from pecan.templating import ExtraNamespace, MakoRenderer
+
+import os
+import sys
+
+
+TEMPLATE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'pecan', 'templates', 'project', '+package+', 'templates'
+)
+
+NAMESPACE = dict(
+    errors={}, name='', age='', error_for=lambda field: ''
+)
+
+
+def first_render(cache_dir):
+    # a new renderer has no templates loaded, as in a freshly started worker
+    renderer = MakoRenderer(TEMPLATE_PATH, ExtraNamespace(), cache_dir)
+    start = time()
+    renderer.render('index.html', dict(NAMESPACE))
+    return time() - start
+
+
+def main(iterations=50):
+    cache_dir = mkdtemp()
+    try:
+        renderer = MakoRenderer(TEMPLATE_PATH, ExtraNamespace(), cache_dir)
+        for name in ('layout.html', 'index.html'):
+            renderer.compile(name)
+
+        cold = sum([first_render(None) for i in range(iterations)])
+        cached = sum([first_render(cache_dir) for i in range(iterations)])
+    finally:
+        rmtree(cache_dir)
+
+    print '%-12s %12s' % ('templates', 'first render (ms)')
+    print '%-12s %12.2f' % ('in memory', cold / iterations * 1e3)
+    print '%-12s %12.2f' % ('precompiled', cached / iterations * 1e3)
+    print '%-12s %11.1fx' % ('speedup', cold / cached)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
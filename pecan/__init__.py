@@ -8,6 +8,7 @@ from paste.urlparser import StaticURLParser
 from weberror.errormiddleware import ErrorMiddleware
 from weberror.evalexception import EvalException
 
+from compression import CompressionMiddleware
 from core import abort, error_for, override_template, Pecan, redirect, render, request, response, ValidationException
 from decorators import expose
 from templating import error_formatters
@@ -35,4 +36,7 @@ def make_app(root, static_root=None, debug=False, errorcfg={}, wrap_app=None, **
     app = make_errordocument(app, conf, **conf.app.errors)
     if static_root:
         app = Cascade([StaticURLParser(static_root), app])
+    compression = dict(getattr(conf.app, 'compression', {}))
+    if compression.pop('enabled', False):
+        app = CompressionMiddleware(app, **compression)
     return app
@@ -0,0 +1,232 @@
+'''
+Caching of whole responses, for controllers decorated with
+``pecan.decorators.cache``.
+'''
+from hashlib import sha1
+from threading import Lock
+from time import time
+
+from util import LRUCache, SingleFlight
+
+__all__ = ['CacheBackend', 'MemoryBackend', 'ResponseCache']
+
+
+class CacheBackend(object):
+    '''
+    The interface of the storage behind a ``ResponseCache``. Keys are
+    strings, and values are tuples of plain data (numbers, strings and lists
+    of them), so a backend storing them out of process (e.g. in memcached)
+    only needs to be able to pickle them.
+    '''
+
+    def get(self, key):
+        '''
+        Returns the value stored under ``key``, or ``None`` if there is
+        none (or it has expired).
+        '''
+        raise NotImplementedError
+
+    def set(self, key, value, ttl):
+        '''
+        Stores ``value`` under ``key`` for ``ttl`` seconds.
+        '''
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class MemoryBackend(CacheBackend):
+    '''
+    Keeps values in memory, evicting the least recently used one once
+    ``maxsize`` of them are stored.
+
+    :param maxsize: The maximum number of values to keep.
+    '''
+
+    def __init__(self, maxsize=128):
+        self._cache = LRUCache(maxsize)
+
+    def get(self, key):
+        cached = self._cache.get(key)
+        if cached is not None and cached[0] > time():
+            return cached[1]
+        return None
+
+    def set(self, key, value, ttl):
+        self._cache.set(key, (time() + ttl, value))
+
+    def delete(self, key):
+        self._cache.delete(key)
+
+    def clear(self):
+        self._cache.clear()
+
+    def __len__(self):
+        return len(self._cache)
+
+
+class ResponseCache(object):
+    '''
+    Caches the status, headers and body of the responses of a controller.
+    Responses are keyed by the path of the request and its content type
+    (which may have been picked by the extension of the path), the values
+    of ``params`` (or of the whole query string, if it is ``None``) and the
+    values of ``headers``.
+
+    Only ``200 OK`` responses to ``GET`` requests are stored, and never ones
+    which set a cookie, are streamed, or show validation errors. Headers
+    set before the response was looked up (e.g. by ``before`` hooks) are
+    left out, since they belong to the request which computed it.
+
+    Concurrent requests for a response which isn't cached wait for the
+    first of them to compute it (for ``timeout`` seconds at most, after
+    which they compute it themselves), unless ``coalesce`` is False. With
+    ``stale``, an expired response keeps being served for that many more
+    seconds to all but one request, which computes it again before
+    responding.
+
+    :param ttl: The number of seconds to keep a response for.
+    :param params: The names of the query parameters the response depends
+                   on, or ``None`` if it depends on all of them.
+    :param headers: The names of the request headers the response depends on.
+    :param backend: The ``CacheBackend`` to store responses in. Defaults to
+                    a ``MemoryBackend`` of ``maxsize`` responses.
+    :param maxsize: The maximum number of responses kept by the default
+                    backend.
+    :param stale: The number of seconds past its ``ttl`` an expired
+                  response may still be served for.
+    :param coalesce: A boolean indicating if concurrent requests for the
+                     same response should wait for the first of them to
+                     compute it.
+    :param timeout: The number of seconds a request waits for another one
+                    computing the response, at most.
+    '''
+
+    def __init__(self, ttl=60, params=None, headers=(), backend=None, maxsize=128,
+                 stale=0, coalesce=True, timeout=10):
+        if backend is None:
+            backend = MemoryBackend(maxsize)
+        self.ttl = ttl
+        self.params = params
+        self.headers = tuple(headers)
+        self.backend = backend
+        self.stale = stale
+        self.flights = None
+        if coalesce:
+            self.flights = SingleFlight(timeout)
+        self.hits = 0
+        self.misses = 0
+        self._lock = Lock()
+
+    def key(self, request):
+        '''
+        Returns the key to cache the response to ``request`` under.
+        '''
+
+        if self.params is None:
+            params = sorted(request.GET.items())
+        else:
+            params = [(name, request.GET.getall(name)) for name in self.params]
+        headers = [request.headers.get(name) for name in self.headers]
+        parts = (
+            request.script_name,
+            request.path_info,
+            request.pecan['content_type'],
+            params,
+            headers
+        )
+        return 'pecan.response:' + sha1(repr(parts)).hexdigest()
+
+    def restore(self, key, request, response):
+        '''
+        Fills in ``response`` from the cache, returning True if a response
+        was cached under ``key``. Otherwise, ``request`` may be made the one
+        computing the response for concurrent requests, which is recorded
+        as ``request.pecan['cache_flight']``; ``release`` must then be
+        called once it is done.
+        '''
+
+        # the headers set so far belong to this request, rather than to
+        # the response to cache
+        request.pecan['cache_baseline'] = list(response.headerlist)
+
+        leading = False
+        cached = self.backend.get(key)
+        if cached is None and self.flights is not None:
+            leading = self.flights.acquire(key)
+            if not leading:
+                # another request has computed it meanwhile (unless the
+                # wait timed out)
+                cached = self.backend.get(key)
+        if cached is not None:
+            expires, status, headerlist, body = cached
+            fresh = expires > time()
+            if not fresh and self.flights is not None:
+                # serve the stale response while a single request computes
+                # it again
+                leading = self.flights.acquire(key, wait=False)
+            if fresh or (self.flights is not None and not leading):
+                self.count(hit=True)
+                response.status = status
+                names = set([name.lower() for name, value in headerlist])
+                response.headerlist[:] = [
+                    (name, value) for name, value in response.headerlist
+                    if name.lower() not in names
+                ] + list(headerlist)
+                response.body = body
+                response.conditional_response = True
+                return True
+        if leading:
+            request.pecan['cache_flight'] = (self, key)
+        self.count(hit=False)
+        return False
+
+    def count(self, hit):
+        self._lock.acquire()
+        try:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        finally:
+            self._lock.release()
+
+    def release(self, key):
+        '''
+        Lets the requests waiting for the response cached under ``key`` go
+        on.
+        '''
+
+        if self.flights is not None:
+            self.flights.release(key)
+
+    def store(self, key, request, response):
+        '''
+        Caches ``response`` under ``key``, if it can be.
+        '''
+
+        if request.method != 'GET' or response.status_int != 200:
+            return
+        if request.pecan.get('streaming') or request.pecan['validation_errors']:
+            return
+        baseline = list(request.pecan.get('cache_baseline', ()))
+        headerlist = []
+        for name, value in response.headerlist:
+            if name.lower() == 'set-cookie':
+                return
+            if (name, value) in baseline:
+                baseline.remove((name, value))
+            elif name.lower() != 'content-length':
+                headerlist.append((name, value))
+        self.backend.set(
+            key,
+            (time() + self.ttl, response.status, headerlist, response.body),
+            self.ttl + self.stale
+        )
+
+    def clear(self):
+        self.backend.clear()
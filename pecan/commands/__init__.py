@@ -5,3 +5,4 @@ from runner import CommandRunner
 from create import CreateCommand
 from shell import ShellCommand
 from serve import ServeCommand
+from compile import CompileTemplatesCommand
@@ -0,0 +1,77 @@
+"""
+PasteScript template compilation command for Pecan.
+"""
+from paste.script import command as paste_command
+
+from pecan.templating import RendererFactory, TemplateIndex
+
+from base import Command
+
+
+class CompileTemplatesCommand(Command):
+    """
+    Compile the templates of a Pecan application ahead of time.
+    
+    This command walks the application's template_path (one or more 
+    directories) and compiles every template with each of the given 
+    rendering engines (by default, those which can cache compiled templates 
+    on disk: mako and jinja), writing the results to the template_cache 
+    directory. Templates which can't be compiled by an engine (e.g. a Jinja 
+    template, for mako) are skipped.
+    """
+    
+    # command information
+    usage = 'CONFIG_NAME'
+    summary = __doc__.strip().splitlines()[0].rstrip('.')
+    description = '\n'.join(map(lambda s: s.rstrip(), __doc__.strip().splitlines()[2:]))
+    
+    # command options/arguments
+    min_args = 1
+    max_args = 1
+    
+    # command parser
+    parser = paste_command.Command.standard_parser(verbose=True)
+    parser.add_option('-d', '--directory',
+                      dest='directory',
+                      help='The directory to write compiled templates to (defaults to app.template_cache)')
+    parser.add_option('-e', '--engine',
+                      action='append',
+                      dest='engines',
+                      help='A rendering engine to compile templates with (may be given more than once)')
+    
+    def command(self):
+        
+        # load the configuration
+        config = self.load_configuration(self.args[0])
+        template_path = config.app.template_path
+        cache_dir = self.options.directory or config.app.template_cache
+        if not cache_dir:
+            raise paste_command.BadCommand(
+                'No template cache directory; set app.template_cache or use --directory'
+            )
+        
+        renderers = RendererFactory(cache_dir=cache_dir)
+        engines = self.options.engines or ['mako', 'jinja']
+        
+        for engine in engines:
+            renderer = renderers.get(engine, template_path)
+            if not hasattr(renderer, 'compile'):
+                print 'Skipping %s, which does not support compilation' % engine
+                continue
+            
+            compiled = 0
+            for name in self.find_templates(template_path):
+                try:
+                    renderer.compile(name)
+                except Exception, e:
+                    if self.verbose:
+                        print 'Skipping %s for %s: %s' % (name, engine, e)
+                else:
+                    compiled += 1
+            print 'Compiled %d %s template(s) into %s' % (compiled, engine, cache_dir)
+    
+    def find_templates(self, template_path):
+        for name in sorted(TemplateIndex(template_path).templates):
+            if name.rsplit('/', 1)[-1].startswith('.') or name.endswith(('.pyc', '.py')):
+                continue
+            yield name
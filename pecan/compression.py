@@ -0,0 +1,194 @@
+'''
+WSGI middleware compressing responses with ``gzip`` or ``deflate``, which
+``make_app`` adds when ``compression`` is enabled in the application's
+configuration.
+'''
+from util import ClosingIterator
+
+import zlib
+
+__all__ = ['CompressionMiddleware']
+
+
+DEFAULT_CONTENT_TYPES = (
+    'text/html', 'text/plain', 'text/css', 'text/xml', 'text/javascript',
+    'application/json', 'application/javascript', 'application/xml'
+)
+
+
+def negotiate(accept_encoding):
+    '''
+    Returns the encoding (``gzip`` or ``deflate``) to compress a response
+    with, given the ``Accept-Encoding`` header of the request, or ``None``.
+    '''
+
+    accepted = {}
+    for coding in accept_encoding.lower().split(','):
+        parts = coding.split(';')
+        name = parts[0].strip()
+        quality = 1.0
+        for param in parts[1:]:
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[name] = quality
+    best, best_quality = None, 0.0
+    for name in ('gzip', 'deflate'):
+        quality = accepted.get(name, accepted.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = name, quality
+    return best
+
+
+def compressobj(encoding, level):
+    if encoding == 'gzip':
+        # a gzip header and trailer around the deflate stream
+        return zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return zlib.compressobj(level)
+
+
+class CompressionMiddleware(object):
+    '''
+    Compresses responses whose content type is in ``content_types`` with
+    ``gzip`` or ``deflate``, as negotiated with the ``Accept-Encoding``
+    header of the request, using ``zlib``.
+
+    Responses are compressed as the server iterates over them, so streamed
+    responses stay streamed (each chunk is flushed to the client as it is
+    compressed). Responses whose ``Content-Length`` is under ``min_size``
+    are sent as they are, as are responses which are already encoded or
+    ask not to be transformed. ``HEAD`` requests and ``304 Not Modified``
+    responses get the headers of the compressed response they stand for.
+
+    :param app: The WSGI application to wrap.
+    :param min_size: The smallest response, in bytes, worth compressing.
+    :param level: The ``zlib`` compression level, from 1 (fastest) to 9 (smallest).
+    :param content_types: The content types (without parameters) to compress.
+    '''
+
+    def __init__(self, app, min_size=500, level=6, content_types=DEFAULT_CONTENT_TYPES):
+        self.app = app
+        self.min_size = min_size
+        self.level = level
+        self.content_types = frozenset(content_types)
+
+    def __call__(self, environ, start_response):
+        encoding = negotiate(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        # the response to a HEAD request has the headers of the compressed
+        # response, but no body to compress
+        head = environ.get('REQUEST_METHOD') == 'HEAD'
+
+        # the response is compressed once the application has started it,
+        # and its headers show it should be
+        started = {}
+        def start_compressed_response(status, headers, exc_info=None):
+            # a response of unknown length is streamed, so each chunk has
+            # to be flushed to the client as it comes
+            started['streamed'] = 'content-length' not in [
+                name.lower() for name, value in headers
+            ]
+            compressor = self.compressor(status, headers, encoding)
+            if head:
+                compressor = None
+            started['compressor'] = compressor
+            write = start_response(status, headers, exc_info)
+            if compressor is None:
+                return write
+            def write_compressed(data):
+                write(compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH))
+            return write_compressed
+
+        app_iter = self.app(environ, start_compressed_response)
+        if started.get('compressor', True) is None:
+            return app_iter
+        return ClosingIterator(
+            self.compress(app_iter, started),
+            getattr(app_iter, 'close', lambda: None)
+        )
+
+    def compressor(self, status, headers, encoding):
+        '''
+        Returns a compressor for a response with the given ``status`` and
+        ``headers`` (updating them to match), or ``None`` if the response
+        shouldn't be compressed.
+        '''
+
+        if status.startswith('304'):
+            # a 304 has no content type or length to go by, but has to
+            # carry the Vary and ETag headers of the response it stands for
+            if encoding is not None:
+                self.vary(headers)
+                self.weaken_etag(headers)
+            return None
+        if not status.startswith('200'):
+            return None
+
+        values = {}
+        for name, value in headers:
+            values[name.lower()] = value
+        content_type = values.get('content-type', '').split(';')[0].strip().lower()
+        if content_type not in self.content_types:
+            return None
+        if 'content-encoding' in values or \
+                'no-transform' in values.get('cache-control', '').lower():
+            return None
+        length = values.get('content-length')
+        if length is not None and length.isdigit() and int(length) < self.min_size:
+            return None
+
+        # the response depends on Accept-Encoding, even if it isn't
+        # compressed this time
+        self.vary(headers)
+        if encoding is None:
+            return None
+
+        self.set_header(headers, 'Content-Length', None)
+        headers.append(('Content-Encoding', encoding))
+        self.weaken_etag(headers)
+
+        return compressobj(encoding, self.level)
+
+    def vary(self, headers):
+        for name, vary in headers:
+            if name.lower() == 'vary':
+                if 'accept-encoding' not in vary.lower() and vary.strip() != '*':
+                    self.set_header(headers, 'Vary', vary + ', Accept-Encoding')
+                return
+        headers.append(('Vary', 'Accept-Encoding'))
+
+    def weaken_etag(self, headers):
+        # the compressed body is only semantically equivalent to the
+        # original, so a strong ETag becomes weak
+        for name, etag in headers:
+            if name.lower() == 'etag':
+                if not etag.startswith('W/'):
+                    self.set_header(headers, 'ETag', 'W/' + etag)
+                return
+
+    def set_header(self, headers, name, value):
+        headers[:] = [
+            (n, v) for n, v in headers if n.lower() != name.lower()
+        ]
+        if value is not None:
+            headers.append((name, value))
+
+    def compress(self, app_iter, started):
+        compressor = None
+        for chunk in app_iter:
+            if compressor is None:
+                compressor = started.get('compressor')
+                if compressor is None:
+                    yield chunk
+                    continue
+            data = compressor.compress(chunk)
+            if started['streamed']:
+                data += compressor.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        if compressor is None:
+            compressor = started.get('compressor')
+        if compressor is not None:
+            yield compressor.flush()
@@ -1,9 +1,13 @@
-from templating         import RendererFactory
-from routing            import lookup_controller, NonCanonicalPath
-from util               import _cfg, splitext
+import formfill
+from templating         import LayeredNamespace, RendererFactory
+from decorators         import ArgBinder
+from hooks              import HookPipeline, signature as hooks_signature
+from routing            import _lookup_controller, NonCanonicalPath, NotFound, RouteTrie
+from util               import _cfg, splitext, LRUCache, ClosingIterator
 
 from webob              import Request, Response, exc
 from threading          import local
+from types              import GeneratorType
 from itertools          import chain
 from mimetypes          import guess_type
 from formencode         import htmlfill, Invalid, variabledecode
@@ -16,16 +20,103 @@ except ImportError: # pragma: no cover
     from json import loads
 
 import os
+import sys
 
 
-state = local()
+class ContextLocal(object):
+    '''
+    A replacement for ``threading.local`` which is local to the current
+    greenlet, so that concurrent requests served by greenlets on the same
+    thread each see their own state. Attributes are stored on the greenlet
+    itself, so they go away along with it.
+    
+    Reading an attribute costs several times as much as it does on a
+    ``threading.local``, so it is only used for the request state when
+    greenlets are in use and ``threading.local`` can't tell them apart
+    (see ``greenlets_in_use``).
+    '''
+    
+    __slots__ = ('_key',)
+    
+    def __init__(self):
+        object.__setattr__(self, '_key', '_pecan_context_%x' % id(self))
+    
+    def __getattribute__(self, attr):
+        # overridden entirely (rather than through ``__getattr__``) so that
+        # the common case is a pair of dictionary lookups
+        try:
+            return getcurrent().__dict__[_context_key(self)][attr]
+        except KeyError:
+            if attr == '__dict__':
+                return _context(self)
+            if attr.startswith('__'):
+                return object.__getattribute__(self, attr)
+            raise AttributeError(attr)
+    
+    def __setattr__(self, attr, value):
+        _context(self)[attr] = value
+    
+    def __delattr__(self, attr):
+        try:
+            del _context(self)[attr]
+        except KeyError:
+            raise AttributeError(attr)
+
+
+_context_key = ContextLocal._key.__get__
+
+
+def _context(local):
+    # the attributes of ``local`` for the current greenlet
+    return getcurrent().__dict__.setdefault(_context_key(local), {})
+
+
+def greenlets_in_use():
+    '''
+    Returns True if greenlets had been imported before Pecan was, and
+    ``threading.local`` is still the native one, which is shared by all of
+    the greenlets of a thread. Servers which monkey patch ``threading``
+    (as gevent and eventlet do) make ``threading.local`` greenlet local
+    already.
+    '''
+    
+    return 'greenlet' in sys.modules and \
+        local.__module__ in ('thread', '_thread', '_threading_local')
+
+
+# checked before importing greenlet below, which would otherwise count
+if greenlets_in_use():
+    state = ContextLocal()
+else:
+    state = local()
+
+try:
+    from greenlet import getcurrent
+except ImportError:
+    pass
 
 
 def proxy(key):
+    '''
+    Creates a proxy to the object stored as ``key`` on the request
+    ``state``. The first time an attribute is read through the proxy, a
+    property for it is added to the proxy's class, so later reads of that
+    attribute skip the ``__getattr__`` fallback.
+    '''
+    
+    def compile_attribute(attr):
+        def get(self):
+            return getattr(getattr(state, key), attr)
+        return property(get)
+    
     class ObjectProxy(object):
+        __slots__ = ()
         def __getattr__(self, attr):
             obj = getattr(state, key)
-            return getattr(obj, attr)
+            value = getattr(obj, attr)
+            if not attr.startswith('__'):
+                setattr(ObjectProxy, attr, compile_attribute(attr))
+            return value
         def __setattr__(self, attr, value):
             obj = getattr(state, key)
             return setattr(obj, attr, value)
@@ -116,6 +207,27 @@ def static(name, value):
     return value
 
 
+def fragment(name, render, *args, **kwargs):
+    '''
+    A convenience function for caching a named fragment of a template in
+    the application's render cache. Returns the output of calling
+    ``render(*args, **kwargs)``, which is cached under ``name`` when the
+    application has a render cache.
+    
+    :param name: The name to cache the fragment under.
+    :param render: A callable which renders the fragment.
+    '''
+    
+    cache = state.app.render_cache
+    if cache is None:
+        return render(*args, **kwargs)
+    return cache.fragment(name, render, *args, **kwargs)
+
+
+# helpers available to every template, under the controller's namespace
+template_helpers = dict(error_for=error_for, static=static, fragment=fragment)
+
+
 def render(template, namespace):
     '''
     Render the specified template using the Pecan rendering framework
@@ -129,6 +241,63 @@ def render(template, namespace):
     return state.app.render(template, namespace)
 
 
+def encode_chunks(chunks, response):
+    '''
+    Encodes any unicode chunks of a streamed body using the charset of
+    the response, as they are generated.
+    
+    :param chunks: An iterable of ``str`` or ``unicode`` chunks.
+    :param response: The response the chunks are the body of.
+    '''
+    
+    for chunk in chunks:
+        if isinstance(chunk, unicode):
+            chunk = chunk.encode(response.charset or 'utf-8')
+        yield chunk
+
+
+class RequestContext(dict):
+    '''
+    The ``request.pecan`` dictionary, which parses the ``JSON`` body of the
+    request the first time ``request.pecan['json']`` is looked up, so that
+    validation, hooks and controllers share a single parse.
+    
+    :param max_json_size: The largest body, in bytes, which will be parsed as ``JSON``. Larger bodies are rejected with a ``413 Request Entity Too Large`` before being read (or, for chunked bodies of unknown length, once the limit is passed). Bodies which aren't valid ``JSON`` are rejected with a ``400 Bad Request``.
+    '''
+    
+    def __init__(self, max_json_size=None, **kwargs):
+        dict.__init__(self, **kwargs)
+        self.max_json_size = max_json_size
+    
+    def __missing__(self, key):
+        if key != 'json':
+            raise KeyError(key)
+        req = state.request
+        limit = self.max_json_size
+        if limit is not None and req.content_length is None:
+            if req.environ.get('wsgi.input_terminated') or \
+                    req.environ.get('HTTP_TRANSFER_ENCODING', '').lower() == 'chunked':
+                # a body of unknown length is only read up to the limit, and
+                # put back for anything reading it later
+                body = req.body_file.read(limit + 1)
+                if len(body) > limit:
+                    raise exc.HTTPRequestEntityTooLarge()
+                req.body = body
+            else:
+                # without a length or chunked encoding there is no body, and
+                # the input may never end
+                body = ''
+        else:
+            if limit is not None and req.content_length > limit:
+                raise exc.HTTPRequestEntityTooLarge()
+            body = req.body
+        try:
+            self['json'] = loads(body)
+        except ValueError:
+            raise exc.HTTPBadRequest('The request body is not valid JSON.')
+        return self['json']
+
+
 class ValidationException(ForwardRequestException):
     '''
     This exception is raised when a validation error occurs using Pecan's
@@ -166,26 +335,56 @@ class Pecan(object):
                  hooks               = [],
                  custom_renderers    = {},
                  extra_template_vars = {},
-                 force_canonical     = True
+                 force_canonical     = True,
+                 precompile_routes   = False,
+                 route_cache_size    = 0,
+                 template_cache      = None,
+                 template_reload     = True,
+                 render_cache        = None,
+                 template_index      = False,
+                 json_backend        = None,
+                 max_json_size       = None,
+                 etag                = False
                  ):
         '''
         Creates a Pecan application instance, which is a WSGI application.
         
         :param root: The root controller object.
         :param default_renderer: The default rendering engine to use. Defaults to mako.
-        :param template_path: The default relative path to use for templates. Defaults to 'templates'.
+        :param template_path: The default relative path to use for templates, or a list of paths to search in order. Defaults to 'templates'.
         :param hooks: A list of Pecan hook objects to use for this application.
         :param custom_renderers: Custom renderer objects, as a dictionary keyed by engine name.
         :param extra_template_vars: Any variables to inject into the template namespace automatically.
         :param force_canonical: A boolean indicating if this project should require canonical URLs.
+        :param precompile_routes: A boolean indicating if the static part of the controller tree should be compiled into a routing trie up front. Assumes the controller tree does not change at runtime.
+        :param route_cache_size: The number of resolved routes to keep in an LRU cache, keyed by HTTP method and path. Routes which go through ``_lookup``, ``_route`` or secured controllers are never cached. Defaults to 0, which disables the cache.
+        :param template_cache: A directory for renderers to cache compiled templates in (see ``pecan compile-templates``). Defaults to None, which compiles templates in memory on first use.
+        :param template_reload: How often renderers check templates for changes: True to check on every render, False to never check once loaded, or a number of seconds to check at most that often. Defaults to True.
+        :param render_cache: An optional ``pecan.templating.RenderCache`` to cache rendered templates (and fragments of them) in.
+        :param template_index: A boolean indicating if an index of the templates in ``template_path`` should be built at startup, so that renderers find templates without searching each directory. Templates added later are still found by searching.
+        :param json_backend: The name of the module the ``json`` renderer encodes with, e.g. ``json`` for the standard library or ``simplejson``. Defaults to ``simplejson`` if it is installed, ``json`` otherwise.
+        :param max_json_size: The largest request body, in bytes, which will be parsed as ``JSON`` (see ``request.pecan['json']``). Larger bodies are rejected with a ``413`` response without being read. Defaults to None, which sets no limit.
+        :param etag: A boolean indicating if GET responses should be given an ``ETag`` computed from their body, so that requests which already have it are answered with ``304 Not Modified``. Controllers can override this with the ``etag`` argument of ``expose``.
         '''
 
         self.root             = root
-        self.renderers        = RendererFactory(custom_renderers, extra_template_vars)
+        self.renderers        = RendererFactory(custom_renderers, extra_template_vars, template_cache, template_reload, template_index, json_backend)
         self.default_renderer = default_renderer
         self.hooks            = hooks
+        self.hook_pipelines   = {}
         self.template_path    = template_path
+        if template_index:
+            self.renderers.index(template_path)
         self.force_canonical  = force_canonical
+        self.route_trie       = None
+        if precompile_routes:
+            self.route_trie = RouteTrie(root)
+        self.route_cache      = None
+        if route_cache_size:
+            self.route_cache = LRUCache(route_cache_size)
+        self.render_cache     = render_cache
+        self.max_json_size    = max_json_size
+        self.etag             = etag
         
     def route(self, node, path):
         '''
@@ -195,20 +394,42 @@ class Pecan(object):
         :param path: The path to look up on this node.
         '''
         
+        req = state.request
+        trace = None
+        if self.route_cache is not None and node is self.root:
+            key = (req.method, path)
+            cached = self.route_cache.get(key)
+            if cached is not None:
+                return cached[0], list(cached[1])
+            trace = []
+
         path = path.split('/')[1:]
         try:
-            node, remainder = lookup_controller(node, path)
-            return node, remainder
+            if self.route_trie is not None and node is self.root:
+                result = self.route_trie.lookup(path, trace)
+            else:
+                result = _lookup_controller(node, path, trace)
         except NonCanonicalPath, e:
-            if self.force_canonical and not _cfg(e.controller).get('accept_noncanonical', False):
-                if request.method == 'POST':
+            result = e
+
+        # routing reports misses with sentinels; build the HTTP exception here
+        if result is NotFound:
+            raise exc.HTTPNotFound
+        if isinstance(result, NonCanonicalPath):
+            if self.force_canonical and not _cfg(result.controller).get('accept_noncanonical', False):
+                if req.method == 'POST':
                     raise RuntimeError, "You have POSTed to a URL '%s' which '\
                         'requires a slash. Most browsers will not maintain '\
                         'POST data when redirected. Please update your code '\
                         'to POST to '%s/' or set force_canonical to False" % \
-                        (request.pecan['routing_path'], request.pecan['routing_path'])
+                        (req.pecan['routing_path'], req.pecan['routing_path'])
                 raise exc.HTTPFound(add_slash=True)
-            return e.controller, e.remainder
+            return result.controller, result.remainder
+
+        # only cache routes which depend on nothing but the path
+        if trace == []:
+            self.route_cache.set(key, (result[0], tuple(result[1])))
+        return result
     
     def determine_hooks(self, controller=None):
         '''
@@ -217,15 +438,20 @@ class Pecan(object):
         :param controller: If specified, includes hooks for a specific controller.
         '''
         
-        controller_hooks = []
+        controller_hooks = ()
         if controller:
-            controller_hooks = _cfg(controller).get('hooks', [])
-        return list(
-            sorted(
-                chain(controller_hooks, self.hooks), 
-                lambda x,y: cmp(x.priority, y.priority)
-            )
-        )
+            controller_hooks = _cfg(controller).get('hooks', ())
+        
+        # pipelines are cached per controller function, and rebuilt if the
+        # hooks (including in place changes to ``self.hooks``) or their
+        # priorities have changed since
+        key = getattr(controller, 'im_func', controller)
+        hooks = tuple(chain(controller_hooks, self.hooks))
+        pipeline = self.hook_pipelines.get(key)
+        if pipeline is None or pipeline.signature != hooks_signature(hooks):
+            pipeline = HookPipeline(hooks)
+            self.hook_pipelines[key] = pipeline
+        return pipeline
     
     def handle_hooks(self, hook_type, *args):
         '''
@@ -235,6 +461,11 @@ class Pecan(object):
         :param *args: Arguments to pass to the hooks.
         '''
         
+        if isinstance(state.hooks, HookPipeline):
+            for hook in getattr(state.hooks, hook_type):
+                hook(*args)
+            return
+        
         if hook_type in ['before', 'on_route']:
             hooks = state.hooks
         else:
@@ -243,70 +474,58 @@ class Pecan(object):
         for hook in hooks:
              getattr(hook, hook_type)(*args)
 
-    def get_args(self, all_params, remainder, argspec, im_self):
+    def get_args(self, all_params, remainder, argspec, im_self, binder=None):
         '''
         Determines the arguments for a controller based upon parameters
         passed the argument specification for the controller.
+
+        :param binder: The ``ArgBinder`` compiled by ``expose`` for the controller. Compiled from ``argspec`` if not specified.
         '''
         
-        args = []
-        kwargs = dict()
-        valid_args = argspec[0][1:]
-        
-        if im_self is not None:
-            args.append(im_self)
+        if binder is None:
+            binder = ArgBinder(argspec)
         
         # grab the routing args from nested REST controllers
-        if 'routing_args' in request.pecan:
-            remainder = request.pecan['routing_args'] + list(remainder)
-            del request.pecan['routing_args']
-        
-        # handle positional arguments
-        if valid_args and remainder:
-            args.extend(remainder[:len(valid_args)])
-            remainder = remainder[len(valid_args):]
-            valid_args = valid_args[len(args):]
-        
-        # handle wildcard arguments
-        if remainder:
-            if not argspec[1]:
-                abort(404)
-            args.extend(remainder)
-        
-        # get the default positional arguments
-        if argspec[3]:
-            defaults = dict(zip(argspec[0][-len(argspec[3]):], argspec[3]))
-        else:
-            defaults = dict()
-        
-        # handle positional GET/POST params
-        for name in valid_args:
-            if name in all_params:
-                args.append(all_params.pop(name))
-            elif name in defaults:
-                args.append(defaults[name])
-            else:
-                break
-        
-        # handle wildcard GET/POST params
-        if argspec[2]:
-            for name, value in all_params.iteritems():
-                if name not in argspec[0]:
-                    kwargs[name] = value
+        req = state.request
+        if 'routing_args' in req.pecan:
+            remainder = req.pecan.pop('routing_args') + list(remainder)
         
-        return args, kwargs
+        return binder.bind(all_params, remainder, im_self)
     
-    def render(self, template, namespace):
+    def render(self, template, namespace, stream=False):
+        '''
+        Renders a template with a namespace.
+        
+        :param template: The path to the template, optionally prefixed with the name of the rendering engine to use (e.g. ``jinja:index.html``).
+        :param namespace: The namespace to render the template with, as a dictionary.
+        :param stream: A boolean indicating if the template should be rendered as a generator of chunks, for renderers which support it.
+        '''
+        
+        name = template
         renderer = self.renderers.get(self.default_renderer, self.template_path)
         if template == 'json':
             renderer = self.renderers.get('json', self.template_path)
+            layered = namespace
         else:
-            namespace['error_for'] = error_for
-            namespace['static'] = static
+            layered = LayeredNamespace(namespace, template_helpers)
         if ':' in template:
             renderer = self.renderers.get(template.split(':')[0], self.template_path)
             template = template.split(':')[1]
-        return renderer.render(template, namespace)
+        if isinstance(layered, LayeredNamespace) and \
+                not getattr(renderer, 'layered_namespace', False):
+            # renderers which don't declare that they accept a
+            # ``LayeredNamespace`` are given a plain dict
+            layered = layered.flatten()
+        if stream and hasattr(renderer, 'stream'):
+            return renderer.stream(template, layered)
+        
+        # renders with validation errors depend on more than the namespace
+        req = getattr(state, 'request', None)
+        if self.render_cache is not None and not (req and req.pecan['validation_errors']):
+            return self.render_cache.render(
+                name, namespace, lambda: renderer.render(template, layered)
+            )
+        return renderer.render(template, layered)
     
     def validate(self, schema, params, json=False, error_handler=None, 
                  htmlfill=None, variable_decode=None):
@@ -322,10 +541,11 @@ class Pecan(object):
         :param variable_decode: Indicates whether or not to decode variables when using htmlfill.
         '''
         
+        req = state.request
         try:
             to_validate = params
             if json:
-                to_validate = loads(request.body)
+                to_validate = req.pecan['json']
             if variable_decode is not None:
                 to_validate = variabledecode.variable_decode(to_validate, **variable_decode)
             params = schema.to_python(to_validate)
@@ -334,7 +554,7 @@ class Pecan(object):
             if variable_decode is not None:
                 kwargs['encode_variables'] = True
                 kwargs.update(variable_decode)
-            request.pecan['validation_errors'] = e.unpack_errors(**kwargs)
+            req.pecan['validation_errors'] = e.unpack_errors(**kwargs)
             if error_handler is not None:
                 raise ValidationException()
         if json:
@@ -346,24 +566,27 @@ class Pecan(object):
         The main request handler for Pecan applications.
         '''
         
+        # resolve the request once, rather than through the proxy
+        req = state.request
+        
         # get a sorted list of hooks, by priority (no controller hooks yet)
         state.hooks = self.determine_hooks()
         
         # store the routing path to allow hooks to modify it
-        request.pecan['routing_path'] = request.path
+        req.pecan['routing_path'] = req.path
 
         # handle "on_route" hooks
         self.handle_hooks('on_route', state)
         
         # lookup the controller, respecting content-type as requested
         # by the file extension on the URI
-        path = request.pecan['routing_path']
+        path = req.pecan['routing_path']
 
-        if not request.pecan['content_type'] and '.' in path.split('/')[-1]:
+        if not req.pecan['content_type'] and '.' in path.split('/')[-1]:
             path, extension = splitext(path)
-            request.pecan['extension'] = extension
+            req.pecan['extension'] = extension
             # preface with a letter to ensure compat for 2.5
-            request.pecan['content_type'] = guess_type('x' + extension)[0]
+            req.pecan['content_type'] = guess_type('x' + extension)[0]
 
         controller, remainder = self.route(self.root, path)
         cfg = _cfg(controller)
@@ -376,21 +599,21 @@ class Pecan(object):
         if cfg.get('generic'):
             im_self = controller.im_self
             handlers = cfg['generic_handlers']
-            controller = handlers.get(request.method, handlers['DEFAULT'])
+            controller = handlers.get(req.method, handlers['DEFAULT'])
             cfg = _cfg(controller)
                     
         # add the controller to the state so that hooks can use it
         state.controller = controller
     
         # if unsure ask the controller for the default content type 
-        if not request.pecan['content_type']:
-            request.pecan['content_type'] = cfg.get('content_type', 'text/html')
+        if not req.pecan['content_type']:
+            req.pecan['content_type'] = cfg.get('content_type', 'text/html')
         elif cfg.get('content_type') is not None and \
-            request.pecan['content_type'] not in cfg.get('content_types', {}):
+            req.pecan['content_type'] not in cfg.get('content_types', {}):
 
             print "Controller '%s' defined does not support content_type '%s'. Supported type(s): %s" % (
                 controller.__name__,
-                request.pecan['content_type'],
+                req.pecan['content_type'],
                 cfg.get('content_types', {}).keys()
                 )
             raise exc.HTTPNotFound
@@ -401,8 +624,15 @@ class Pecan(object):
         # handle "before" hooks
         self.handle_hooks('before', state)
         
+        # a cached response skips everything from validation to rendering
+        cache = cfg.get('cache')
+        if cache is not None and req.method in ('GET', 'HEAD'):
+            cache_key = cache.key(req)
+            if cache.restore(cache_key, req, state.response):
+                return
+        
         # fetch and validate any parameters
-        params = dict(request.str_params)
+        params = dict(req.str_params)
         if 'schema' in cfg:
             params = self.validate(
                         cfg['schema'], 
@@ -412,17 +642,23 @@ class Pecan(object):
                         htmlfill=cfg.get('htmlfill'),
                         variable_decode=cfg.get('variable_decode')
                     )
-        elif 'pecan.validation_errors' in request.environ:
-            request.pecan['validation_errors'] = request.environ.pop('pecan.validation_errors')
+        elif 'pecan.validation_errors' in req.environ:
+            req.pecan['validation_errors'] = req.environ.pop('pecan.validation_errors')
         
         # fetch the arguments for the controller
         args, kwargs = self.get_args(
             params, 
             remainder,
             cfg['argspec'],
-            im_self
+            im_self,
+            cfg.get('binder')
         )
         
+        # a controller supplied ETag or Last-Modified date may show that the
+        # client already has the response, without calling the controller
+        if req.method in ('GET', 'HEAD') and self.not_modified(controller, cfg, args, kwargs):
+            return
+        
         # get the result from the controller
         result = controller(*args, **kwargs)
 
@@ -434,46 +670,119 @@ class Pecan(object):
         raw_namespace = result
 
         # pull the template out based upon content type and handle overrides
-        template = cfg.get('content_types', {}).get(request.pecan['content_type'])
+        template = cfg.get('content_types', {}).get(req.pecan['content_type'])
 
         # check if for controller override of template
-        template = request.pecan.get('override_template', template)
-        request.pecan['content_type'] = request.pecan.get('override_content_type', request.pecan['content_type'])
+        template = req.pecan.get('override_template', template)
+        req.pecan['content_type'] = req.pecan.get('override_content_type', req.pecan['content_type'])
 
-        # if there is a template, render it
-        if template:
-            if template == 'json':
-                request.pecan['content_type'] = 'application/json'
-            result = self.render(template, result)
+        if template == 'json':
+            req.pecan['content_type'] = 'application/json'
         
-        # pass the response through htmlfill (items are popped out of the 
-        # environment even if htmlfill won't run for proper cleanup)
+        # determine whether the response needs to pass through htmlfill 
+        # (items are popped out of the environment even if htmlfill won't 
+        # run for proper cleanup)
         _htmlfill = cfg.get('htmlfill')
-        if _htmlfill is None and 'pecan.htmlfill' in request.environ:
-            _htmlfill = request.environ.pop('pecan.htmlfill')
-        if 'pecan.params' in request.environ:
-            params = request.environ.pop('pecan.params')
-        if request.pecan['validation_errors'] and _htmlfill is not None and request.pecan['content_type'] == 'text/html':
-            errors = request.pecan['validation_errors']
-            result = htmlfill.render(result, defaults=params, errors=errors, **_htmlfill)
+        if _htmlfill is None and 'pecan.htmlfill' in req.environ:
+            _htmlfill = req.environ.pop('pecan.htmlfill')
+        if 'pecan.params' in req.environ:
+            params = req.environ.pop('pecan.params')
+        fill = req.pecan['validation_errors'] and _htmlfill is not None and req.pecan['content_type'] == 'text/html'
+        
+        # the fast filler can fill in a document as it is streamed, while
+        # htmlfill needs the whole of it
+        if fill:
+            _htmlfill = dict(_htmlfill)
+            fast = _htmlfill.pop('fast', False)
+        
+        # if there is a template, render it (streaming it if requested, 
+        # unless htmlfill needs the whole document)
+        if template:
+            stream = cfg.get('stream', False) and (not fill or fast)
+            result = self.render(template, result, stream)
+        
+        # pass the response through htmlfill
+        if fill:
+            errors = req.pecan['validation_errors']
+            if fast and isinstance(result, GeneratorType):
+                result = formfill.iterfill(result, defaults=params, errors=errors, **_htmlfill)
+            elif fast:
+                result = formfill.render(result, defaults=params, errors=errors, **_htmlfill)
+            else:
+                if isinstance(result, GeneratorType):
+                    # htmlfill needs the whole document, so buffer the stream
+                    result = ''.join(result)
+                result = htmlfill.render(result, defaults=params, errors=errors, **_htmlfill)
         
         # If we are in a test request put the namespace where it can be
         # accessed directly
-        if request.environ.get('paste.testing'):
-            testing_variables = request.environ['paste.testing_variables']
+        if req.environ.get('paste.testing'):
+            testing_variables = req.environ['paste.testing_variables']
             testing_variables['namespace'] = raw_namespace
             testing_variables['template_name'] = template
             testing_variables['controller_output'] = result
         
-        # set the body content
-        if isinstance(result, unicode):
-            response.unicode_body = result
+        # set the body content, streaming the chunks of generators (returned
+        # by the controller or the renderer) rather than buffering them
+        if isinstance(result, GeneratorType):
+            req.pecan['streaming'] = True
+            state.response.app_iter = encode_chunks(result, state.response)
+        elif isinstance(result, unicode):
+            state.response.unicode_body = result
         else:
-            response.body = result
+            state.response.body = result
         
         # set the content type
-        if request.pecan['content_type']:
-            response.content_type = request.pecan['content_type']
+        if req.pecan['content_type']:
+            state.response.content_type = req.pecan['content_type']
+        
+        # tag the rendered body, unless the controller supplied an ETag (or
+        # the body is streamed, and isn't known yet)
+        if cfg.get('etag', self.etag) is True and req.method in ('GET', 'HEAD') and \
+                state.response.status_int == 200 and state.response.etag is None and \
+                not req.pecan.get('streaming'):
+            state.response.md5_etag()
+            state.response.conditional_response = True
+        
+        if cache is not None and req.method == 'GET':
+            cache.store(cache_key, req, state.response)
+    
+    def not_modified(self, controller, cfg, args, kwargs):
+        '''
+        Calls the ``etag`` and ``last_modified`` callables of a controller,
+        if it has any, setting the ``ETag`` and ``Last-Modified`` headers of
+        the response, and returns True if the client already has the
+        response (which is then sent as ``304 Not Modified``).
+        
+        :param controller: The controller handling the request.
+        :param cfg: The configuration of the controller.
+        :param args: The positional arguments the controller will be called with.
+        :param kwargs: The keyword arguments the controller will be called with.
+        '''
+        
+        etag = cfg.get('etag')
+        last_modified = cfg.get('last_modified')
+        if not callable(etag) and last_modified is None:
+            return False
+        
+        # the callables are given the controller's instance too
+        im_self = getattr(controller, 'im_self', None)
+        if im_self is not None:
+            args = [im_self] + list(args)
+        
+        req = state.request
+        resp = state.response
+        if callable(etag):
+            resp.etag = etag(*args, **kwargs)
+        if last_modified is not None:
+            resp.last_modified = last_modified(*args, **kwargs)
+        resp.conditional_response = True
+        
+        if req.if_none_match and resp.etag:
+            return resp.etag in req.if_none_match
+        if req.if_modified_since and resp.last_modified:
+            return resp.last_modified <= req.if_modified_since
+        return False
     
     def __call__(self, environ, start_response):
         '''
@@ -490,7 +799,9 @@ class Pecan(object):
         try:
             # add context and environment to the request 
             state.request.context = {}
-            state.request.pecan = dict(content_type=None, validation_errors={})
+            state.request.pecan = RequestContext(
+                self.max_json_size, content_type=None, validation_errors={}
+            )
 
             self.handle_request()
         except Exception, e:
@@ -505,16 +816,37 @@ class Pecan(object):
             if not isinstance(e, exc.HTTPException):
                 raise
         finally:
+            # requests waiting for this one to compute a cached response can
+            # go on, whether it was cached or not
+            flight = state.request.pecan.pop('cache_flight', None)
+            if flight is not None:
+                flight[0].release(flight[1])
+            
             # handle "after" hooks
             self.handle_hooks('after', state)
             
         # get the response
         try:
-            return state.response(environ, start_response)
-        finally:        
-            # clean up state
-            del state.hooks
-            del state.request
-            del state.response
-            if hasattr(state, 'controller'):
-                del state.controller
+            app_iter = state.response(environ, start_response)
+        except:
+            self.clear_state()
+            raise
+        
+        # a streamed body is only generated as the server iterates over it,
+        # so the state has to stay around until the server closes it
+        if state.request.pecan.get('streaming'):
+            return ClosingIterator(app_iter, self.clear_state)
+        self.clear_state()
+        return app_iter
+    
+    def clear_state(self):
+        '''
+        Cleans up the state of the current request, once it has been
+        handled (so that objects don't leak between requests).
+        '''
+        
+        del state.hooks
+        del state.request
+        del state.response
+        if hasattr(state, 'controller'):
+            del state.controller
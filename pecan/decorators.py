@@ -1,8 +1,10 @@
 from inspect import getargspec
+from webob import exc
+from caching import ResponseCache
 from util import _cfg
 
 __all__ = [
-    'expose', 'transactional', 'accept_noncanonical'
+    'expose', 'cache', 'transactional', 'accept_noncanonical'
 ]
 
 
@@ -27,7 +29,10 @@ def expose(template        = None,
            variable_decode = False,
            error_handler   = None,
            htmlfill        = None,
-           generic         = False):
+           generic         = False,
+           stream          = False,
+           etag            = None,
+           last_modified   = None):
     
     '''
     Decorator used to flag controller methods as being "exposed" for
@@ -38,8 +43,11 @@ def expose(template        = None,
     :param schema: A ``formencode`` ``Schema`` object to use for validation.
     :param json_schema: A ``formencode`` ``Schema`` object to use for validation of JSON POST/PUT content.
     :param variable_decode: A boolean indicating if you want to use ``htmlfill``'s variable decode capability of transforming flat HTML form structures into nested ones.
-    :param htmlfill: Indicates whether or not you want to use ``htmlfill`` for this controller.
+    :param htmlfill: Indicates whether or not you want to use ``htmlfill`` for this controller. A dictionary is passed on to ``htmlfill.render`` as keyword arguments; include ``fast=True`` to fill forms with ``pecan.formfill`` instead.
     :param generic: A boolean which flags this as a "generic" controller, which uses generic functions based upon ``simplegeneric`` generic functions. Allows you to split a single controller into multiple paths based upon HTTP method.
+    :param stream: A boolean indicating if the template should be streamed to the client as it is rendered, rather than rendered in full first. Only has an effect with rendering engines which support it (jinja and genshi).
+    :param etag: True to give GET responses an ``ETag`` computed from their body, answering requests which already have it with ``304 Not Modified``, or False to opt out of the application wide setting. Alternatively, a callable which is called with the same arguments as the controller, before it, and returns the ``ETag``; the controller is then skipped when the client already has that representation.
+    :param last_modified: A callable which is called with the same arguments as the controller, before it, and returns when the resource was last modified (as a ``datetime``), so that ``If-Modified-Since`` requests can be answered with ``304 Not Modified`` without calling the controller.
     '''
     
     if template == 'json': content_type = 'application/json'
@@ -52,6 +60,12 @@ def expose(template        = None,
         cfg['content_type'] = content_type
         cfg.setdefault('template', []).append(template)
         cfg.setdefault('content_types', {})[content_type] = template
+        if stream:
+            cfg['stream'] = True
+        if etag is not None:
+            cfg['etag'] = etag
+        if last_modified is not None:
+            cfg['last_modified'] = last_modified
         
         # handle generic controllers
         if generic:
@@ -61,6 +75,7 @@ def expose(template        = None,
             
         # store the arguments for this controller method
         cfg['argspec'] = getargspec(f)
+        cfg['binder'] = ArgBinder(cfg['argspec'])
         
         # store the schema
         cfg['error_handler'] = error_handler
@@ -87,6 +102,101 @@ def expose(template        = None,
         return f
     return decorate
     
+def cache(ttl=60, params=None, headers=(), backend=None, maxsize=128,
+          stale=0, coalesce=True, timeout=10):
+    '''
+    Caches the rendered response (status, headers and body) of a ``GET``
+    controller for ``ttl`` seconds. Responses are cached per path and
+    content type (e.g. as picked by the extension of the path); the
+    security checks of ``pecan.secure`` still run on every request, while
+    validation, the controller and rendering are skipped when the response
+    is cached.
+    
+    :param ttl: The number of seconds to cache a response for.
+    :param params: The names of the query parameters the response depends on. Defaults to None, which caches a response for each distinct query string.
+    :param headers: The names of the request headers the response depends on, e.g. ``['Accept-Language']``.
+    :param backend: A ``pecan.caching.CacheBackend`` to store responses in, e.g. to share them between processes. Defaults to a ``MemoryBackend`` of ``maxsize`` responses for this controller.
+    :param maxsize: The maximum number of responses kept by the default backend.
+    :param stale: The number of seconds past its ``ttl`` an expired response may still be served for to other requests, while the first request to find it expired computes it again (before responding).
+    :param coalesce: A boolean indicating if concurrent requests for a response which isn't cached should wait for the first of them to compute it, rather than all calling the controller at once.
+    :param timeout: The number of seconds a request waits for another one computing the same response, at most, before calling the controller itself.
+    '''
+    
+    def decorate(f):
+        _cfg(f)['cache'] = ResponseCache(
+            ttl, params, headers, backend, maxsize, stale, coalesce, timeout
+        )
+        return f
+    return decorate
+
+class ArgBinder(object):
+    '''
+    Binds the remainder of a routed path and the request parameters to the
+    arguments of a controller. ``expose`` compiles one for each controller
+    from its argument specification, so that nothing needs to be derived
+    from the ``argspec`` per request.
+    '''
+
+    def __init__(self, argspec):
+        args, varargs, varkw, defaults = argspec
+        self.positional = tuple(args[1:])
+        self.names      = frozenset(args)
+        self.varargs    = bool(varargs)
+        self.varkw      = bool(varkw)
+        self.defaults   = {}
+        if defaults:
+            self.defaults = dict(zip(args[-len(defaults):], defaults))
+
+    def bind(self, params, remainder, im_self=None):
+        '''
+        Returns the ``(args, kwargs)`` to call the controller with. Raises
+        ``HTTPNotFound`` if the remainder has more parts than the controller
+        accepts.
+
+        :param params: The GET/POST parameters, as a dictionary. Parameters which are bound to positional arguments are popped from it.
+        :param remainder: The remainder of the routed path.
+        :param im_self: The instance to bind as the first argument, if any.
+        '''
+
+        args = []
+        positional = self.positional
+
+        if im_self is not None:
+            args.append(im_self)
+
+        # handle positional arguments
+        if positional and remainder:
+            args.extend(remainder[:len(positional)])
+            remainder = remainder[len(positional):]
+            positional = positional[len(args):]
+
+        # handle wildcard arguments
+        if remainder:
+            if not self.varargs:
+                raise exc.HTTPNotFound
+            args.extend(remainder)
+
+        # handle positional GET/POST params
+        defaults = self.defaults
+        for name in positional:
+            if name in params:
+                args.append(params.pop(name))
+            elif name in defaults:
+                args.append(defaults[name])
+            else:
+                break
+
+        # handle wildcard GET/POST params
+        kwargs = {}
+        if self.varkw:
+            names = self.names
+            for name, value in params.iteritems():
+                if name not in names:
+                    kwargs[name] = value
+
+        return args, kwargs
+
+
 def transactional(ignore_redirects=True):
     '''
     If utilizing the :mod:`pecan.hooks` ``TransactionHook``, allows you
@@ -10,10 +10,22 @@ app = {
     'modules' : [],
     'static_root' : 'public', 
     'template_path' : '',
+    'template_cache' : None,
+    'template_reload' : True,
     'debug' : False,
     'force_canonical' : True,
     'errors' : {
         '__force_dict__' : True
+    },
+    'compression' : {
+        'enabled' : False,
+        'min_size' : 500,
+        'level' : 6,
+        'content_types' : [
+            'text/html', 'text/plain', 'text/css', 'text/xml',
+            'text/javascript', 'application/json',
+            'application/javascript', 'application/xml'
+        ]
     }
 }
 
@@ -0,0 +1,438 @@
+'''
+A fast alternative to ``formencode.htmlfill`` for filling in forms that
+failed validation.
+
+Rather than feeding the whole document through an ``HTMLParser``, the
+filler scans it once for form controls (``input``, ``select``, ``option``
+and ``textarea`` tags), rewrites those and copies everything else through
+untouched, so documents can be filled as they are streamed. The output is
+the same as ``htmlfill.render``'s for the options both support.
+'''
+from formencode                 import htmlfill
+from formencode.rewritingparser import html_quote
+from htmlentitydefs             import name2codepoint
+
+import re
+
+__all__ = ['render', 'iterfill', 'FormFiller']
+
+
+_start_re = re.compile(
+    r'<(?:!--|script\b|style\b|/?(?:input|select|option|textarea)\b)', re.I
+)
+_tag_re = re.compile(
+    r'<!--.*?-->|<(script|style)\b.*?</\1\s*>|'
+    r'<(/?)(input|select|option|textarea)\b'
+    r'((?:[^\'">]|\'[^\']*\'|"[^"]*")*?)(/?)>',
+    re.I | re.S
+)
+_attr_re = re.compile(
+    r'([^\s/=>][^\s/=>]*)(\s*=\s*(\'[^\']*\'|"[^"]*"|[^\s>]*))?'
+)
+_end_textarea_re = re.compile(r'</textarea\s*>', re.I)
+_special_re = re.compile(r'[&<>"]')
+_entityref_re = re.compile(r'&([a-zA-Z][-.a-zA-Z\d]*);')
+_charref_re = re.compile(r'&#(\d+|[xX][a-fA-F\d]+);')
+
+
+def _sub_entityref(match):
+    name = match.group(1)
+    if name not in name2codepoint:
+        return match.group(0)
+    return unichr(name2codepoint[name])
+
+
+def _sub_charref(match):
+    num = match.group(1)
+    if num.lower().startswith('x'):
+        return unichr(int(num[1:], 16))
+    return unichr(int(num))
+
+
+def parse_attrs(text):
+    '''
+    Parses the attributes of a tag the way ``HTMLParser`` does: names are
+    lowercased, quotes are stripped and entities are unescaped.
+    '''
+    attrs = []
+    for name, assignment, value in _attr_re.findall(text):
+        if not assignment:
+            value = None
+        elif value[:1] == value[-1:] and value[:1] in ('"', "'") and len(value) > 1:
+            value = value[1:-1]
+        if value and '&' in value:
+            value = _charref_re.sub(_sub_charref, _entityref_re.sub(_sub_entityref, value))
+        attrs.append((name.lower(), value))
+    return attrs
+
+
+def get_attr(attrs, name, default=None):
+    for n, value in attrs:
+        if n == name:
+            return value
+    return default
+
+
+def set_attr(attrs, name, value):
+    for i, (n, v) in enumerate(attrs):
+        if n == name:
+            attrs[i] = (name, value)
+            return
+    attrs.append((name, value))
+
+
+def del_attr(attrs, name):
+    for i, (n, v) in enumerate(attrs):
+        if n == name:
+            del attrs[i]
+            return
+
+
+def quote(value):
+    # most attribute values have nothing to escape
+    if isinstance(value, basestring) and not _special_re.search(value):
+        return value
+    return html_quote(value)
+
+
+def write_tag(tag, attrs, startend=False):
+    return '<%s%s%s>' % (
+        tag,
+        ''.join([' %s="%s"' % (n, quote(v)) for n, v in attrs if not n.startswith('form:')]),
+        startend and ' /' or ''
+    )
+
+
+class FormFiller(object):
+    '''
+    Fills in the form controls of a document with ``defaults`` and
+    ``errors``, accepting the same arguments as ``htmlfill.render`` except
+    for ``use_all_keys``, ``listener`` and ``error_formatters`` (the
+    ``<form:error>`` and ``<form:iferror>`` tags are left as they are).
+
+    The document is passed to ``feed`` in one or more chunks, each call
+    returning the filled output available so far. Errors are inserted in
+    front of the first control for their field; ``pending`` holds the ones
+    that haven't been placed yet, which ``unplaced_errors`` returns once the
+    whole document has been fed, as they belong at the top of it.
+    '''
+
+    default_encoding = 'utf8'
+
+    def __init__(self, defaults=None, errors=None, add_attributes=None,
+                 auto_insert_errors=True, auto_error_formatter=None,
+                 text_as_default=False, encoding=None, error_class='error',
+                 prefix_error=True, force_defaults=True):
+        self.defaults = defaults or {}
+        self.errors = errors or {}
+        if isinstance(self.errors, basestring):
+            self.errors = {None: self.errors}
+        self.add_attributes = add_attributes or {}
+        if auto_insert_errors and auto_error_formatter is None:
+            auto_error_formatter = htmlfill.default_formatter
+        self.auto_error_formatter = auto_error_formatter
+        self.text_as_default = text_as_default
+        self.encoding = encoding
+        self.error_class = error_class
+        self.prefix_error = prefix_error
+        self.force_defaults = force_defaults
+
+        self.pending = dict(auto_error_formatter and self.errors or {})
+        self.in_select = None
+        self.in_textarea = None
+        self.skip_textarea = False
+        self._carry = ''
+
+    def feed(self, data, final=False):
+        '''
+        Fills in the next chunk of the document, returning a list of output
+        strings. Markup that is cut off at the end of the chunk is held back
+        until the next call, or passed through as is when ``final`` is set.
+        '''
+        if self._carry:
+            data = self._carry + data
+            self._carry = ''
+        out = []
+        write = out.append
+        pos = 0
+        end = len(data)
+        while pos < end:
+            # a filled textarea replaces its original content
+            if self.skip_textarea:
+                match = _end_textarea_re.search(data, pos)
+                if match is None:
+                    if not final:
+                        self._carry = data[pos:]
+                    return out
+                pos = match.end()
+                self._end_textarea(write)
+                continue
+
+            match = _start_re.search(data, pos)
+            if match is None:
+                break
+            start = match.start()
+            if start > pos:
+                write(data[pos:start])
+            match = _tag_re.match(data, start)
+            if match is None:
+                if not final:
+                    self._carry = data[start:]
+                    return out
+                write(data[start:start + 1])
+                pos = start + 1
+                continue
+            pos = match.end()
+
+            tag = match.group(3)
+            if tag is None:
+                # comments, scripts and stylesheets pass through untouched
+                write(match.group(0))
+                continue
+            tag = tag.lower()
+            if match.group(2):
+                if tag == 'select':
+                    self._end_select(write)
+                elif tag == 'textarea':
+                    self._end_textarea(write)
+                else:
+                    write(match.group(0))
+                continue
+            attrs = parse_attrs(match.group(4))
+            if tag == 'input':
+                self._input(write, attrs, bool(match.group(5)))
+            elif tag == 'select':
+                self._select(write, attrs)
+            elif tag == 'option':
+                self._option(write, attrs, match.group(0))
+            else:
+                self._textarea(write, attrs, match.group(0))
+
+        # hold back a tag that may be cut off at the end of the chunk
+        tail = data[pos:]
+        if not final:
+            i = tail.rfind('<')
+            if i >= 0 and '>' not in tail[i:]:
+                self._carry = tail[i:]
+                tail = tail[:i]
+        if tail:
+            write(tail)
+        return out
+
+    def unplaced_errors(self):
+        '''
+        Returns the errors whose fields weren't found in the document,
+        formatted for the top of it.
+        '''
+        messages = []
+        for key, value in self.errors.items():
+            if key in self.pending:
+                messages.insert(0, self._error(key, value))
+        return ''.join(messages)
+
+    def _default(self, name):
+        value = self.defaults.get(name)
+        if isinstance(name, unicode) and isinstance(value, str):
+            value = value.decode(self.encoding or self.default_encoding)
+        return value
+
+    def _error(self, key, value):
+        return '<!-- for: %s -->\n%s' % (key, self.auto_error_formatter(value))
+
+    def _marker(self, write, name):
+        if name in self.pending:
+            write(self._error(name, self.pending.pop(name)))
+
+    def _add_error_class(self, attrs, name):
+        if self.error_class and self.errors.get(name):
+            current = get_attr(attrs, 'class', '')
+            set_attr(attrs, 'class', (current + ' ' + self.error_class).strip())
+
+    def _input(self, write, attrs, startend):
+        t = (get_attr(attrs, 'type') or 'text').lower()
+        name = get_attr(attrs, 'name')
+        if self.prefix_error:
+            self._marker(write, name)
+        value = self._default(name)
+        for attr_name, attr_value in self.add_attributes.get(name, {}).iteritems():
+            if attr_name.startswith('+'):
+                attr_name = attr_name[1:]
+                attr_value = get_attr(attrs, attr_name, '') + attr_value
+            set_attr(attrs, attr_name, attr_value)
+        self._add_error_class(attrs, name)
+        if t in ('text', 'hidden', 'password'):
+            if value is None and not self.force_defaults:
+                value = get_attr(attrs, 'value', '')
+            set_attr(attrs, 'value', value)
+        elif t == 'checkbox':
+            if self.force_defaults:
+                selected = False
+            else:
+                selected = get_attr(attrs, 'checked')
+            if not get_attr(attrs, 'value'):
+                selected = value
+            elif self.selected_multiple(value, get_attr(attrs, 'value', '')):
+                selected = True
+            if selected:
+                set_attr(attrs, 'checked', 'checked')
+            else:
+                del_attr(attrs, 'checked')
+        elif t == 'radio':
+            if self.str_compare(value, get_attr(attrs, 'value', '')):
+                set_attr(attrs, 'checked', 'checked')
+            elif self.force_defaults or name in self.defaults:
+                del_attr(attrs, 'checked')
+        elif t in ('submit', 'reset', 'button'):
+            set_attr(attrs, 'value', value or get_attr(attrs, 'value', ''))
+        elif t not in ('file', 'image') and self.text_as_default:
+            if value is None:
+                value = get_attr(attrs, 'value', '')
+            set_attr(attrs, 'value', value)
+        write(write_tag('input', attrs, startend))
+        if not self.prefix_error:
+            self._marker(write, name)
+
+    def _select(self, write, attrs):
+        name = get_attr(attrs, 'name', False)
+        if name and self.prefix_error:
+            self._marker(write, name)
+        self._add_error_class(attrs, name)
+        self.in_select = name
+        write(write_tag('select', attrs))
+
+    def _end_select(self, write):
+        write('</select>')
+        if not self.prefix_error and self.in_select:
+            self._marker(write, self.in_select)
+        self.in_select = None
+
+    def _option(self, write, attrs, source):
+        if self.in_select is None:
+            write(source)
+            return
+        if self.in_select != False:
+            if self.force_defaults or self.in_select in self.defaults:
+                if self.selected_multiple(self.defaults.get(self.in_select, ''),
+                                          get_attr(attrs, 'value', '')):
+                    set_attr(attrs, 'selected', 'selected')
+                else:
+                    del_attr(attrs, 'selected')
+        write(write_tag('option', attrs))
+
+    def _textarea(self, write, attrs, source):
+        name = get_attr(attrs, 'name')
+        if self.prefix_error:
+            self._marker(write, name)
+        self._add_error_class(attrs, name)
+        value = self.defaults.get(name, '')
+        if value or self.force_defaults:
+            write(write_tag('textarea', attrs))
+            write(html_quote(value))
+            write('</textarea>')
+            self.skip_textarea = True
+        else:
+            write(source)
+        self.in_textarea = name
+
+    def _end_textarea(self, write):
+        if self.skip_textarea:
+            self.skip_textarea = False
+        else:
+            write('</textarea>')
+        if not self.prefix_error:
+            self._marker(write, self.in_textarea)
+        self.in_textarea = None
+
+    def str_compare(self, str1, str2):
+        if not isinstance(str1, basestring):
+            if hasattr(str1, '__unicode__'):
+                str1 = unicode(str1)
+            else:
+                str1 = str(str1)
+        if type(str1) == type(str2):
+            return str1 == str2
+        if isinstance(str1, unicode):
+            str1 = str1.encode(self.encoding or self.default_encoding)
+        else:
+            str2 = str2.encode(self.encoding or self.default_encoding)
+        return str1 == str2
+
+    def selected_multiple(self, obj, value):
+        if obj is None:
+            return value == ''
+        if isinstance(obj, basestring):
+            return obj == value
+        if hasattr(obj, '__contains__'):
+            if value in obj:
+                return True
+        if hasattr(obj, '__iter__'):
+            for inner in obj:
+                if self.str_compare(inner, value):
+                    return True
+        return self.str_compare(obj, value)
+
+
+def _decode(chunks, encoding):
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.decode(encoding)
+        yield chunk
+
+
+def render(form, defaults=None, errors=None, use_all_keys=False,
+           error_formatters=None, listener=None, **options):
+    '''
+    Renders ``form`` (a string) with ``defaults`` and ``errors`` filled in,
+    as ``htmlfill.render`` does. Documents using ``<form:error>`` tags and
+    calls relying on ``use_all_keys`` or ``listener`` are handed over to
+    ``htmlfill.render``.
+    '''
+    if use_all_keys or listener is not None or '<form:' in form:
+        return htmlfill.render(form, defaults=defaults, errors=errors,
+                               use_all_keys=use_all_keys,
+                               error_formatters=error_formatters,
+                               listener=listener, **options)
+    filler = FormFiller(defaults, errors, **options)
+    out = filler.feed(form, final=True)
+    out.insert(0, filler.unplaced_errors())
+    if filler.encoding is not None:
+        out = _decode(out, filler.encoding)
+    return ''.join(out)
+
+
+def iterfill(chunks, defaults=None, errors=None, use_all_keys=False,
+             error_formatters=None, listener=None, **options):
+    '''
+    Fills in a form that is generated as an iterable of strings, yielding
+    the output as it is filled. Output is held back only while there are
+    errors left that may have to go to the top of the document. Calls
+    relying on ``use_all_keys`` or ``listener`` need the whole form, which
+    is then rendered by ``render`` once all of the chunks are in.
+    '''
+    if use_all_keys or listener is not None:
+        yield render(''.join(chunks), defaults=defaults, errors=errors,
+                     use_all_keys=use_all_keys,
+                     error_formatters=error_formatters,
+                     listener=listener, **options)
+        return
+    filler = FormFiller(defaults, errors, **options)
+    buffered = []
+    for chunk in chunks:
+        out = filler.feed(chunk)
+        if filler.pending:
+            buffered.extend(out)
+            continue
+        if buffered:
+            out[:0] = buffered
+            buffered = []
+        if out:
+            if filler.encoding is not None:
+                out = _decode(out, filler.encoding)
+            yield ''.join(out)
+    buffered.extend(filler.feed('', final=True))
+    buffered.insert(0, filler.unplaced_errors())
+    if filler.encoding is not None:
+        buffered = _decode(buffered, filler.encoding)
+    result = ''.join(buffered)
+    if result:
+        yield result
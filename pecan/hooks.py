@@ -1,4 +1,5 @@
 from inspect    import getmembers
+from operator   import attrgetter
 from webob.exc  import HTTPFound
 
 from util    import iscontroller
@@ -82,6 +83,45 @@ class PecanHook(object):
         return
 
 
+def _overrides(hook, hook_type):
+    method = getattr(hook, hook_type, None)
+    return getattr(method, 'im_func', method) is not \
+        getattr(PecanHook, hook_type).im_func
+
+
+_priority = attrgetter('priority')
+
+
+def signature(hooks):
+    '''
+    Returns what a ``HookPipeline`` for ``hooks`` (a tuple) depends on: the
+    hooks and their priorities. Both are collected without running any
+    Python code per hook, so this is cheap enough to check on each request.
+    '''
+    
+    return hooks, tuple(map(_priority, hooks))
+
+
+class HookPipeline(list):
+    '''
+    A list of hooks sorted by priority, which also holds the hook methods
+    to call for each phase of a request (``on_route``, ``before``,
+    ``after`` and ``on_error``), in the order they should run. Hooks which
+    inherit the no-op method from ``PecanHook`` are left out of a phase.
+    
+    :param hooks: The hooks to run.
+    '''
+    
+    def __init__(self, hooks):
+        hooks = tuple(hooks)
+        self.signature = signature(hooks)
+        list.__init__(self, sorted(hooks, key=_priority))
+        self.on_route = tuple([h.on_route for h in self if _overrides(h, 'on_route')])
+        self.before   = tuple([h.before for h in self if _overrides(h, 'before')])
+        self.after    = tuple([h.after for h in reversed(self) if _overrides(h, 'after')])
+        self.on_error = tuple([h.on_error for h in reversed(self) if _overrides(h, 'on_error')])
+
+
 class TransactionHook(PecanHook):
     '''
     A basic framework hook for supporting wrapping requests in
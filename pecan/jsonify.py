@@ -3,8 +3,11 @@ try:
 except ImportError: # pragma: no cover
     from json import JSONEncoder
 
+from collections            import Iterator
 from datetime               import datetime, date
 from decimal                import Decimal
+from inspect                import getmro
+from types                  import FunctionType, InstanceType
 from webob.multidict        import MultiDict, UnicodeMultiDict
 from simplegeneric          import generic
 
@@ -67,12 +70,326 @@ _default = GenericJSON()
 def jsonify(obj):
     return _default.default(obj)
 
+
+#
+# per-type dispatch
+#
+
+# rules registered with ``jsonify.when_type``, and the converter resolved
+# for each class encountered so far (cleared whenever a rule is registered)
+_rules = {}
+_converters = {}
+_has_object_rules = []
+
+def _json_method(obj):
+    return obj.__json__()
+
+def _mixed(obj):
+    return obj.mixed()
+
+def decimal_to_float(value):
+    '''
+    Converts a ``Decimal`` to a ``float``, as ``float(value)`` does.
+    ``Decimal.__float__`` formats the whole number with ``Decimal.__str__``
+    first; building the literal from its digits and exponent instead is
+    about twice as fast.
+    '''
+    if value._is_special:
+        return float(value)
+    return float('%s%se%d' % ('-' * value._sign, value._int, value._exp))
+
+def compile_json_method(cls):
+    '''
+    Returns the ``__json__`` method of ``cls`` as a plain function, so that
+    calling it doesn't involve binding a method to each object.
+    '''
+    for t in getmro(cls):
+        if '__json__' in getattr(t, '__dict__', {}):
+            method = t.__dict__['__json__']
+            if isinstance(method, FunctionType):
+                return method
+            break
+    return _json_method
+
+
+class SAObjectSerializer(object):
+    '''
+    Converts instances of a SQLAlchemy mapped class into dictionaries of
+    their loaded attributes. The names of the mapped attributes are
+    compiled once for the class (and again if the mapper gains attributes,
+    such as a backref), rather than filtering every object's ``__dict__``.
+    '''
+
+    def __init__(self, cls):
+        self.manager = cls._sa_class_manager
+        self.size = None
+        self.names = []
+
+    def __call__(self, obj):
+        if len(self.manager) != self.size:
+            self.names = [
+                name for name in self.manager if not name.startswith('_sa_')
+            ]
+            self.size = len(self.manager)
+        attrs = obj.__dict__
+        props = dict([
+            (name, attrs[name]) for name in self.names if name in attrs
+        ])
+        # besides its _sa_instance_state, the object may have been given
+        # attributes the mapper doesn't know about
+        if len(props) + 1 != len(attrs):
+            for key in attrs:
+                if key not in props and not key.startswith('_sa_'):
+                    props[key] = getattr(obj, key)
+        return props
+
+def resolve_converter(cls):
+    '''
+    Returns the function converting instances of ``cls`` into something
+    JSON can encode: the most specific rule registered for it with
+    ``jsonify.when_type``, or else the built in conversion for its type,
+    compiled for the class where possible.
+    Classes with nothing to go by (such as objects given a ``__json__``
+    method of their own) are handled by ``GenericJSON.default``.
+    '''
+    for t in getmro(cls):
+        if t in _rules:
+            return _rules[t]
+    if callable(getattr(cls, '__json__', None)):
+        return compile_json_method(cls)
+    if issubclass(cls, (date, datetime)):
+        return str
+    if issubclass(cls, Decimal):
+        return decimal_to_float
+    if is_saobject(cls):
+        return SAObjectSerializer(cls)
+    if issubclass(cls, (MultiDict, UnicodeMultiDict)):
+        return _mixed
+    return _default.default
+
+def convert(obj):
+    '''
+    Converts ``obj`` as ``jsonify`` does, but looks up the conversion once
+    per class rather than dispatching on every object.
+    '''
+    if _has_object_rules and jsonify.has_object(obj):
+        return jsonify(obj)
+    cls = type(obj)
+    if cls is InstanceType:
+        cls = obj.__class__
+    try:
+        f = _converters[cls]
+    except KeyError:
+        f = _converters[cls] = resolve_converter(cls)
+    return f(obj)
+
+def _register(when, record):
+    def register(*args):
+        decorate = when(*args)
+        def decorator(f):
+            f = decorate(f)
+            record(args, f)
+            _converters.clear()
+            _lazy_types.clear()
+            return f
+        return decorator
+    return register
+
+def _record_types(types, f):
+    for t in types:
+        _rules[t] = f
+
+def _record_objects(obs, f):
+    _has_object_rules[:] = [True]
+
+jsonify.when_type = _register(jsonify.when_type, _record_types)
+jsonify.when_object = _register(jsonify.when_object, _record_objects)
+
+
 class GenericFunctionJSON(GenericJSON):
     def default(self, obj):
-        return jsonify(obj)
+        return convert(obj)
+
+
+#
+# backends
+#
+
+_scalars = frozenset([str, unicode, int, long, float, bool, type(None)])
+
+def to_plain(obj):
+    '''
+    Converts ``obj`` into the types ``JSON`` is made of (dictionaries,
+    lists, strings, numbers, booleans and ``None``), for encoders which
+    can't be asked to convert the objects they encounter.
+    '''
+    if type(obj) in _scalars:
+        return obj
+    # subclasses of the builtin types are encoded as those, as they would
+    # be by a JSONEncoder
+    if isinstance(obj, dict):
+        return dict([(k, to_plain(v)) for k, v in obj.iteritems()])
+    if isinstance(obj, (list, tuple, Iterator)):
+        return [to_plain(v) for v in obj]
+    if isinstance(obj, (basestring, int, long, float)):
+        return obj
+    return to_plain(convert(obj))
+
+
+class DumpsEncoder(object):
+    '''
+    An encoder for ``JSON`` modules which only provide a ``dumps``
+    function (such as ``ujson`` or ``cjson``), which is given objects
+    already converted with ``to_plain``.
+    '''
+
+    item_separator = ','
+    key_separator = ':'
+
+    def __init__(self, dumps):
+        self.dumps = dumps
+
+    def encode(self, obj):
+        return self.dumps(to_plain(obj))
+
+
+def make_encoder(backend=None):
+    '''
+    Returns an encoder using the ``JSON`` module named ``backend``:
+    ``json`` for the standard library, ``simplejson``, or any module
+    providing a compatible ``JSONEncoder`` or, failing that, a ``dumps``
+    function (e.g. ``ujson``). By default, ``simplejson`` is used when it
+    is installed.
+    '''
+    if backend is None:
+        return GenericFunctionJSON()
+    module = __import__(backend, fromlist=['JSONEncoder'])
+    if hasattr(module, 'JSONEncoder'):
+        return module.JSONEncoder(default=convert)
+    if hasattr(module, 'dumps'):
+        return DumpsEncoder(module.dumps)
+    raise ImportError('%s provides neither JSONEncoder nor dumps' % backend)
+
+_instance = make_encoder()
+
+
+def encode(obj, encoder=None):
+    return (encoder or _instance).encode(obj)
+
+
+#
+# streaming
+#
+
+def _has_rule(cls):
+    for t in getmro(cls):
+        if t in _rules:
+            return True
+    return False
+
+# types encoded as they are, and whether other types are lazy (cleared
+# along with the converters, as rules can change the answer)
+_native = frozenset([str, unicode, int, long, float, bool, type(None), list, tuple])
+_lazy_types = {}
+
+def _lazy(obj):
+    # whether obj produces its items as it goes, so should be streamed
+    cls = type(obj)
+    if cls in _native:
+        return False
+    if isinstance(obj, dict):
+        for value in obj.itervalues():
+            if _lazy(value):
+                return True
+        return False
+    if cls is InstanceType:
+        cls = obj.__class__
+    try:
+        return _lazy_types[cls]
+    except KeyError:
+        lazy = issubclass(cls, Iterator) or (
+            issubclass(cls, ResultProxy) and not _has_rule(cls)
+        )
+        _lazy_types[cls] = lazy
+        return lazy
+
+def _iterencode_items(items, encode, item_separator, key_separator, batch_size=256):
+    # items are encoded in batches, which is much faster than one by one
+    batch = []
+    first = True
+    for item in items:
+        if not _lazy(item):
+            batch.append(item)
+            if len(batch) < batch_size:
+                continue
+            item = None
+        if batch:
+            if not first:
+                yield item_separator
+            yield encode(batch)[1:-1]
+            batch = []
+            first = False
+        if item is not None:
+            if not first:
+                yield item_separator
+            for chunk in _iterencode(item, encode, item_separator, key_separator):
+                yield chunk
+            first = False
+    if batch:
+        if not first:
+            yield item_separator
+        yield encode(batch)[1:-1]
+
+def _iterencode(obj, encode, item_separator, key_separator):
+    if isinstance(obj, ResultProxy) and not _has_rule(obj.__class__):
+        # the count comes after the rows when it's only known by then
+        count = obj.rowcount
+        if count >= 0:
+            yield '{"count"%s%d%s"rows"%s[' % (
+                key_separator, count, item_separator, key_separator
+            )
+        else:
+            yield '{"rows"%s[' % key_separator
+        rows = [0]
+        def counted(rows=rows):
+            for row in obj:
+                rows[0] += 1
+                yield row
+        for chunk in _iterencode_items(counted(), encode, item_separator, key_separator):
+            yield chunk
+        if count >= 0:
+            yield ']}'
+        else:
+            yield ']%s"count"%s%d}' % (item_separator, key_separator, rows[0])
+    elif isinstance(obj, dict) and _lazy(obj):
+        yield '{'
+        for i, (key, value) in enumerate(obj.iteritems()):
+            if i:
+                yield item_separator
+            if isinstance(key, basestring):
+                yield encode(key)
+            else:
+                yield '"%s"' % encode(key)
+            yield key_separator
+            for chunk in _iterencode(value, encode, item_separator, key_separator):
+                yield chunk
+        yield '}'
+    elif isinstance(obj, (list, tuple, Iterator)):
+        yield '['
+        for chunk in _iterencode_items(obj, encode, item_separator, key_separator):
+            yield chunk
+        yield ']'
+    else:
+        yield encode(obj)
 
-_instance = GenericFunctionJSON()
-    
 
-def encode(obj):
-    return _instance.encode(obj)
+def iterencode(obj, encoder=None):
+    '''
+    Encodes ``obj`` as a generator of ``JSON`` chunks. Lists, tuples,
+    iterators and ``ResultProxy`` objects (including those found in
+    dictionaries) are encoded an item at a time, so that they are never
+    held in memory as a whole, and iterators don't need to be turned into
+    lists first; everything else is encoded by ``encoder`` in one go.
+    '''
+    encoder = encoder or _instance
+    return _iterencode(obj, encoder.encode, encoder.item_separator, encoder.key_separator)
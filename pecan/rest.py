@@ -2,104 +2,161 @@ from inspect import getargspec, ismethod
 
 from core import abort, request
 from decorators import expose
-from routing import lookup_controller
+from routing import _lookup_controller, NotFound
 from util import iscontroller
 
 
+class _RestDispatchTable(object):
+    '''
+    Everything ``RestController._route`` needs to know about a class,
+    computed once per ``RestController`` subclass.
+    '''
+
+    def __init__(self, cls):
+        self.exposed = set()
+        self.handlers = {}
+        for name in dir(cls):
+            value = getattr(cls, name, None)
+            if name.startswith('_handle_') and callable(value):
+                self.handlers[name[len('_handle_'):]] = name
+            if iscontroller(value):
+                self.exposed.add(name)
+
+        # custom and verb-specific actions, keyed by (verb, action), e.g.
+        # ('get', 'delete') -> 'get_delete' or ('post', 'options') -> 'post_options'
+        self.actions = {}
+        for name in self.exposed:
+            if '_' in name[1:]:
+                verb, action = name.split('_', 1)
+                self.actions[(verb, action)] = name
+
+        self.custom_actions = {}
+        for action, methods in cls._custom_actions.items():
+            self.custom_actions[action] = frozenset([m.lower() for m in methods])
+
+        # need either a get_one or get to parse args for sub-controllers
+        self.get_method = None
+        self.fixed_args = 0
+        self.var_args = False
+        for name in ('get_one', 'get'):
+            if hasattr(cls, name):
+                args = getargspec(getattr(cls, name))
+                self.get_method = name
+                self.fixed_args = len(args[0][1:])
+                self.var_args = bool(args[1])
+                break
+
+
 class RestController(object):
     '''
     A base class for ``REST`` based controllers. Inherit from this class
     to implement a REST controller. A set of custom actions can also
     be specified. For more details, see :ref:`pecan_rest`.
     '''
-    
+
     _custom_actions = {}
-    
+
+    @classmethod
+    def _dispatch_table(cls):
+        # built lazily rather than in a metaclass, so that subclasses can
+        # still be combined with SecureController or HookController
+        table = cls.__dict__.get('_rest_dispatch_table')
+        if table is None:
+            table = _RestDispatchTable(cls)
+            setattr(cls, '_rest_dispatch_table', table)
+        return table
+
     @expose()
     def _route(self, args):
-        
+
         # convention uses "_method" to handle browser-unsupported methods
         method = request.params.get('_method', request.method).lower()
-        
+
         # make sure DELETE/PUT requests don't use GET
         if request.method == 'GET' and method in ('delete', 'put'):
             abort(405)
-        
+
         # check for nested controllers
         result = self._find_sub_controllers(args)
-        if result:
+        if result is not None:
             return result
-        
+
         # handle the request
-        handler = getattr(self, '_handle_%s' % method, self._handle_custom)
-        result = handler(method, args)
-        
+        handler = self._dispatch_table().handlers.get(method)
+        if handler is None:
+            result = self._handle_custom(method, args)
+        else:
+            result = getattr(self, handler)(method, args)
+
         # return the result
         return result
-    
+
     def _find_controller(self, *args):
+        table = self._dispatch_table()
         for name in args:
-            obj = getattr(self, name, None)
-            if obj and iscontroller(obj):
-                return obj
+            if name in table.exposed:
+                return getattr(self, name)
+        return None
+
+    def _find_action(self, verb, action):
+        table = self._dispatch_table()
+        name = table.actions.get((verb, action))
+        if name is None and action in table.exposed:
+            name = action
+        if name is not None:
+            return getattr(self, name)
         return None
-    
+
     def _find_sub_controllers(self, remainder):
-        
-        # need either a get_one or get to parse args
-        method = None
-        for name in ('get_one', 'get'):
-            if hasattr(self, name):
-                method = name
-                break
-        if not method:
+        table = self._dispatch_table()
+        if not table.get_method:
             return
-        
-        # get the args to figure out how much to chop off
-        args = getargspec(getattr(self, method))
-        fixed_args = len(args[0][1:]) - len(request.pecan.get('routing_args', []))
-        var_args = args[1]
-        
+
+        # figure out how much to chop off
+        fixed_args = table.fixed_args - len(request.pecan.get('routing_args', []))
+
         # attempt to locate a sub-controller
-        if var_args:
+        if table.var_args:
             for i, item in enumerate(remainder):
                 controller = getattr(self, item, None)
                 if controller and not ismethod(controller):
                     self._set_routing_args(remainder[:i])
-                    return lookup_controller(controller, remainder[i + 1:])
+                    return _lookup_controller(controller, remainder[i + 1:])
         elif fixed_args < len(remainder) and hasattr(self, remainder[fixed_args]):
             controller = getattr(self, remainder[fixed_args])
             if not ismethod(controller):
                 self._set_routing_args(remainder[:fixed_args])
-                return lookup_controller(controller, remainder[fixed_args + 1:])
-    
+                return _lookup_controller(controller, remainder[fixed_args + 1:])
+
     def _handle_custom(self, method, remainder):
-        
+        table = self._dispatch_table()
+
         # try finding a post_{custom} or {custom} method first
-        controller = self._find_controller('post_%s' % method, method)
+        controller = self._find_action('post', method)
         if controller:
             return controller, remainder
-        
-        # if no controller exists, try routing to a sub-controller; note that 
+
+        # if no controller exists, try routing to a sub-controller; note that
         # since this isn't a safe GET verb, any local exposes are 405'd
         if remainder:
-            if self._find_controller(remainder[0]):
+            if remainder[0] in table.exposed:
                 abort(405)
             sub_controller = getattr(self, remainder[0], None)
             if sub_controller:
-                return lookup_controller(sub_controller, remainder[1:])
-        
-        abort(404)
-    
+                return _lookup_controller(sub_controller, remainder[1:])
+
+        return NotFound
+
     def _handle_get(self, method, remainder):
-        
+        table = self._dispatch_table()
+
         # route to a get_all or get if no additional parts are available
         if not remainder:
             controller = self._find_controller('get_all', 'get')
             if controller:
                 return controller, []
-            abort(404)
-        
+            return NotFound
+
         # check for new/edit/delete GET requests
         method_name = remainder[-1]
         if method_name in ('new', 'edit', 'delete'):
@@ -108,62 +165,64 @@ class RestController(object):
             controller = self._find_controller(method_name)
             if controller:
                 return controller, remainder[:-1]
-        
+
         # check for custom GET requests
-        if method.upper() in self._custom_actions.get(method_name, []):
-            controller = self._find_controller('get_%s' % method_name, method_name)
+        if method in table.custom_actions.get(method_name, ()):
+            controller = self._find_action('get', method_name)
             if controller:
                 return controller, remainder[:-1]
         controller = getattr(self, remainder[0], None)
         if controller and not ismethod(controller):
-            return lookup_controller(controller, remainder[1:])
-        
+            return _lookup_controller(controller, remainder[1:])
+
         # finally, check for the regular get_one/get requests
         controller = self._find_controller('get_one', 'get')
         if controller:
             return controller, remainder
-        
-        abort(404)
-    
+
+        return NotFound
+
     def _handle_delete(self, method, remainder):
-        
+        table = self._dispatch_table()
+
         # check for post_delete/delete requests first
         controller = self._find_controller('post_delete', 'delete')
         if controller:
             return controller, remainder
-        
-        # if no controller exists, try routing to a sub-controller; note that 
+
+        # if no controller exists, try routing to a sub-controller; note that
         # since this is a DELETE verb, any local exposes are 405'd
         if remainder:
-            if self._find_controller(remainder[0]):
+            if remainder[0] in table.exposed:
                 abort(405)
             sub_controller = getattr(self, remainder[0], None)
             if sub_controller:
-                return lookup_controller(sub_controller, remainder[1:])
-        
-        abort(404)
-    
+                return _lookup_controller(sub_controller, remainder[1:])
+
+        return NotFound
+
     def _handle_post(self, method, remainder):
+        table = self._dispatch_table()
 
         # check for custom POST/PUT requests
         if remainder:
             method_name = remainder[-1]
-            if method.upper() in self._custom_actions.get(method_name, []):
-                controller = self._find_controller('%s_%s' % (method, method_name), method_name)
+            if method in table.custom_actions.get(method_name, ()):
+                controller = self._find_action(method, method_name)
                 if controller:
                     return controller, remainder[:-1]
             controller = getattr(self, remainder[0], None)
             if controller and not ismethod(controller):
-                return lookup_controller(controller, remainder[1:])
-        
+                return _lookup_controller(controller, remainder[1:])
+
         # check for regular POST/PUT requests
         controller = self._find_controller(method)
         if controller:
             return controller, remainder
-        
-        abort(404)
-    
+
+        return NotFound
+
     _handle_put = _handle_post
-    
+
     def _set_routing_args(self, args):
         request.pecan.setdefault('routing_args', []).extend(args)
@@ -1,56 +1,106 @@
 from webob import exc
-from inspect import ismethod
+from inspect import getmro, ismethod, isclass, ismodule, isroutine
 
 from secure import handle_security, cross_boundary
 from util import iscontroller
 
-__all__ = ['lookup_controller', 'find_object']
+__all__ = ['lookup_controller', 'find_object', 'RouteTrie', 'NotFound']
 
 class NonCanonicalPath(Exception):
     def __init__(self, controller, remainder):
         self.controller = controller
         self.remainder = remainder
 
+class _NotFound(object):
+    def __repr__(self):
+        return '<NotFound>'
+    def __nonzero__(self):
+        return False
+
+# returned by the routing functions instead of raising ``HTTPNotFound``; the
+# exception is only built once routing has finished, in ``Pecan.route``
+NotFound = _NotFound()
+
+
+def _unwrap(result):
+    if result is NotFound:
+        raise exc.HTTPNotFound
+    if isinstance(result, NonCanonicalPath):
+        raise result
+    return result
+
+
 def lookup_controller(obj, url_path):
+    '''
+    Looks up a controller, raising ``HTTPNotFound`` or ``NonCanonicalPath``
+    when the path does not resolve to a canonical controller.
+    '''
+    return _unwrap(_lookup_controller(obj, url_path))
+
+
+def find_object(obj, remainder, notfound_handlers):
+    return _unwrap(_find_object(obj, remainder, notfound_handlers))
+
+
+def _lookup_controller(obj, url_path, trace=None, notfound_handlers=None,
+                       prev_obj=None):
+    '''
+    Looks up a controller, returning ``NotFound`` or a ``NonCanonicalPath``
+    instead of raising them. If a ``trace`` list is passed in, it records
+    anything which makes the result depend on more than the path itself
+    (``_lookup``, ``_route`` or secured controllers).
+
+    A walk started elsewhere (e.g. by ``RouteTrie``) can be resumed at
+    ``obj`` by passing the ``notfound_handlers`` collected so far and the
+    object the walk came from, as ``prev_obj``.
+    '''
     remainder = url_path
-    notfound_handlers = []
+    if notfound_handlers is None:
+        notfound_handlers = []
 
     while True:
-        try:
-            obj, remainder = find_object(obj, remainder, notfound_handlers)
-            handle_security(obj)
-            return obj, remainder
-        except exc.HTTPNotFound:
-            while notfound_handlers:
-                name, obj, remainder = notfound_handlers.pop()
-                if name == '_default':
-                    # Notfound handler is, in fact, a controller, so stop
-                    #   traversal
-                    return obj, remainder
-                else:
-                    # Notfound handler is an internal redirect, so continue
-                    #   traversal
-                    try:
-                        result = obj(*remainder)
-                        if result:
-                            prev_obj = obj
-                            obj, remainder = result
-                            # crossing controller boundary
-                            cross_boundary(prev_obj, obj)
-                            break
-                    except TypeError, te:
-                        print 'Got exception calling lookup(): %s (%s)' % (te, te.args)
+        result = _find_object(obj, remainder, notfound_handlers, trace, prev_obj)
+        prev_obj = None
+        if result is not NotFound:
+            if not isinstance(result, NonCanonicalPath):
+                if trace is not None and result[0]._pecan.get('secured'):
+                    trace.append('secured')
+                handle_security(result[0])
+            return result
+
+        while notfound_handlers:
+            name, obj, remainder = notfound_handlers.pop()
+            if name == '_default':
+                # Notfound handler is, in fact, a controller, so stop
+                #   traversal
+                return obj, remainder
             else:
-                raise exc.HTTPNotFound
+                # Notfound handler is an internal redirect, so continue
+                #   traversal
+                if trace is not None:
+                    trace.append('_lookup')
+                try:
+                    result = obj(*remainder)
+                    if result:
+                        prev_obj = obj
+                        obj, remainder = result
+                        # crossing controller boundary
+                        cross_boundary(prev_obj, obj)
+                        break
+                except TypeError, te:
+                    print 'Got exception calling lookup(): %s (%s)' % (te, te.args)
+        else:
+            return NotFound
 
 
-def find_object(obj, remainder, notfound_handlers):
-    prev_obj = None
+def _find_object(obj, remainder, notfound_handlers, trace=None, prev_obj=None):
     while True:
-        if obj is None: raise exc.HTTPNotFound
+        if obj is None: return NotFound
         if iscontroller(obj): return obj, remainder
 
         # are we traversing to another controller
+        if trace is not None and hasattr(prev_obj, '_pecan'):
+            trace.append('secured')
         cross_boundary(prev_obj, obj)
         
         if remainder and remainder[0] == '':
@@ -60,7 +110,7 @@ def find_object(obj, remainder, notfound_handlers):
             # the URL has hit an index method without a trailing slash
             index = getattr(obj, 'index', None)
             if iscontroller(index): 
-                raise NonCanonicalPath(index, remainder[1:])
+                return NonCanonicalPath(index, remainder[1:])
         default = getattr(obj, '_default', None)
         if iscontroller(default):
             notfound_handlers.append(('_default', default, remainder))
@@ -71,11 +121,189 @@ def find_object(obj, remainder, notfound_handlers):
         
         route = getattr(obj, '_route', None)
         if iscontroller(route):
-            next, next_remainder = route(remainder)
+            # custom routes may still raise, or return a routing result
+            if trace is not None:
+                trace.append('_route')
+            try:
+                result = route(remainder)
+            except exc.HTTPNotFound:
+                return NotFound
+            except NonCanonicalPath, e:
+                return e
+            if result is NotFound or isinstance(result, NonCanonicalPath):
+                return result
+            next, next_remainder = result
             cross_boundary(route, next)
             return next, next_remainder
         
-        if not remainder: raise exc.HTTPNotFound
+        if not remainder: return NotFound
         next, remainder = remainder[0], remainder[1:]
         prev_obj = obj
         obj = getattr(obj, next, None)
+
+
+#
+# Precompiled routing
+#
+
+# attribute values of these types can never lead to a controller, so
+# they are left out of the trie
+_leaf_types = (basestring, int, long, float, bool, list, tuple, dict,
+               set, frozenset, type(None))
+
+
+def _static_attribute(obj, name):
+    '''
+    Returns the attribute ``name`` of ``obj`` for building the trie, or
+    ``None`` if it has to be looked up on each request: properties and
+    other descriptors (other than methods) are neither run nor compiled.
+    '''
+    try:
+        if name in obj.__dict__:
+            return obj.__dict__[name]
+    except AttributeError:
+        pass
+    for cls in getmro(obj.__class__):
+        if name in cls.__dict__:
+            value = cls.__dict__[name]
+            if hasattr(value.__class__, '__get__') and not (
+                    isroutine(value) or isinstance(value, (staticmethod, classmethod))):
+                return None
+            return getattr(obj, name)
+    return None
+
+
+class _RouteNode(object):
+    __slots__ = ('obj', 'children', 'index', 'default', 'controller',
+                 'dynamic', 'guarded')
+
+    def __init__(self, obj):
+        self.obj        = obj
+        self.children   = {}
+        self.index      = None
+        self.default    = None
+        self.controller = False
+        self.dynamic    = False
+        self.guarded    = False
+
+    def is_empty(self):
+        return not (self.children or self.index or self.default or
+                    self.controller or self.dynamic)
+
+
+class RouteTrie(object):
+    '''
+    A segment trie built once from a root controller, so that routing a
+    path is a walk over dictionaries rather than a series of ``getattr``
+    calls. Only the static part of the controller tree is compiled: any
+    object which defines ``_lookup`` or ``_route``, or is reached through
+    a property, is left to ``lookup_controller``, which ``lookup`` hands
+    the rest of the walk over to from where the trie stops.
+
+    The trie assumes that the controller tree does not change after it
+    has been built.
+    '''
+
+    def __init__(self, root):
+        self.root = self._build(root, None, ())
+
+    def _build(self, obj, parent, path):
+        node = _RouteNode(obj)
+        node.guarded = parent is not None and hasattr(parent, '_pecan')
+        if iscontroller(obj):
+            node.controller = True
+            return node
+        if iscontroller(getattr(obj, '_lookup', None)) or \
+           iscontroller(getattr(obj, '_route', None)):
+            node.dynamic = True
+            return node
+
+        index = getattr(obj, 'index', None)
+        if iscontroller(index):
+            node.index = index
+        default = getattr(obj, '_default', None)
+        if iscontroller(default):
+            node.default = default
+
+        path = path + (id(obj),)
+        for name in dir(obj):
+            if name.startswith('__') and name.endswith('__'): continue
+            try:
+                value = _static_attribute(obj, name)
+            except Exception:
+                continue
+            if value is None: continue
+            if not iscontroller(value):
+                if isinstance(value, _leaf_types): continue
+                if isclass(value) or ismodule(value) or isroutine(value): continue
+                if id(value) in path: continue
+            child = self._build(value, obj, path)
+            if not child.is_empty():
+                node.children[name] = child
+        return node
+
+    def lookup(self, remainder, trace=None):
+        '''
+        Resolves a list of path segments to a ``(controller, remainder)``
+        tuple, a ``NonCanonicalPath`` or ``NotFound``, with the same
+        semantics as ``_lookup_controller``. When the rest of the path has
+        to be routed dynamically, the walk carries on with
+        ``_lookup_controller`` from the object the trie stopped at.
+
+        :param remainder: The path, split into a list of segments.
+        :param trace: An optional list, as passed to ``_lookup_controller``.
+        '''
+
+        node = self.root
+        prev = None
+        default = None
+        while True:
+            if node.controller:
+                if trace is not None and node.obj._pecan.get('secured'):
+                    trace.append('secured')
+                handle_security(node.obj)
+                return node.obj, remainder
+            if node.dynamic:
+                return self._resume(node.obj, remainder, prev, default, trace)
+
+            # are we traversing to another controller
+            if node.guarded:
+                if trace is not None:
+                    trace.append('secured')
+                cross_boundary(prev.obj, node.obj)
+
+            if remainder and remainder[0] == '':
+                if node.index is not None:
+                    if trace is not None and node.index._pecan.get('secured'):
+                        trace.append('secured')
+                    handle_security(node.index)
+                    return node.index, remainder[1:]
+            elif not remainder:
+                if node.index is not None:
+                    return NonCanonicalPath(node.index, [])
+            if node.default is not None:
+                default = (node.default, remainder)
+
+            if not remainder:
+                return default or NotFound
+
+            prev = node
+            node = node.children.get(remainder[0])
+            if node is None:
+                # the attribute exists, but isn't part of the trie
+                obj = getattr(prev.obj, remainder[0], None)
+                if obj is not None:
+                    return self._resume(obj, remainder[1:], prev, default, trace)
+                return default or NotFound
+            remainder = remainder[1:]
+
+    def _resume(self, obj, remainder, prev, default, trace):
+        # nodes before a dynamic one have no ``_lookup``, so the only
+        # handler collected so far is the innermost ``_default``
+        notfound_handlers = []
+        if default is not None:
+            notfound_handlers.append(('_default',) + default)
+        return _lookup_controller(
+            obj, remainder, trace, notfound_handlers,
+            prev.obj if prev is not None else None
+        )
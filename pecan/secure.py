@@ -1,10 +1,15 @@
 from inspect import getmembers, ismethod, isfunction
+from time import time
 from webob import exc
 
 from decorators import expose
-from util import _cfg, iscontroller
+from util import _cfg, iscontroller, LRUCache
 
-__all__ = ['unlocked', 'secure', 'SecureController']
+# pecan.core imports this module while routing is set up, so only refer to
+# its attributes at request time
+import core
+
+__all__ = ['unlocked', 'secure', 'SecureController', 'cache_permissions']
 
 class _SecureState(object):
     def __init__(self, desc, boolean_value):
@@ -106,6 +111,38 @@ def secure(func_or_obj, check_permissions_for_obj=None):
         return _SecuredAttribute(func_or_obj, check_permissions_for_obj)
 
 
+def cache_permissions(key, ttl=60, maxsize=1024):
+    """
+    Caches the result of a permission check across requests for ``ttl``
+    seconds. ``key`` is called with the same arguments as the check and
+    should return a hashable value identifying whoever is making the
+    request, e.g. the current user's id::
+
+        class AdminController(SecureController):
+            @classmethod
+            @cache_permissions(lambda cls: request.context['user_id'], ttl=30)
+            def check_permissions(cls):
+                return is_admin(request.context['user_id'])
+
+    At most ``maxsize`` results are kept, evicting the least recently used.
+    """
+    def decorate(check_permissions):
+        cache = LRUCache(maxsize)
+        def wrap(*args, **kwargs):
+            cache_key = (args, key(*args, **kwargs))
+            cached = cache.get(cache_key)
+            if cached is not None and cached[0] > time():
+                return cached[1]
+            result = check_permissions(*args, **kwargs)
+            cache.set(cache_key, (time() + ttl, result))
+            return result
+        wrap.__name__ = check_permissions.__name__
+        wrap.__doc__ = check_permissions.__doc__
+        wrap.cache = cache
+        return wrap
+    return decorate
+
+
 class SecureController(object):
     """
     Used to apply security to a controller. 
@@ -116,7 +153,7 @@ class SecureController(object):
     """
     class __metaclass__(type):
         def __init__(cls, name, bases, dict_):
-            cls._pecan = dict(secured=Protected, check_permissions=cls.check_permissions, unlocked=[])
+            cls._pecan = dict(secured=Protected, check_permissions=cls.check_permissions, unlocked=set())
 
             for name, value in getmembers(cls):
                 if ismethod(value):
@@ -127,7 +164,7 @@ class SecureController(object):
                     if name.startswith('__') and name.endswith('__'): continue
                     if isinstance(value, _UnlockedAttribute):
                         # mark it as unlocked and remove wrapper
-                        cls._pecan['unlocked'].append(value.obj)
+                        cls._pecan['unlocked'].add(value.obj)
                         setattr(cls, name, value.obj)
                     elif isinstance(value, _SecuredAttribute):
                         # The user has specified a different check_permissions
@@ -135,7 +172,7 @@ class SecureController(object):
                         # is concerned, this method is unlocked because 
                         # it is using a check_permissions function embedded in
                         # the _SecuredAttribute wrapper
-                        cls._pecan['unlocked'].append(value)
+                        cls._pecan['unlocked'].add(value)
 
     @classmethod
     def check_permissions(cls):
@@ -150,9 +187,33 @@ def handle_security(controller):
         if isinstance(check_permissions, basestring):
             check_permissions = getattr(controller.im_self, check_permissions)
 
-        if not check_permissions():
+        if not _memoized_check(check_permissions):
             raise exc.HTTPUnauthorized
 
+_missing = object()
+
+def _memoized_check(check_permissions):
+    """
+    Calls a permission check, at most once per request for each check and
+    the instance it is bound to.
+    """
+    try:
+        results = core.request.pecan.setdefault('permission_checks', {})
+    except AttributeError:
+        # not within a request
+        return check_permissions()
+
+    key = (getattr(check_permissions, 'im_func', check_permissions),
+           getattr(check_permissions, 'im_self', None))
+    try:
+        result = results.get(key, _missing)
+    except TypeError:
+        # unhashable instance, don't memoize
+        return check_permissions()
+    if result is _missing:
+        result = results[key] = check_permissions()
+    return result
+
 def cross_boundary(prev_obj, obj):
     """ Check permissions as we move between object instances. """
     if prev_obj is None:
@@ -164,5 +225,10 @@ def cross_boundary(prev_obj, obj):
         obj.parent = prev_obj
 
     if hasattr(prev_obj, '_pecan'):
-        if obj not in prev_obj._pecan.get('unlocked', []):
+        try:
+            unlocked = obj in prev_obj._pecan.get('unlocked', ())
+        except TypeError:
+            # unhashable objects can't have been unlocked
+            unlocked = False
+        if not unlocked:
             handle_security(prev_obj)
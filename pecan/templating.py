@@ -1,21 +1,156 @@
+from datetime import date
+from decimal import Decimal
+from inspect import getargspec
+from threading import Lock
+from time import time
+from UserDict import DictMixin
+
+from util import LRUCache, SingleFlight
+
 import cgi
+import os
+import sys
 
-__all__ = ['RendererFactory']
+__all__ = ['RendererFactory', 'RenderCache']
 
 _builtin_renderers = {}
 error_formatters = []
 
+#
+# Template reloading
+#
+
+class ReloadPolicy(object):
+    '''
+    Decides how often renderers check their templates for changes on disk.
+    
+    :param reload: ``True`` or ``'always'`` to check on every render,
+                   ``False`` or ``'off'`` to never check once a template is
+                   loaded, or a number of seconds to check at most once
+                   per that many seconds.
+    '''
+    
+    def __init__(self, reload=True):
+        if reload is True or reload == 'always':
+            self.interval = 0
+        elif reload is False or reload is None or reload == 'off':
+            self.interval = None
+        else:
+            try:
+                self.interval = float(reload)
+            except (TypeError, ValueError):
+                raise ValueError('Invalid template reload policy %r' % (reload,))
+        self.last_check = 0
+        self._lock = Lock()
+    
+    @property
+    def enabled(self):
+        return self.interval is not None
+    
+    @property
+    def always(self):
+        '''
+        Whether templates are checked on every render, in which case
+        renderers leave the checks to their engine's loader.
+        '''
+        return self.interval == 0
+    
+    def due(self):
+        '''
+        Returns whether templates should be checked for changes by the
+        render about to happen. With an interval, only one of the renders
+        happening once it has elapsed is told to check.
+        '''
+        if self.interval is None:
+            return False
+        if not self.interval:
+            return True
+        now = time()
+        if now - self.last_check < self.interval:
+            return False
+        self._lock.acquire()
+        try:
+            if now - self.last_check < self.interval:
+                return False
+            self.last_check = now
+            return True
+        finally:
+            self._lock.release()
+
+#
+# Template locations
+#
+
+def search_path(template_path):
+    '''
+    Returns a ``template_path`` (a directory, or a list of directories to
+    search in order) as a list of directories.
+    '''
+    if isinstance(template_path, basestring):
+        return [template_path]
+    return list(template_path)
+
+
+class TemplateIndex(object):
+    '''
+    An index of the templates found in a list of directories, mapping the
+    name of each template (its path relative to the directory it's in) to
+    the absolute path of its file. Built once, so that renderers can find a
+    template without searching each directory in turn. Templates added
+    after the index is built are still found by searching, and so are
+    templates whose indexed file has since been removed (renderers
+    ``discard`` the entry when they can't open the file).
+    
+    :param template_path: A directory, or a list of directories. When the
+                          same name exists in several of them, the first
+                          one wins.
+    '''
+    
+    def __init__(self, template_path):
+        self.templates = {}
+        for path in search_path(template_path):
+            path = os.path.abspath(path)
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+                for filename in filenames:
+                    filepath = os.path.join(dirpath, filename)
+                    name = os.path.relpath(filepath, path).replace(os.sep, '/')
+                    self.templates.setdefault(name, filepath)
+    
+    def find(self, name):
+        '''
+        Returns the absolute path of the template ``name``, or ``None``.
+        '''
+        return self.templates.get(name.lstrip('/'))
+    
+    def discard(self, name):
+        '''
+        Removes the template ``name`` from the index, e.g. once its file
+        turns out to be gone.
+        '''
+        self.templates.pop(name.lstrip('/'), None)
+    
+    def __contains__(self, name):
+        return self.find(name) is not None
+    
+    def __len__(self):
+        return len(self.templates)
+
 #
 # JSON rendering engine
 #
 
 class JsonRenderer(object):
-    def __init__(self, path, extra_vars):
-        pass
+    def __init__(self, path, extra_vars, json_backend=None):
+        from jsonify import make_encoder
+        self.encoder = make_encoder(json_backend)
     
     def render(self, template_path, namespace):
-        from jsonify import encode
-        return encode(namespace)
+        return self.encoder.encode(namespace)
+    
+    def stream(self, template_path, namespace):
+        from jsonify import iterencode
+        return buffered(iterencode(namespace, self.encoder))
 
 _builtin_renderers['json'] = JsonRenderer
 
@@ -25,18 +160,83 @@ _builtin_renderers['json'] = JsonRenderer
 # 
 
 try:
-    from genshi.template import (TemplateLoader,
+    from genshi.template import (Context, TemplateLoader,
                                 TemplateError as gTemplateError)
+    from genshi.util import LRUCache as GenshiLRUCache
+
+    def genshi_index_loader(index):
+        # a genshi load function finding templates through a TemplateIndex
+        def _load_from_index(filename):
+            # an IOError makes genshi search the rest of its search path
+            filepath = index.find(filename)
+            if filepath is None:
+                raise IOError('%s is not in the template index' % filename)
+            try:
+                fileobj = open(filepath, 'U')
+                mtime = os.path.getmtime(filepath)
+            except (IOError, OSError):
+                index.discard(filename)
+                raise IOError('%s is no longer at %s' % (filename, filepath))
+            def _uptodate():
+                try:
+                    return mtime == os.path.getmtime(filepath)
+                except OSError:
+                    return False
+            return filepath, filename, fileobj, _uptodate
+        return _load_from_index
 
     class GenshiRenderer(object):
-        def __init__(self, path, extra_vars):
-            self.loader = TemplateLoader([path], auto_reload=True)
+        layered_namespace = True
+
+        def __init__(self, path, extra_vars, reload=True, index=None):
+            self.reload = ReloadPolicy(reload)
+            paths = search_path(path)
+            if index is not None:
+                paths.insert(0, genshi_index_loader(index))
+            self.loader = TemplateLoader(paths, auto_reload=self.reload.always)
             self.extra_vars = extra_vars
+
+        def check(self):
+            # drops the templates which changed since they were loaded, so
+            # that they are loaded again; genshi's cache has no way to remove
+            # an entry, so the up to date ones are moved to a new cache (in
+            # order of use, least recent first)
+            loader = self.loader
+            loader._lock.acquire()
+            try:
+                cache = GenshiLRUCache(loader._cache.capacity)
+                for filename in reversed(list(loader._cache)):
+                    uptodate = loader._uptodate.get(filename)
+                    try:
+                        current = uptodate is None or uptodate()
+                    except OSError:
+                        current = False
+                    if current:
+                        cache[filename] = loader._cache[filename]
+                    else:
+                        loader._uptodate.pop(filename, None)
+                loader._cache = cache
+            finally:
+                loader._lock.release()
     
         def render(self, template_path, namespace):
+            return self.generate(template_path, namespace).render('html')
+
+        def stream(self, template_path, namespace):
+            return buffered(self.generate(template_path, namespace).serialize('html'))
+
+        def generate(self, template_path, namespace):
+            if not self.reload.always and self.reload.due():
+                self.check()
             tmpl = self.loader.load(template_path)
-            stream = tmpl.generate(**self.extra_vars.make_ns(namespace))
-            return stream.render('html')
+            # genshi looks names up through the frames of its context, so
+            # the layers of the namespace can be used as is, ahead of the
+            # frame holding genshi's own helpers (``defined`` and
+            # ``value_of``); a new frame on top takes any assignments
+            context = Context()
+            context.frames.extendleft(reversed(self.extra_vars.layer(namespace).maps))
+            context.push({})
+            return tmpl.generate(context)
 
     _builtin_renderers['genshi'] = GenshiRenderer
  
@@ -57,14 +257,62 @@ except ImportError:                                 #pragma no cover
 try:
     from mako.lookup import TemplateLookup
     from mako.exceptions import CompileException, SyntaxException, \
-            html_error_template
+            TemplateLookupException, html_error_template
+
+    class IndexedTemplateLookup(TemplateLookup):
+        '''
+        A ``TemplateLookup`` which loads templates it hasn't loaded yet
+        through a ``TemplateIndex``, rather than searching each directory.
+        '''
+
+        def __init__(self, index, **kwargs):
+            TemplateLookup.__init__(self, **kwargs)
+            self.index = index
+
+        def get_template(self, uri):
+            if uri not in self._collection:
+                filename = self.index.find(uri)
+                if filename is not None:
+                    try:
+                        return self._load(filename, uri)
+                    except (IOError, OSError):
+                        # the file was removed since it was indexed
+                        self.index.discard(uri)
+            return TemplateLookup.get_template(self, uri)
 
     class MakoRenderer(object):
-        def __init__(self, path, extra_vars):
-            self.loader = TemplateLookup(directories=[path], output_encoding='utf-8')
+        layered_namespace = True
+
+        def __init__(self, path, extra_vars, cache_dir=None, reload=True, index=None):
+            module_directory = None
+            if cache_dir:
+                module_directory = os.path.join(cache_dir, 'mako')
+            self.reload = ReloadPolicy(reload)
+            options = dict(directories=search_path(path), output_encoding='utf-8',
+                           module_directory=module_directory,
+                           filesystem_checks=self.reload.always)
+            if index is not None:
+                self.loader = IndexedTemplateLookup(index, **options)
+            else:
+                self.loader = TemplateLookup(**options)
             self.extra_vars = extra_vars
     
+        def compile(self, template_path):
+            self.loader.get_template(template_path)
+
+        def check(self):
+            # reloads the templates which changed since they were loaded
+            # (including those looked up while rendering, e.g. inherited)
+            for uri, tmpl in self.loader._collection.items():
+                try:
+                    self.loader._check(uri, tmpl)
+                except TemplateLookupException:
+                    # the template was removed
+                    pass
+
         def render(self, template_path, namespace):
+            if not self.reload.always and self.reload.due():
+                self.check()
             tmpl = self.loader.get_template(template_path)
             return tmpl.render(**self.extra_vars.make_ns(namespace))
 
@@ -87,11 +335,19 @@ try:
     from kajiki.loader import FileLoader
 
     class KajikiRenderer(object):
-        def __init__(self, path, extra_vars):
-            self.loader = FileLoader(path, reload=True)
+        layered_namespace = True
+
+        def __init__(self, path, extra_vars, reload=True):
+            self.reload = ReloadPolicy(reload)
+            # kajiki's loader only supports a single directory
+            self.loader = FileLoader(search_path(path)[0], reload=self.reload.always)
             self.extra_vars = extra_vars
 
         def render(self, template_path, namespace):
+            if not self.reload.always and self.reload.due():
+                # kajiki has no way to check a loaded template, so load
+                # them all again
+                self.loader.modules.clear()
             Template = self.loader.import_(template_path)
             stream = Template(self.extra_vars.make_ns(namespace))
             return stream.render()
@@ -104,17 +360,99 @@ except ImportError:                                 # pragma no cover
 # Jinja2 rendering engine
 #
 try:
-    from jinja2 import Environment, FileSystemLoader
+    from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
     from jinja2.exceptions import TemplateSyntaxError as jTemplateSyntaxError
 
+    class IndexedFileSystemLoader(FileSystemLoader):
+        '''
+        A ``FileSystemLoader`` which finds templates through a
+        ``TemplateIndex``, rather than searching each directory.
+        '''
+
+        def __init__(self, index, searchpath, **kwargs):
+            FileSystemLoader.__init__(self, searchpath, **kwargs)
+            self.index = index
+
+        def get_source(self, environment, template):
+            filename = self.index.find(template)
+            if filename is not None:
+                try:
+                    f = open(filename, 'rb')
+                    mtime = os.path.getmtime(filename)
+                except (IOError, OSError):
+                    # the file was removed since it was indexed
+                    self.index.discard(template)
+                    filename = None
+            if filename is None:
+                return FileSystemLoader.get_source(self, environment, template)
+            try:
+                contents = f.read().decode(self.encoding)
+            finally:
+                f.close()
+            def uptodate():
+                try:
+                    return os.path.getmtime(filename) == mtime
+                except OSError:
+                    return False
+            return contents, filename, uptodate
+
     class JinjaRenderer(object):
-        def __init__(self, path, extra_vars):
-            self.env = Environment(loader=FileSystemLoader(path))
+        layered_namespace = True
+
+        def __init__(self, path, extra_vars, cache_dir=None, reload=True, index=None):
+            bytecode_cache = None
+            if cache_dir:
+                directory = os.path.join(cache_dir, 'jinja')
+                if not os.path.isdir(directory):
+                    os.makedirs(directory)
+                bytecode_cache = FileSystemBytecodeCache(directory)
+            self.reload = ReloadPolicy(reload)
+            if index is not None:
+                loader = IndexedFileSystemLoader(index, search_path(path))
+            else:
+                loader = FileSystemLoader(search_path(path))
+            self.env = Environment(loader=loader,
+                                   bytecode_cache=bytecode_cache,
+                                   auto_reload=self.reload.always)
             self.extra_vars = extra_vars
 
+        def check(self):
+            # drops the templates which changed since they were loaded
+            cache = self.env.cache
+            if cache is None:
+                return
+            for key, template in cache.items():
+                if not template.is_up_to_date:
+                    try:
+                        del cache[key]
+                    except KeyError:
+                        pass
+
+        def compile(self, template_path):
+            self.env.get_template(template_path)
+
         def render(self, template_path, namespace):
+            return u''.join(self.generate(template_path, namespace))
+
+        def stream(self, template_path, namespace):
+            return buffered(self.generate(template_path, namespace))
+
+        def generate(self, template_path, namespace):
+            # like Template.generate, but with a context which shares the
+            # layers of the namespace instead of copying them into a dict
+            if not self.reload.always and self.reload.due():
+                self.check()
             template = self.env.get_template(template_path)
-            return template.render(self.extra_vars.make_ns(namespace))
+            namespace = self.extra_vars.layer(namespace)
+            namespace.maps.append(template.globals)
+            try:
+                for event in template.root_render_func(template.new_context(namespace, shared=True)):
+                    yield event
+            except Exception:
+                exc_info = sys.exc_info()
+            else:
+                return
+            yield self.env.handle_exception(exc_info, True)
     _builtin_renderers['jinja'] = JinjaRenderer
 
     def format_jinja_error(exc_value):
@@ -126,6 +464,27 @@ try:
 except ImportError:                                 # pragma no cover
     pass
 
+#
+# streaming helper function
+#
+def buffered(chunks, size=8192):
+    '''
+    Joins the (often tiny) chunks generated by a template into chunks of
+    at least ``size`` characters, so that a streamed response isn't
+    written to the client a tag at a time.
+    '''
+    buf = []
+    length = 0
+    for chunk in chunks:
+        buf.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield u''.join(buf)
+            buf = []
+            length = 0
+    if buf:
+        yield u''.join(buf)
+
 #
 # format helper function
 #
@@ -149,6 +508,60 @@ def format_line_context(filename, lineno, context=10):
 #
 # Extra Vars Rendering 
 #
+class LayeredNamespace(DictMixin):
+    '''
+    A template namespace made of layers of mappings, looked up in order,
+    so that a namespace can be built from the controller's namespace,
+    helpers and extra template variables without copying any of them.
+    Assignments go to the first layer.
+    '''
+
+    def __init__(self, *maps):
+        self.maps = list(maps)
+
+    def __getitem__(self, key):
+        for mapping in self.maps:
+            if key in mapping:
+                return mapping[key]
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        for mapping in self.maps:
+            if key in mapping:
+                return True
+        return False
+
+    has_key = __contains__
+
+    def __setitem__(self, key, value):
+        self.maps[0][key] = value
+
+    def __delitem__(self, key):
+        del self.maps[0][key]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def keys(self):
+        keys = set()
+        for mapping in self.maps:
+            keys.update(mapping.keys())
+        return list(keys)
+
+    def flatten(self):
+        '''
+        Returns the namespace as a single ``dict``, for engines which
+        only accept one.
+        '''
+        val = {}
+        for mapping in reversed(self.maps):
+            val.update(mapping)
+        return val
+
+
 class ExtraNamespace(object):
     def __init__(self, extras={}):
         self.namespace = dict(extras)
@@ -156,7 +569,21 @@ class ExtraNamespace(object):
     def update(self, d):
         self.namespace.update(d)
 
+    def layer(self, ns):
+        '''
+        Returns a ``LayeredNamespace`` of ``ns`` over the extra variables.
+        '''
+        if isinstance(ns, LayeredNamespace):
+            maps = list(ns.maps)
+        else:
+            maps = [ns]
+        if self.namespace:
+            maps.append(self.namespace)
+        return LayeredNamespace(*maps)
+
     def make_ns(self, ns):
+        if isinstance(ns, LayeredNamespace):
+            return self.layer(ns).flatten()
         if self.namespace:
             val = {}
             val.update(self.namespace)
@@ -165,15 +592,253 @@ class ExtraNamespace(object):
         else:
             return ns
 
+#
+# Render Cache
+#
+_plain_types = (basestring, int, long, float, Decimal, bool, date, type(None))
+
+def freeze(value):
+    '''
+    Converts a namespace into a hashable, order-independent key. Only plain
+    data (strings, numbers, dates, ``None`` and containers of them) can be
+    frozen: other objects, e.g. models, may change without changing their
+    identity, so ``TypeError`` is raised for them.
+    '''
+    if isinstance(value, dict):
+        return (dict, tuple(sorted([(k, freeze(v)) for k, v in value.iteritems()])))
+    if isinstance(value, (list, tuple)):
+        return (list, tuple([freeze(v) for v in value]))
+    if isinstance(value, (set, frozenset)):
+        return (set, frozenset([freeze(v) for v in value]))
+    if isinstance(value, _plain_types):
+        # values which compare equal can still render differently (e.g. 1
+        # and True)
+        return (value.__class__, value)
+    raise TypeError('%r is not plain data' % (value,))
+
+
+def _freeze_argument(value):
+    if callable(value):
+        return callable
+    return freeze(value)
+
+
+class RenderCacheStats(object):
+    '''
+    A snapshot of the usage of a ``RenderCache``.
+    '''
+
+    def __init__(self, hits, misses, entries, size):
+        self.hits = hits
+        self.misses = misses
+        self.entries = entries
+        self.size = size
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        if not lookups:
+            return 0.0
+        return float(self.hits) / lookups
+
+    def __repr__(self):
+        return '<RenderCacheStats hits=%d misses=%d hit_rate=%.2f entries=%d size=%d>' % (
+            self.hits, self.misses, self.hit_rate, self.entries, self.size
+        )
+
+
+class RenderCache(object):
+    '''
+    An LRU cache of rendered templates (and named fragments of them). By
+    default, renders are keyed by the template and the values of its
+    namespace, as long as it is made of plain data (strings, numbers, dates,
+    ``None`` and lists, tuples, sets and dicts of them); renders of other
+    namespaces need a ``key`` function to be cached.
+
+    :param maxsize: The maximum number of rendered templates to keep.
+    :param ttl: The number of seconds to keep a rendered template for, or
+                ``None`` to keep it until it is evicted.
+    :param key: An optional function called with the template and the
+                namespace, which returns the key to cache the render under,
+                or ``None`` to skip the cache for this render.
+    :param stale: The number of seconds past its ``ttl`` an expired render
+                  may still be served for to other threads, while the first
+                  thread to find it expired renders it again.
+    :param coalesce: A boolean indicating if threads missing the cache for
+                     the same render should wait for the first of them to
+                     render it, rather than all rendering it at once.
+    :param timeout: The number of seconds a thread waits for another one
+                    rendering the same template, at most, before rendering
+                    it itself.
+    '''
+
+    def __init__(self, maxsize=128, ttl=None, key=None, stale=0, coalesce=True,
+                 timeout=10):
+        self.ttl = ttl
+        self.key = key
+        self.stale = stale
+        self.flights = None
+        if coalesce:
+            self.flights = SingleFlight(timeout)
+        self.hits = 0
+        self.misses = 0
+        self._lock = Lock()
+        self._cache = LRUCache(maxsize)
+
+    def make_key(self, template, namespace):
+        if self.key is not None:
+            key = self.key(template, namespace)
+            if key is None:
+                return None
+            return (template, key)
+        try:
+            return (template, freeze(namespace))
+        except TypeError:
+            return None
+
+    def render(self, template, namespace, render):
+        '''
+        Returns the cached output of ``render()``, which renders
+        ``template`` with ``namespace``.
+        '''
+        key = self.make_key(template, namespace)
+        if key is None:
+            return render()
+        return self.cached(key, render)
+
+    def fragment(self, name, render, *args, **kwargs):
+        '''
+        Returns the cached output of ``render(*args, **kwargs)``, cached
+        under ``name`` and the values of the arguments. Callable arguments
+        (e.g. a template's def, passed to its ``capture`` function) are
+        taken to be part of what ``name`` stands for; if any other argument
+        isn't plain data, the fragment is rendered without the cache.
+        '''
+        key = self.fragment_key(name, args, kwargs)
+        if key is None:
+            return render(*args, **kwargs)
+        return self.cached(key, render, *args, **kwargs)
+
+    def fragment_key(self, name, args, kwargs):
+        try:
+            return (
+                'fragment',
+                name,
+                tuple([_freeze_argument(arg) for arg in args]),
+                freeze(dict([
+                    (k, v) for k, v in kwargs.iteritems() if not callable(v)
+                ]))
+            )
+        except TypeError:
+            return None
+
+    def lookup(self, key):
+        '''
+        Returns the ``(expires, output)`` cached under ``key``, unless it
+        expired more than ``stale`` seconds ago.
+        '''
+        cached = self._cache.get(key)
+        if cached is not None and cached[0] is not None and \
+                cached[0] + self.stale <= time():
+            return None
+        return cached
+
+    def cached(self, key, render, *args, **kwargs):
+        leading = False
+        cached = self.lookup(key)
+        if cached is None and self.flights is not None:
+            leading = self.flights.acquire(key)
+            if not leading:
+                # another thread has rendered it meanwhile (unless the wait
+                # timed out)
+                cached = self.lookup(key)
+        if cached is not None:
+            expires, output = cached
+            if expires is None or expires > time():
+                self.count(hit=True)
+                return output
+            # serve the stale render while a single thread renders it again
+            if self.flights is not None:
+                leading = self.flights.acquire(key, wait=False)
+                if not leading:
+                    self.count(hit=True)
+                    return output
+        self.count(hit=False)
+        try:
+            output = render(*args, **kwargs)
+            expires = None
+            if self.ttl is not None:
+                expires = time() + self.ttl
+            self._cache.set(key, (expires, output))
+        finally:
+            if leading:
+                self.flights.release(key)
+        return output
+
+    def count(self, hit):
+        self._lock.acquire()
+        try:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        self._cache.clear()
+
+    @property
+    def stats(self):
+        return RenderCacheStats(
+            self.hits,
+            self.misses,
+            len(self._cache),
+            sum([len(output) for expires, output in self._cache.values()])
+        )
+
 #
 # Rendering Factory
 #
+def renderer_options(cls, options):
+    '''
+    Picks out the subset of ``options`` accepted as keyword arguments by
+    the renderer class ``cls``, so that custom renderers only need to
+    accept the options they support.
+    '''
+    
+    if not options:
+        return {}
+    try:
+        argspec = getargspec(cls.__init__)
+    except TypeError:
+        # e.g., a class which doesn't define __init__ at all
+        return {}
+    if argspec[2]:
+        return dict(options)
+    return dict(
+        (name, value) for name, value in options.items() if name in argspec[0]
+    )
+
+
 class RendererFactory(object):
-    def __init__(self, custom_renderers={}, extra_vars={}):
+    def __init__(self, custom_renderers={}, extra_vars={}, cache_dir=None,
+                 reload=True, index=False, json_backend=None):
         self._renderers = {}
+        self._indexes = {}
+        self.indexed = index
         self._renderer_classes = dict(_builtin_renderers)
         self.add_renderers(custom_renderers)
         self.extra_vars = ExtraNamespace(extra_vars)
+        self.options = {}
+        if cache_dir:
+            self.options['cache_dir'] = cache_dir
+        if reload is not True:
+            # validate the policy up front, rather than on first render
+            ReloadPolicy(reload)
+            self.options['reload'] = reload
+        if json_backend:
+            self.options['json_backend'] = json_backend
 
     def add_renderers(self, custom_dict):
         self._renderer_classes.update(custom_dict)
@@ -181,11 +846,29 @@ class RendererFactory(object):
     def available(self, name):
         return name in self._renderer_classes
 
+    def index(self, template_path):
+        '''
+        Returns the ``TemplateIndex`` of ``template_path``, building it the
+        first time.
+        '''
+        key = tuple(search_path(template_path))
+        if key not in self._indexes:
+            self._indexes[key] = TemplateIndex(key)
+        return self._indexes[key]
+
     def get(self, name, template_path):
-        if name not in self._renderers:
+        # a renderer is created for each engine and list of directories
+        key = (name, tuple(search_path(template_path)))
+        if key not in self._renderers:
             cls = self._renderer_classes.get(name)
             if cls is None:
                 return None
-            else:
-                self._renderers[name] = cls(template_path, self.extra_vars)
-        return self._renderers[name]
+            options = dict(self.options)
+            if self.indexed:
+                options['index'] = self.index(template_path)
+            self._renderers[key] = cls(
+                template_path,
+                self.extra_vars,
+                **renderer_options(cls, options)
+            )
+        return self._renderers[key]
@@ -1,3 +1,5 @@
+from threading import Event, Lock
+
 import sys
 import os
 
@@ -29,3 +31,163 @@ else:                             #pragma no cover
     splitext = compat_splitext
 
 
+class ClosingIterator(object):
+    '''
+    Wraps a WSGI ``app_iter``, calling ``callback`` once the server closes
+    it (after the ``app_iter`` itself has been closed).
+    '''
+
+    def __init__(self, app_iter, callback):
+        self.app_iter = app_iter
+        self.callback = callback
+
+    def __iter__(self):
+        return iter(self.app_iter)
+
+    def close(self):
+        try:
+            if hasattr(self.app_iter, 'close'):
+                self.app_iter.close()
+        finally:
+            self.callback()
+
+
+class LRUCache(object):
+    '''
+    A thread-safe mapping holding at most ``maxsize`` entries, which
+    evicts the least recently used entry once it is full. The number of
+    lookups that found (``hits``) or missed (``misses``) an entry is
+    tracked to help size the cache.
+    '''
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._lock = Lock()
+        self._data = {}
+        # circular doubly linked list of [prev, next, key, value] links,
+        # ordered from least to most recently used
+        self._root = root = []
+        root[:] = [root, root, None, None]
+
+    def _unlink(self, link):
+        prev, next = link[0], link[1]
+        prev[1] = next
+        next[0] = prev
+
+    def _append(self, link):
+        root = self._root
+        last = root[0]
+        last[1] = root[0] = link
+        link[0] = last
+        link[1] = root
+
+    def get(self, key, default=None):
+        self._lock.acquire()
+        try:
+            link = self._data.get(key)
+            if link is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._unlink(link)
+            self._append(link)
+            return link[3]
+        finally:
+            self._lock.release()
+
+    def set(self, key, value):
+        self._lock.acquire()
+        try:
+            link = self._data.get(key)
+            if link is not None:
+                link[3] = value
+                self._unlink(link)
+            else:
+                if len(self._data) >= self.maxsize:
+                    oldest = self._root[1]
+                    self._unlink(oldest)
+                    del self._data[oldest[2]]
+                link = [None, None, key, value]
+                self._data[key] = link
+            self._append(link)
+        finally:
+            self._lock.release()
+
+    def delete(self, key):
+        self._lock.acquire()
+        try:
+            link = self._data.pop(key, None)
+            if link is not None:
+                self._unlink(link)
+        finally:
+            self._lock.release()
+
+    def values(self):
+        self._lock.acquire()
+        try:
+            return [link[3] for link in self._data.itervalues()]
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._data.clear()
+            self._root[:] = [self._root, self._root, None, None]
+        finally:
+            self._lock.release()
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SingleFlight(object):
+    '''
+    Coordinates threads computing the same values, so that a single thread
+    (the leader) computes the value for a key at a time, while the others
+    wait for it to finish rather than computing it too.
+
+    :param timeout: The number of seconds to wait for the leader at most,
+                    or ``None`` to wait for as long as it takes.
+    '''
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+        self._lock = Lock()
+        self._flights = {}
+
+    def acquire(self, key, wait=True):
+        '''
+        Returns True if the caller is to compute the value for ``key``, in
+        which case it must call ``release(key)`` once done. Otherwise, waits
+        for the thread computing it to be done (unless ``wait`` is False),
+        or for ``timeout`` to pass, and returns False.
+        '''
+        self._lock.acquire()
+        try:
+            event = self._flights.get(key)
+            if event is None:
+                self._flights[key] = Event()
+                return True
+        finally:
+            self._lock.release()
+        if wait:
+            event.wait(self.timeout)
+        return False
+
+    def release(self, key):
+        self._lock.acquire()
+        try:
+            event = self._flights.pop(key, None)
+        finally:
+            self._lock.release()
+        if event is not None:
+            event.set()
+
+    def __len__(self):
+        return len(self._flights)
@@ -68,6 +68,7 @@ setup(
     pecan-serve = pecan.commands:ServeCommand
     pecan-shell = pecan.commands:ShellCommand
     pecan-create = pecan.commands:CreateCommand
+    pecan-compile-templates = pecan.commands:CompileTemplatesCommand
     
     [paste.paster_create_template]
     pecan-base = pecan.templates:BaseTemplate
@@ -5,7 +5,9 @@ from webtest import TestApp
 
 from pecan import Pecan, expose, request, response, redirect, abort, make_app, override_template, render
 from pecan.templating import _builtin_renderers as builtin_renderers, error_formatters
-from pecan.decorators import accept_noncanonical
+from pecan.caching import MemoryBackend
+from pecan.decorators import accept_noncanonical, cache
+from pecan.util import _cfg
 
 import os
 
@@ -514,6 +516,37 @@ class TestBase(TestCase):
         
         assert state.__dict__.keys() == ['app']
 
+    def test_generator_response(self):
+        from pecan.core import state
+        
+        class RootController(object):
+            @expose()
+            def index(self):
+                def chunks():
+                    # the request is still available while streaming
+                    yield request.path
+                    for i in range(3):
+                        yield u'\u2603%d' % i
+                return chunks()
+        
+        app = TestApp(Pecan(RootController()))
+        r = app.get('/')
+        assert r.status_int == 200
+        assert r.body == u'/\u26030\u26031\u26032'.encode('utf-8')
+        assert state.__dict__.keys() == ['app']
+        
+        # the body is generated as the server iterates over it
+        headers = []
+        from webob import Request
+        app_iter = Pecan(RootController())(
+            Request.blank('/').environ,
+            lambda status, headerlist: headers.extend(headerlist)
+        )
+        assert 'Content-Length' not in dict(headers)
+        assert iter(app_iter).next() == '/'
+        app_iter.close()
+        assert state.__dict__.keys() == ['app']
+
     def test_extension(self):
         """
         Test extension splits
@@ -649,7 +682,245 @@ class TestBase(TestCase):
         r = app.get('/sub/')
         assert r.status_int == 200
         assert 'subindex' in r.body
-    
+
+    def test_precompiled_routes(self):
+        class LookupController(object):
+            def __init__(self, someID):
+                self.someID = someID
+
+            @expose()
+            def index(self):
+                return '/lookup/%s' % self.someID
+
+        class DefaultController(object):
+            @expose()
+            def index(self):
+                return '/default/'
+
+            @expose()
+            def _default(self, *remainder):
+                return '_default: %s' % ', '.join(remainder)
+
+        class SubController(object):
+            @expose()
+            def index(self):
+                return '/sub/'
+
+            @expose()
+            def deeper(self, *args):
+                return '/sub/deeper: %s' % ', '.join(args)
+
+            @expose()
+            def _lookup(self, someID, *remainder):
+                return LookupController(someID), remainder
+
+        class RootController(object):
+            @expose()
+            def index(self):
+                return '/'
+
+            @expose()
+            def deeper(self, *args):
+                return '/deeper: %s' % ', '.join(args)
+
+            sub = SubController()
+            default = DefaultController()
+
+        pecan_app = Pecan(RootController(), precompile_routes=True)
+        assert pecan_app.route_trie.lookup(['deeper', 'a'])[1] == ['a']
+        controller, remainder = pecan_app.route_trie.lookup(['sub', 'deeper'])
+        assert controller.__name__ == 'deeper' and remainder == []
+
+        app = TestApp(pecan_app)
+        r = app.get('/')
+        assert r.status_int == 200
+        assert r.body == '/'
+
+        r = app.get('/sub/')
+        assert r.status_int == 200
+        assert r.body == '/sub/'
+
+        r = app.get('/sub', status=302)
+        assert r.status_int == 302
+
+        r = app.get('/sub/deeper/a/b')
+        assert r.status_int == 200
+        assert r.body == '/sub/deeper: a, b'
+
+        r = app.get('/sub/100/')
+        assert r.status_int == 200
+        assert r.body == '/lookup/100'
+
+        r = app.get('/default/')
+        assert r.status_int == 200
+        assert r.body == '/default/'
+
+        r = app.get('/default/a/b')
+        assert r.status_int == 200
+        assert r.body == '_default: a, b'
+
+        r = app.get('/missing', status=404)
+        assert r.status_int == 404
+
+    def test_precompiled_routes_resume(self):
+        from pecan.routing import RouteTrie, lookup_controller
+        from pecan.secure import SecureController
+
+        calls = []
+
+        class LookupController(object):
+            def __init__(self, someID):
+                self.someID = someID
+
+            @expose()
+            def index(self):
+                return '/lookup/%s' % self.someID
+
+        class MoreController(object):
+            @expose()
+            def _lookup(self, someID, *remainder):
+                return LookupController(someID), remainder
+
+        class ThingsController(object):
+            more = MoreController()
+
+        class SecretController(SecureController):
+            things = ThingsController()
+
+            @classmethod
+            def check_permissions(cls):
+                calls.append('check')
+                return True
+
+        class RootController(object):
+            secret = SecretController()
+
+            @property
+            def current(self):
+                calls.append('property')
+                return LookupController('current')
+
+        root = RootController()
+        trie = RouteTrie(root)
+
+        # properties are left to be read at request time
+        assert calls == []
+        controller, remainder = trie.lookup(['current', ''])
+        assert controller.im_self.someID == 'current' and remainder == []
+        assert calls == ['property']
+
+        # a walk through a _lookup resumes where the trie stopped, so the
+        # security checks of the path leading to it run once
+        del calls[:]
+        controller, remainder = trie.lookup(['secret', 'things', 'more', '5', ''])
+        assert controller.im_self.someID == '5' and remainder == ()
+        assert calls == ['check']
+
+        del calls[:]
+        controller, remainder = lookup_controller(root, ['secret', 'things', 'more', '5', ''])
+        assert controller.im_self.someID == '5' and remainder == ()
+        assert calls == ['check']
+
+        app = TestApp(Pecan(root, precompile_routes=True))
+        assert app.get('/secret/things/more/5/').body == '/lookup/5'
+        assert app.get('/current/').body == '/lookup/current'
+
+    def test_route_cache(self):
+        class LookupController(object):
+            def __init__(self, someID):
+                self.someID = someID
+
+            @expose()
+            def index(self):
+                return '/lookup/%s' % self.someID
+
+        class SubController(object):
+            @expose()
+            def _lookup(self, someID, *remainder):
+                return LookupController(someID), remainder
+
+        class RootController(object):
+            @expose()
+            def index(self):
+                return '/'
+
+            @expose()
+            def args(self, *args):
+                return '/args: %s' % ', '.join(args)
+
+            sub = SubController()
+
+        pecan_app = Pecan(RootController(), route_cache_size=2)
+        cache = pecan_app.route_cache
+        app = TestApp(pecan_app)
+
+        r = app.get('/args/a/b')
+        assert r.body == '/args: a, b'
+        assert (cache.hits, cache.misses) == (0, 1)
+
+        r = app.get('/args/a/b')
+        assert r.body == '/args: a, b'
+        assert (cache.hits, cache.misses) == (1, 1)
+
+        # routes going through _lookup are never cached
+        for i in range(2):
+            r = app.get('/sub/100/')
+            assert r.body == '/lookup/100'
+        assert len(cache) == 1
+        assert ('GET', '/sub/100/') not in cache
+
+        # the least recently used route is evicted
+        app.get('/')
+        app.post('/')
+        assert len(cache) == 2
+        assert ('GET', '/args/a/b') not in cache
+        assert ('POST', '/') in cache
+
+    def test_routing_sentinels(self):
+        from pecan.routing import _lookup_controller, NonCanonicalPath, NotFound
+
+        class SubController(object):
+            @expose()
+            def index(self):
+                return '/sub/'
+
+        class RootController(object):
+            @expose()
+            def index(self):
+                return '/'
+
+            sub = SubController()
+
+        root = RootController()
+        assert _lookup_controller(root, ['missing']) is NotFound
+        assert _lookup_controller(root, ['sub', 'missing']) is NotFound
+
+        result = _lookup_controller(root, ['sub'])
+        assert isinstance(result, NonCanonicalPath)
+        assert result.controller == root.sub.index
+
+        assert _lookup_controller(root, ['sub', '']) == (root.sub.index, [])
+
+    def test_compiled_binder(self):
+        class RootController(object):
+            @expose()
+            def eater(self, id, dummy=None, *args, **kwargs):
+                pass
+
+        binder = RootController.eater._pecan['binder']
+        assert binder.positional == ('id', 'dummy')
+        assert binder.defaults == {'dummy': None}
+        assert binder.varargs and binder.varkw
+
+        params = {'dummy': 'd', 'extra': 'e'}
+        args, kwargs = binder.bind(params, ['1', '2', '3'])
+        assert args == ['1', '2', '3']
+        assert kwargs == {'extra': 'e'}
+
+        args, kwargs = binder.bind({'id': '1'}, [])
+        assert args == ['1', None]
+        assert kwargs == {}
+
     def test_proxy(self):
         class RootController(object):
             @expose()
@@ -664,6 +935,315 @@ class TestBase(TestCase):
         r = app.get('/')
         assert r.status_int == 200
 
+    def test_greenlet_local_state(self):
+        try:
+            from greenlet import greenlet
+        except ImportError:
+            return
+        from pecan.core import ContextLocal
+
+        local = ContextLocal()
+        local.value = 'main'
+        seen = []
+
+        def child():
+            assert not hasattr(local, 'value')
+            local.value = 'child'
+            parent.switch()
+            seen.append(local.value)
+
+        parent = greenlet.getcurrent()
+        g = greenlet(child)
+        g.switch()
+        assert local.value == 'main'
+        g.switch()
+        assert seen == ['child']
+        assert local.__dict__ == {'value': 'main'}
+        del local.value
+        assert not hasattr(local, 'value')
+
+    def test_etag(self):
+        class RootController(object):
+            @expose()
+            def index(self):
+                return 'Hello, World!'
+            
+            @expose(etag=False)
+            def untagged(self):
+                return 'Hello, World!'
+        
+        app = TestApp(Pecan(RootController(), etag=True))
+        r = app.get('/')
+        assert r.status_int == 200
+        etag = r.headers['ETag']
+        
+        # the client already has the response
+        r = app.get('/', headers={'If-None-Match': etag})
+        assert r.status_int == 304
+        assert r.body == ''
+        
+        # the response changed
+        r = app.get('/', headers={'If-None-Match': '"outdated"'})
+        assert r.status_int == 200
+        assert r.body == 'Hello, World!'
+        
+        r = app.get('/untagged')
+        assert r.status_int == 200
+        assert 'ETag' not in r.headers
+    
+    def test_controller_etag(self):
+        from datetime import datetime
+        
+        calls = []
+        modified = datetime(2012, 1, 1)
+        
+        def document_etag(self, name):
+            return 'v1-%s' % name
+        
+        def document_modified(self, name):
+            return modified
+        
+        class RootController(object):
+            @expose(etag=document_etag)
+            def document(self, name):
+                calls.append(name)
+                return 'Document %s' % name
+            
+            @expose(last_modified=document_modified)
+            def dated(self, name):
+                calls.append(name)
+                return 'Document %s' % name
+        
+        app = TestApp(make_app(RootController()))
+        r = app.get('/document/a')
+        assert r.status_int == 200
+        assert r.headers['ETag'] == '"v1-a"'
+        assert calls == ['a']
+        
+        # the controller isn't called when the client has the response
+        r = app.get('/document/a', headers={'If-None-Match': '"v1-a"'})
+        assert r.status_int == 304
+        assert calls == ['a']
+        
+        r = app.get('/document/b', headers={'If-None-Match': '"v1-a"'})
+        assert r.status_int == 200
+        assert calls == ['a', 'b']
+        
+        r = app.get('/dated/c', headers={'If-Modified-Since': 'Sun, 01 Jan 2012 00:00:00 GMT'})
+        assert r.status_int == 304
+        r = app.get('/dated/c', headers={'If-Modified-Since': 'Sat, 31 Dec 2011 00:00:00 GMT'})
+        assert r.status_int == 200
+        assert r.headers['Last-Modified'] == 'Sun, 01 Jan 2012 00:00:00 GMT'
+        assert calls == ['a', 'b', 'c']
+
+
+    def test_cache(self):
+        calls = []
+        
+        class RootController(object):
+            @expose('json')
+            @cache(ttl=60, params=['page'], headers=['Accept-Language'])
+            def listing(self, page='1', other=None):
+                calls.append((page, other))
+                response.headers['X-Page'] = page
+                return dict(page=page, language=request.headers.get('Accept-Language'))
+            
+            @expose()
+            @cache()
+            def counter(self):
+                calls.append('counter')
+                return 'Count %d' % len(calls)
+            
+            @expose()
+            @cache()
+            def cookie(self):
+                calls.append('cookie')
+                response.set_cookie('session', 'abc')
+                return 'Cookie'
+            
+            @expose()
+            @cache()
+            def missing(self):
+                calls.append('missing')
+                abort(404)
+        
+        app = TestApp(Pecan(RootController()))
+        r = app.get('/listing.json?page=2')
+        assert r.status_int == 200
+        assert r.headers['X-Page'] == '2'
+        assert calls == [('2', None)]
+        
+        # parameters which aren't varied on don't miss the cache
+        r2 = app.get('/listing.json?page=2&other=x')
+        assert r2.body == r.body
+        assert r2.headers['X-Page'] == '2'
+        assert r2.headers['Content-Type'] == 'application/json; charset=UTF-8'
+        assert calls == [('2', None)]
+        
+        # the path, the page and the language are all varied on
+        app.get('/listing?page=2')
+        app.get('/listing.json?page=3')
+        app.get('/listing.json?page=2', headers={'Accept-Language': 'fr'})
+        assert len(calls) == 4
+        
+        # HEAD requests are answered from the cache too
+        r = app.head('/listing.json?page=2')
+        assert r.status_int == 200
+        assert len(calls) == 4
+        
+        # without params, the whole query string is varied on
+        assert app.get('/counter').body == 'Count 5'
+        assert app.get('/counter').body == 'Count 5'
+        assert app.get('/counter?a=1').body == 'Count 6'
+        
+        # responses which set cookies or aren't 200 OK aren't cached
+        app.get('/cookie')
+        app.get('/cookie')
+        assert calls.count('cookie') == 2
+        app.get('/missing', status=404)
+        app.get('/missing', status=404)
+        assert calls.count('missing') == 2
+        
+        options = _cfg(RootController.counter.im_func)['cache']
+        assert (options.hits, options.misses) == (1, 2)
+        options.clear()
+        assert app.get('/counter').body == 'Count 11'
+    
+    def test_cache_request_headers(self):
+        from pecan.hooks import PecanHook
+        
+        ids = []
+        class RequestIdHook(PecanHook):
+            def before(self, state):
+                ids.append(len(ids))
+                state.response.headers['X-Request-Id'] = str(ids[-1])
+        
+        class RootController(object):
+            @expose(content_type='text/plain')
+            @cache(ttl=60)
+            def index(self):
+                response.headers['X-Generated'] = 'yes'
+                return 'Hello, World!'
+        
+        app = TestApp(Pecan(RootController(), hooks=[RequestIdHook()]))
+        responses = [app.get('/') for i in range(3)]
+        assert [r.headers['X-Request-Id'] for r in responses] == ['0', '1', '2']
+        for r in responses:
+            assert r.headers.getall('X-Request-Id') == [r.headers['X-Request-Id']]
+            assert r.headers['X-Generated'] == 'yes'
+            assert r.headers['Content-Type'].startswith('text/plain')
+            assert r.body == 'Hello, World!'
+    
+    def test_cache_backend(self):
+        backend = MemoryBackend(maxsize=2)
+        
+        class RootController(object):
+            @expose()
+            @cache(ttl=60, backend=backend)
+            def index(self, name):
+                return 'Hello, %s!' % name
+            
+            @expose(etag=True)
+            @cache(ttl=-1, backend=backend)
+            def expired(self):
+                return 'Expired'
+        
+        app = TestApp(Pecan(RootController()))
+        app.get('/?name=a')
+        app.get('/?name=b')
+        assert len(backend) == 2
+        app.get('/?name=c')
+        assert len(backend) == 2
+        
+        # a cached ETag still answers conditional requests
+        r = app.get('/expired')
+        etag = r.headers['ETag']
+        assert app.get('/expired', headers={'If-None-Match': etag}).status_int == 304
+
+    
+    def test_cache_coalescing(self):
+        from threading import Event, Thread
+        
+        calls = []
+        started = Event()
+        proceed = Event()
+        
+        class RootController(object):
+            @expose()
+            @cache(ttl=60)
+            def index(self):
+                calls.append('index')
+                started.set()
+                proceed.wait()
+                return 'Hello, World!'
+            
+            @expose()
+            @cache(ttl=-1, stale=60)
+            def stale(self):
+                calls.append('stale')
+                if len(calls) > 1:
+                    started.set()
+                    proceed.wait()
+                return 'Stale %d' % len(calls)
+            
+            @expose()
+            @cache(ttl=60, timeout=0.05)
+            def slow(self):
+                calls.append('slow')
+                call = len(calls)
+                if call == 1:
+                    started.set()
+                    proceed.wait()
+                return 'Slow %d' % call
+        
+        app = TestApp(Pecan(RootController()))
+        bodies = []
+        def get(path):
+            bodies.append(app.get(path).body)
+        
+        # concurrent requests wait for the first one's response
+        threads = [Thread(target=get, args=('/',)) for i in range(4)]
+        threads[0].start()
+        started.wait()
+        for thread in threads[1:]:
+            thread.start()
+        proceed.set()
+        for thread in threads:
+            thread.join()
+        assert calls == ['index']
+        assert bodies == ['Hello, World!'] * 4
+        
+        # an expired response is served while one request computes it again
+        del calls[:]
+        del bodies[:]
+        started.clear()
+        proceed.clear()
+        assert app.get('/stale').body == 'Stale 1'
+        refresh = Thread(target=get, args=('/stale',))
+        refresh.start()
+        started.wait()
+        assert app.get('/stale').body == 'Stale 1'
+        proceed.set()
+        refresh.join()
+        assert bodies == ['Stale 2']
+        assert calls == ['stale', 'stale']
+        
+        # waiting for a request which hangs gives up after the timeout
+        del calls[:]
+        del bodies[:]
+        started.clear()
+        proceed.clear()
+        hung = Thread(target=get, args=('/slow',))
+        hung.start()
+        started.wait()
+        assert app.get('/slow').body == 'Slow 2'
+        proceed.set()
+        hung.join()
+        assert bodies == ['Slow 1']
+        
+        options = _cfg(RootController.index.im_func)['cache']
+        assert len(options.flights) == 0
+
 
 class TestEngines(object):
     
@@ -746,6 +1326,136 @@ class TestEngines(object):
                     break
         assert error_msg is not None
    
+    def test_streaming_templates(self):
+        from types import GeneratorType
+        
+        for engine in ('jinja', 'genshi'):
+            if engine not in builtin_renderers:
+                continue
+            
+            class RootController(object):
+                @expose('%s:%s.html' % (engine, engine), stream=True)
+                def index(self, name='Jonathan'):
+                    return dict(name=name)
+                
+                @expose('%s:%s.html' % (engine, engine), stream=True, htmlfill=True)
+                def invalid(self, name='Jonathan'):
+                    request.pecan['validation_errors'] = {'name': 'Invalid'}
+                    return dict(name=name)
+            
+            app = TestApp(Pecan(RootController(), template_path=self.template_path))
+            r = app.get('/')
+            assert r.status_int == 200
+            assert "<h1>Hello, Jonathan!</h1>" in r.body
+            assert isinstance(r.controller_output, GeneratorType)
+            
+            # htmlfill needs the whole document, so it isn't streamed
+            r = app.get('/invalid')
+            assert r.status_int == 200
+            assert "<h1>Hello, Jonathan!</h1>" in r.body
+            assert isinstance(r.controller_output, basestring)
+
+    def test_render_cache(self):
+        from pecan.core import fragment
+        from pecan.templating import RenderCache
+        
+        sidebars = []
+        def sidebar():
+            sidebars.append(True)
+            return 'sidebar'
+        
+        class RootController(object):
+            @expose('mako.html')
+            def index(self, name='Jonathan'):
+                return dict(name=name)
+            
+            @expose()
+            def sidebar(self):
+                return fragment('sidebar', sidebar)
+        
+        cache = RenderCache()
+        app = TestApp(Pecan(RootController(), template_path=self.template_path, render_cache=cache))
+        for i in range(3):
+            r = app.get('/')
+            assert "<h1>Hello, Jonathan!</h1>" in r.body
+        r = app.get('/?name=World')
+        assert "<h1>Hello, World!</h1>" in r.body
+        assert (cache.stats.hits, cache.stats.misses) == (2, 2)
+        
+        for i in range(2):
+            assert app.get('/sidebar').body == 'sidebar'
+        assert len(sidebars) == 1
+
+    def test_namespace_is_not_copied(self):
+        from pecan.templating import LayeredNamespace
+        
+        class NamespaceRenderer(object):
+            layered_namespace = True
+            
+            def __init__(self, path, extra_vars):
+                self.extra_vars = extra_vars
+            
+            def render(self, template_path, namespace):
+                namespace = self.extra_vars.layer(namespace)
+                assert isinstance(namespace, LayeredNamespace)
+                return '%s %s %s' % (
+                    namespace['name'], namespace['extra'], namespace['error_for']('name')
+                )
+        
+        result = dict(name='Jonathan')
+        class RootController(object):
+            @expose('ns:index.html')
+            def index(self):
+                return result
+        
+        app = TestApp(Pecan(
+            RootController(),
+            custom_renderers={'ns': NamespaceRenderer},
+            extra_template_vars={'extra': 'extra'}
+        ))
+        r = app.get('/')
+        assert r.body == 'Jonathan extra '
+        # the controller's namespace isn't modified
+        assert result == dict(name='Jonathan')
+        
+        # other renderers are given a plain dict
+        class DictRenderer(object):
+            def __init__(self, path, extra_vars):
+                pass
+            
+            def render(self, template_path, namespace):
+                assert type(namespace) is dict
+                namespace = namespace.copy()
+                return '%s %s' % (namespace['name'], namespace['error_for']('name'))
+        
+        class RootController(object):
+            @expose('dict:index.html')
+            def index(self):
+                return result
+            
+            @expose('dict:index.html')
+            def shadowed(self):
+                return dict(name='Jonathan', error_for=lambda name: 'own')
+        
+        app = TestApp(Pecan(RootController(), custom_renderers={'dict': DictRenderer}))
+        assert app.get('/').body == 'Jonathan '
+        assert app.get('/shadowed').body == 'Jonathan own'
+        assert result == dict(name='Jonathan')
+        
+        for engine in ('jinja', 'genshi'):
+            if engine not in builtin_renderers:
+                continue
+            
+            class RootController(object):
+                @expose('%s:%s.html' % (engine, engine))
+                def index(self):
+                    return result
+            
+            app = TestApp(Pecan(RootController(), template_path=self.template_path))
+            r = app.get('/')
+            assert "<h1>Hello, Jonathan!</h1>" in r.body
+            assert result == dict(name='Jonathan')
+
     def test_mako(self):
         if 'mako' not in builtin_renderers:
             return
@@ -0,0 +1,154 @@
+from gzip import GzipFile
+from StringIO import StringIO
+from unittest import TestCase
+from webtest import TestApp
+
+from pecan import Pecan, expose, make_app, conf
+from pecan.compression import CompressionMiddleware, negotiate
+
+import zlib
+
+
+def gunzip(data):
+    return GzipFile(fileobj=StringIO(data)).read()
+
+
+class TestCompression(TestCase):
+
+    def make_app(self, **kw):
+        class RootController(object):
+            @expose()
+            def index(self):
+                return 'Hello, World! ' * 100
+
+            @expose()
+            def small(self):
+                return 'Hello, World!'
+
+            @expose(content_type='image/png')
+            def image(self):
+                return 'PNG' * 500
+
+            @expose(content_type='text/plain')
+            def stream(self):
+                def lines():
+                    for i in range(100):
+                        yield 'line %d\n' % i
+                return lines()
+
+            @expose(etag=True)
+            def tagged(self):
+                return 'Hello, World! ' * 100
+
+        return TestApp(CompressionMiddleware(Pecan(RootController()), **kw))
+
+    def test_negotiate(self):
+        assert negotiate('') is None
+        assert negotiate('gzip') == 'gzip'
+        assert negotiate('deflate') == 'deflate'
+        assert negotiate('gzip, deflate') == 'gzip'
+        assert negotiate('gzip;q=0.5, deflate') == 'deflate'
+        assert negotiate('gzip;q=0, deflate;q=0') is None
+        assert negotiate('identity') is None
+        assert negotiate('*') == 'gzip'
+        assert negotiate('*, gzip;q=0') == 'deflate'
+
+    def test_gzip(self):
+        app = self.make_app()
+        r = app.get('/', headers={'Accept-Encoding': 'gzip'})
+        assert r.status_int == 200
+        assert r.headers['Content-Encoding'] == 'gzip'
+        assert r.headers['Vary'] == 'Accept-Encoding'
+        assert gunzip(r.body) == 'Hello, World! ' * 100
+
+    def test_deflate(self):
+        app = self.make_app(level=9)
+        r = app.get('/', headers={'Accept-Encoding': 'deflate'})
+        assert r.status_int == 200
+        assert r.headers['Content-Encoding'] == 'deflate'
+        assert zlib.decompress(r.body) == 'Hello, World! ' * 100
+
+    def test_not_accepted(self):
+        app = self.make_app()
+        r = app.get('/')
+        assert r.status_int == 200
+        assert 'Content-Encoding' not in r.headers
+        # caches still need to know the response depends on the header
+        assert r.headers['Vary'] == 'Accept-Encoding'
+        assert r.body == 'Hello, World! ' * 100
+
+        r = app.get('/', headers={'Accept-Encoding': 'identity'})
+        assert 'Content-Encoding' not in r.headers
+
+    def test_skipped_responses(self):
+        app = self.make_app()
+        r = app.get('/small', headers={'Accept-Encoding': 'gzip'})
+        assert 'Content-Encoding' not in r.headers
+        assert r.body == 'Hello, World!'
+
+        r = app.get('/image', headers={'Accept-Encoding': 'gzip'})
+        assert 'Content-Encoding' not in r.headers
+        assert 'Vary' not in r.headers
+        assert r.body == 'PNG' * 500
+
+        r = app.get('/missing', headers={'Accept-Encoding': 'gzip'}, status=404)
+        assert 'Content-Encoding' not in r.headers
+
+        r = app.get('/', headers={'Accept-Encoding': 'gzip;q=0'})
+        assert 'Content-Encoding' not in r.headers
+
+        app = self.make_app(min_size=10, content_types=['image/png'])
+        r = app.get('/small', headers={'Accept-Encoding': 'gzip'})
+        assert 'Content-Encoding' not in r.headers
+        r = app.get('/image', headers={'Accept-Encoding': 'gzip'})
+        assert r.headers['Content-Encoding'] == 'gzip'
+        assert gunzip(r.body) == 'PNG' * 500
+
+    def test_head(self):
+        app = self.make_app()
+        get = app.get('/tagged', headers={'Accept-Encoding': 'gzip'})
+        head = app.head('/tagged', headers={'Accept-Encoding': 'gzip'})
+        assert head.status_int == 200
+        assert head.body == ''
+        for name in ('Content-Encoding', 'Vary', 'ETag'):
+            assert head.headers[name] == get.headers[name]
+
+    def test_streamed_response(self):
+        app = self.make_app()
+        r = app.get('/stream', headers={'Accept-Encoding': 'gzip'})
+        assert r.status_int == 200
+        assert r.headers['Content-Encoding'] == 'gzip'
+        assert gunzip(r.body) == ''.join(['line %d\n' % i for i in range(100)])
+
+    def test_etag(self):
+        app = self.make_app()
+        r = app.get('/tagged', headers={'Accept-Encoding': 'gzip'})
+        etag = r.headers['ETag']
+        assert etag.startswith('W/"')
+
+        r = app.get('/tagged', headers={
+            'Accept-Encoding': 'gzip',
+            'If-None-Match': etag
+        })
+        assert r.status_int == 304
+        # the 304 carries the headers of the response it stands for
+        assert r.headers['ETag'] == etag
+        assert r.headers['Vary'] == 'Accept-Encoding'
+
+    def test_make_app(self):
+        class RootController(object):
+            @expose()
+            def index(self):
+                return 'Hello, World! ' * 100
+
+        r = TestApp(make_app(RootController())).get('/', headers={'Accept-Encoding': 'gzip'})
+        assert 'Content-Encoding' not in r.headers
+
+        conf.app.compression.update({'enabled': True})
+        try:
+            app = TestApp(make_app(RootController()))
+            r = app.get('/', headers={'Accept-Encoding': 'gzip'})
+            assert r.headers['Content-Encoding'] == 'gzip'
+            assert gunzip(r.body) == 'Hello, World! ' * 100
+        finally:
+            conf.app.compression.update({'enabled': False})
@@ -1,7 +1,8 @@
-from pecan import make_app, expose, request, redirect
+from pecan import make_app, expose, request, redirect, Pecan
 from pecan.core import state
 from pecan.hooks import PecanHook, TransactionHook, HookController
 from pecan.decorators import transactional
+from pecan.util import _cfg
 from formencode import Schema, validators
 from webtest import TestApp
 
@@ -195,6 +196,65 @@ class TestHooks(object):
         assert run_hook[8] == 'after2'
         assert run_hook[9] == 'after3'
     
+    def test_hook_pipeline(self):
+        run_hook = []
+        
+        class RootController(object):
+            @expose()
+            def index(self):
+                run_hook.append('inside')
+                return 'Hello, World!'
+        
+        class BeforeHook(PecanHook):
+            def before(self, state):
+                run_hook.append('before')
+        
+        class AfterHook(PecanHook):
+            priority = 1
+            def after(self, state):
+                run_hook.append('after')
+        
+        papp = Pecan(RootController(), hooks=[BeforeHook(), AfterHook()])
+        app = TestApp(papp)
+        response = app.get('/')
+        assert response.status_int == 200
+        assert run_hook == ['before', 'inside', 'after']
+        
+        pipeline = papp.determine_hooks(RootController.index)
+        assert [type(h) for h in pipeline] == [AfterHook, BeforeHook]
+        assert pipeline.on_route == pipeline.on_error == ()
+        assert len(pipeline.before) == len(pipeline.after) == 1
+        
+        # pipelines are cached until the hooks or their priorities change
+        assert papp.determine_hooks(RootController.index) is pipeline
+        papp.hooks[1].priority = 200
+        pipeline = papp.determine_hooks(RootController.index)
+        assert [type(h) for h in pipeline] == [BeforeHook, AfterHook]
+        assert papp.determine_hooks(RootController.index) is pipeline
+        
+        # including when they're changed in place
+        del run_hook[:]
+        papp.hooks.remove(papp.hooks[0])
+        app.get('/')
+        assert run_hook == ['inside', 'after']
+        
+        del run_hook[:]
+        papp.hooks.append(BeforeHook())
+        app.get('/')
+        assert run_hook == ['before', 'inside', 'after']
+        
+        papp.hooks = [AfterHook()]
+        pipeline = papp.determine_hooks(RootController.index)
+        assert [type(h) for h in pipeline] == [AfterHook]
+        
+        _cfg(RootController.index.im_func)['hooks'] = [BeforeHook()]
+        try:
+            pipeline = papp.determine_hooks(RootController.index)
+            assert [type(h) for h in pipeline] == [AfterHook, BeforeHook]
+            assert papp.determine_hooks(RootController.index) is pipeline
+        finally:
+            del _cfg(RootController.index.im_func)['hooks']
+    
     def test_transaction_hook(self):
         run_hook = []
         
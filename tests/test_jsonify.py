@@ -11,7 +11,7 @@ except ImportError:
     create_engine = None
 from unittest              import TestCase
 
-from pecan.jsonify         import jsonify, encode, ResultProxy, RowProxy
+from pecan.jsonify         import jsonify, encode, iterencode, ResultProxy, RowProxy
 from pecan                 import Pecan, expose, request
 from webtest               import TestApp
 from webob.multidict       import MultiDict, UnicodeMultiDict
@@ -100,6 +100,13 @@ class TestJsonifyGenericEncoder(TestCase):
         result = encode(d)
         assert loads(result) == float(d)
 
+        from pecan.jsonify import decimal_to_float
+        for value in ('1.1', '-2.5e-300', '12345678901234567890.123', '100',
+                      '-0', 'Infinity', '-Infinity'):
+            d = Decimal(value)
+            assert repr(decimal_to_float(d)) == repr(float(d))
+        assert repr(decimal_to_float(Decimal('NaN'))) == 'nan'
+
     def test_multidict(self):
         md = MultiDict()
         md.add('arg', 'foo')
@@ -112,6 +119,154 @@ class TestJsonifyGenericEncoder(TestCase):
 
         self.assertRaises(TypeError, encode, Foo())
 
+    def test_dispatch_cache(self):
+        from pecan.jsonify import _converters
+
+        class Animal(object):
+            def __json__(self):
+                return 'animal'
+        class Dog(Animal): pass
+
+        assert loads(encode([Dog(), Dog()])) == ['animal', 'animal']
+        assert Dog in _converters
+
+        # registering a rule invalidates the conversions resolved so far
+        @jsonify.when_type(Dog)
+        def jsonify_dog(obj):
+            return 'dog'
+        assert Dog not in _converters
+        assert loads(encode([Animal(), Dog()])) == ['animal', 'dog']
+
+        # rules for specific objects take precedence
+        rex = Dog()
+        @jsonify.when_object(rex)
+        def jsonify_rex(obj):
+            return 'rex'
+        assert loads(encode([Dog(), rex])) == ['dog', 'rex']
+
+    def test_compiled_serializers(self):
+        from pecan.jsonify import _converters, SAObjectSerializer
+
+        class User(object):
+            # a mapped class, as far as pecan.jsonify is concerned
+            _sa_class_manager = dict(id=None, first_name=None, last_name=None)
+            def __init__(self, **kw):
+                self._sa_instance_state = 'state'
+                self.__dict__.update(kw)
+
+        # only the attributes loaded on each object are exported
+        users = [User(id=1, first_name='Jonathan'), User(id=2)]
+        assert loads(encode(users)) == [
+            {'id': 1, 'first_name': 'Jonathan'}, {'id': 2}
+        ]
+        assert isinstance(_converters[User], SAObjectSerializer)
+
+        # as are attributes the mapper doesn't know about
+        user = User(id=3, last_name='Roman')
+        user.nickname = 'yoann'
+        assert loads(encode(user)) == {
+            'id': 3, 'last_name': 'Roman', 'nickname': 'yoann'
+        }
+
+        # attributes added to the mapper later on are picked up
+        User._sa_class_manager['email'] = None
+        assert loads(encode(User(id=4, email='x@example.com'))) == {
+            'id': 4, 'email': 'x@example.com'
+        }
+
+        # and rules registered for the class replace the serializer
+        @jsonify.when_type(User)
+        def jsonify_user(obj):
+            return obj.id
+        assert loads(encode(users)) == [1, 2]
+
+    def test_json_backend(self):
+        from pecan.jsonify import make_encoder
+        today = date.today()
+
+        backends = ['json']
+        try:
+            import simplejson
+            backends.append('simplejson')
+        except ImportError:
+            pass
+
+        for backend in backends:
+            encoder = make_encoder(backend)
+            assert encoder.__class__.__module__.startswith(backend)
+            result = encode(dict(today=today, price=Decimal('1.5')), encoder)
+            assert loads(result) == {'today': str(today), 'price': 1.5}
+
+        # modules which only provide dumps (e.g. ujson) are given objects
+        # converted beforehand
+        import json
+        import sys
+        import types
+        module = types.ModuleType('dumps_only_json')
+        def dumps(obj):
+            return json.dumps(obj)
+        module.dumps = dumps
+        sys.modules['dumps_only_json'] = module
+        try:
+            encoder = make_encoder('dumps_only_json')
+            result = encode(dict(today=today, items=(Decimal('1.5'), iter([today]))), encoder)
+            assert loads(result) == {'today': str(today), 'items': [1.5, [str(today)]]}
+            result = ''.join(iterencode([dict(today=today)] * 300, encoder))
+            assert loads(result) == [{'today': str(today)}] * 300
+        finally:
+            del sys.modules['dumps_only_json']
+
+        class RootController(object):
+            @expose('json')
+            def index(self):
+                return dict(today=today)
+
+        app = TestApp(Pecan(RootController(), json_backend='json'))
+        r = app.get('/')
+        assert r.status_int == 200
+        assert loads(r.body) == {'today': str(today)}
+
+    def test_iterencode(self):
+        today = date.today()
+        for obj in (
+            1,
+            'text',
+            [],
+            [1, 'two', {'three': 3}],
+            {'items': (1, 2), 'nested': {'items': [today]}, 1: None},
+            {'name': 'no lists', 'today': today}
+        ):
+            assert ''.join(iterencode(obj)) == encode(obj)
+
+        # iterators are encoded as lists, an item at a time
+        chunks = iterencode(dict(squares=(i * i for i in range(3))))
+        assert loads(''.join(chunks)) == {'squares': [0, 1, 4]}
+
+    def test_streaming_json(self):
+        class RootController(object):
+            @expose('json', stream=True)
+            def index(self):
+                return dict(numbers=iter(range(5000)))
+
+        app = TestApp(Pecan(RootController()))
+        r = app.get('/')
+        assert r.status_int == 200
+        assert r.content_type == 'application/json'
+        assert loads(r.body) == {'numbers': range(5000)}
+
+        # the body is encoded as the server iterates over it
+        from webob import Request
+        headers = []
+        app_iter = Pecan(RootController())(
+            Request.blank('/').environ,
+            lambda status, headerlist: headers.extend(headerlist)
+        )
+        assert 'Content-Length' not in dict(headers)
+        chunks = list(app_iter)
+        app_iter.close()
+        assert len(chunks) > 1
+        assert loads(''.join(chunks)) == {'numbers': range(5000)}
+
 class TestJsonifySQLAlchemyGenericEncoder(TestCase):
     
     def setUp(self):
@@ -197,6 +352,13 @@ class TestJsonifySQLAlchemyGenericEncoder(TestCase):
             {'id': 1, 'first_name': 'Jonathan', 'last_name': 'LaCour'},
             {'id': 2, 'first_name': 'Yoann', 'last_name': 'Roman'}
         ]}
+
+    def test_stream_result_proxy(self):
+        result = ''.join(iterencode(dict(users=self.result_proxy)))
+        assert loads(result) == {'users': {'count': 2, 'rows': [
+            {'id': 1, 'first_name': 'Jonathan', 'last_name': 'LaCour'},
+            {'id': 2, 'first_name': 'Yoann', 'last_name': 'Roman'}
+        ]}}
     
     def test_row_proxy(self):
         result = encode(self.row_proxy)
@@ -725,3 +725,57 @@ class TestRestController(object):
         r = app.get('/foos/0/bars/0/bazs/0')
         assert r.status_int == 200
         assert r.body == 'zero-zero-zero'
+    
+    def test_dispatch_table(self):
+        
+        class ThingsController(RestController):
+            
+            _custom_actions = {'count': ['GET']}
+            
+            @expose()
+            def get_one(self, id):
+                return 'ONE %s' % id
+            
+            @expose()
+            def get_count(self):
+                return 'COUNT'
+            
+            @expose()
+            def post_options(self):
+                return 'OPTIONS'
+        
+        class MoreThingsController(ThingsController):
+            
+            @expose()
+            def get_all(self):
+                return 'ALL'
+        
+        table = ThingsController._dispatch_table()
+        assert ThingsController._dispatch_table() is table
+        assert table.get_method == 'get_one'
+        assert table.fixed_args == 1
+        assert table.custom_actions == {'count': frozenset(['get'])}
+        assert table.actions[('post', 'options')] == 'post_options'
+        assert 'get_all' not in table.exposed
+        assert 'get_all' in MoreThingsController._dispatch_table().exposed
+        
+        class RootController(object):
+            things = ThingsController()
+            more = MoreThingsController()
+        
+        app = TestApp(make_app(RootController()))
+        
+        r = app.get('/things/1')
+        assert r.body == 'ONE 1'
+        
+        r = app.get('/things/count')
+        assert r.body == 'COUNT'
+        
+        r = app.get('/things', status=404)
+        assert r.status_int == 404
+        
+        r = app.get('/more')
+        assert r.body == 'ALL'
+        
+        r = app.post('/more', {'_method': 'options'})
+        assert r.body == 'OPTIONS'
@@ -1,6 +1,7 @@
 from unittest import TestCase
 
 from pecan import expose, make_app
+from pecan.decorators import cache
 from pecan.secure import secure, unlocked, SecureController, Protected
 from webtest import TestApp
 
@@ -159,6 +160,132 @@ class TestSecure(object):
         assert response.status_int == 200
         assert response.body == 'Hello from sub!'
 
+    def test_secured_routes_are_not_cached(self):
+        authorized = []
+
+        class SecretController(SecureController):
+            @expose()
+            def index(self):
+                return 'Index'
+
+            @classmethod
+            def check_permissions(cls):
+                return bool(authorized)
+
+        class RootController(object):
+            @expose()
+            @secure(lambda: bool(authorized))
+            def locked(self):
+                return 'Locked'
+
+            secret = SecretController()
+
+        app = TestApp(make_app(RootController(), route_cache_size=10))
+        for path in ('/locked', '/secret/'):
+            response = app.get(path, expect_errors=True)
+            assert response.status_int == 401
+            authorized.append(True)
+            response = app.get(path)
+            assert response.status_int == 200
+            authorized.pop()
+            response = app.get(path, expect_errors=True)
+            assert response.status_int == 401
+
+    def test_permissions_checked_once_per_request(self):
+        checks = []
+
+        class SecretController(SecureController):
+            @expose()
+            def index(self):
+                return 'Index'
+
+            @expose()
+            def _lookup(self, id, *remainder):
+                return SecretController(), remainder
+
+            @classmethod
+            def check_permissions(cls):
+                checks.append(cls)
+                return True
+
+        class RootController(object):
+            secret = SecretController()
+
+        # both _lookup and index are protected by the same check
+        app = TestApp(make_app(RootController()))
+        response = app.get('/secret/1/')
+        assert response.status_int == 200
+        assert response.body == 'Index'
+        assert len(checks) == 1
+
+        response = app.get('/secret/1/')
+        assert response.status_int == 200
+        assert len(checks) == 2
+
+    def test_cache_permissions(self):
+        from pecan.secure import cache_permissions
+        checks = []
+        user = ['alice']
+
+        @cache_permissions(lambda: user[0], ttl=60)
+        def check_permissions():
+            checks.append(user[0])
+            return user[0] == 'alice'
+
+        assert check_permissions() is True
+        assert check_permissions() is True
+        assert checks == ['alice']
+
+        user[0] = 'bob'
+        assert check_permissions() is False
+        assert checks == ['alice', 'bob']
+
+        @cache_permissions(lambda: user[0], ttl=-1)
+        def expired():
+            checks.append('expired')
+            return True
+
+        expired()
+        expired()
+        assert checks.count('expired') == 2
+
+    def test_cached_response(self):
+        authorized = [True]
+        calls = []
+
+        class SecretController(SecureController):
+            @expose()
+            @cache(ttl=60)
+            def index(self):
+                calls.append('index')
+                return 'Secret'
+
+            @classmethod
+            def check_permissions(cls):
+                return authorized[0]
+
+        class RootController(object):
+            @expose()
+            @secure(lambda: authorized[0])
+            @cache(ttl=60)
+            def locked(self):
+                calls.append('locked')
+                return 'Locked'
+
+            secret = SecretController()
+
+        app = TestApp(make_app(RootController()))
+        assert app.get('/secret/').body == 'Secret'
+        assert app.get('/locked').body == 'Locked'
+        assert app.get('/secret/').body == 'Secret'
+        assert app.get('/locked').body == 'Locked'
+        assert calls == ['index', 'locked']
+
+        # cached responses are still only served to authorized clients
+        authorized[0] = False
+        assert app.get('/secret/', expect_errors=True).status_int == 401
+        assert app.get('/locked', expect_errors=True).status_int == 401
+
     def test_state_attribute(self):
         from pecan.secure import Any, Protected
         assert repr(Any) == '<SecureState Any>'
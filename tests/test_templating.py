@@ -26,3 +26,345 @@ class TestTemplate(TestCase):
 
         self.assertEqual(extra_vars.make_ns({'bar':2}), {'foo':1, 'bar':2})
         self.assertEqual(extra_vars.make_ns({'foo':2}), {'foo':2})
+
+    def test_template_cache(self):
+        import os
+        import shutil
+        import tempfile
+
+        template_path = os.path.join(os.path.dirname(__file__), 'templates')
+        cache_dir = tempfile.mkdtemp()
+        try:
+            rf = RendererFactory(cache_dir=cache_dir)
+            mako = rf.get('mako', template_path)
+            mako.compile('mako.html')
+            assert os.listdir(os.path.join(cache_dir, 'mako')) == ['mako.html.py']
+
+            jinja = rf.get('jinja', template_path)
+            jinja.compile('jinja.html')
+            assert len(os.listdir(os.path.join(cache_dir, 'jinja'))) == 1
+
+            # a new renderer loads the compiled template from the cache
+            mako = RendererFactory(cache_dir=cache_dir).get('mako', template_path)
+            template = mako.loader.get_template('mako.html')
+            assert template.module.__file__.startswith(cache_dir)
+
+            # renderers which don't take a cache_dir still work
+            class CustomRenderer(object):
+                def __init__(self, path, extra_vars):
+                    pass
+            rf.add_renderers({'custom': CustomRenderer})
+            assert isinstance(rf.get('custom', template_path), CustomRenderer)
+        finally:
+            shutil.rmtree(cache_dir)
+
+    def test_reload_policy(self):
+        from pecan.templating import ReloadPolicy
+
+        always = ReloadPolicy(True)
+        assert always.enabled and always.due() and always.due()
+        assert ReloadPolicy('always').due()
+
+        for value in (False, None, 'off'):
+            off = ReloadPolicy(value)
+            assert not off.enabled
+            assert not off.due()
+
+        # an interval of 0 seconds checks on every render
+        for value in (0, 0.0, '0'):
+            zero = ReloadPolicy(value)
+            assert zero.enabled
+            assert zero.due() and zero.due()
+
+        every = ReloadPolicy(60)
+        assert every.enabled
+        assert every.due()
+        assert not every.due()
+        every.last_check -= 60
+        assert every.due()
+
+        # only one of the renders happening once the interval has elapsed
+        # is told to check
+        from threading import Thread
+        every.last_check -= 61
+        results = []
+        threads = [Thread(target=lambda: results.append(every.due())) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert results.count(True) == 1
+
+        self.assertRaises(ValueError, ReloadPolicy, 'sometimes')
+        self.assertRaises(ValueError, RendererFactory, reload='sometimes')
+
+    def test_template_reload(self):
+        import os
+        import shutil
+        import tempfile
+        import time
+
+        template_path = tempfile.mkdtemp()
+        filename = os.path.join(template_path, 'page.html')
+        def write(body):
+            f = open(filename, 'w')
+            f.write('<p>%s</p>' % body)
+            f.close()
+            # make sure the modification time changes
+            mtime = time.time() + 10
+            os.utime(filename, (mtime, mtime))
+
+        try:
+            write('first')
+            for engine in ('mako', 'jinja', 'genshi'):
+                if not self.rf.available(engine):
+                    continue
+                off = RendererFactory(reload=False).get(engine, template_path)
+                on = RendererFactory().get(engine, template_path)
+                every = RendererFactory(reload=60).get(engine, template_path)
+                assert 'first' in off.render('page.html', {})
+                assert 'first' in on.render('page.html', {})
+                assert 'first' in every.render('page.html', {})
+                write('second')
+                assert 'first' in off.render('page.html', {})
+                assert 'second' in on.render('page.html', {})
+                # not checked again until the interval has elapsed
+                assert 'first' in every.render('page.html', {})
+                every.reload.last_check -= 61
+                assert 'second' in every.render('page.html', {})
+                if engine == 'genshi':
+                    # checked by the renderer, not by switching on the
+                    # loader's own checks
+                    assert every.loader.auto_reload is False
+                write('first')
+        finally:
+            shutil.rmtree(template_path)
+
+    def test_genshi_namespace(self):
+        import os
+        import shutil
+        import tempfile
+
+        if not self.rf.available('genshi'):
+            return
+        template_path = tempfile.mkdtemp()
+        try:
+            f = open(os.path.join(template_path, 'page.html'), 'w')
+            f.write('<p>${defined} ${value_of} ${extra}</p>')
+            f.close()
+            rf = RendererFactory(extra_vars={'extra': 'extra'})
+            renderer = rf.get('genshi', template_path)
+            # the controller's names come before genshi's own helpers
+            namespace = {'defined': 'mine', 'value_of': 'also mine'}
+            assert renderer.render('page.html', namespace) == \
+                '<p>mine also mine extra</p>'
+            assert rf.extra_vars.namespace == {'extra': 'extra'}
+        finally:
+            shutil.rmtree(template_path)
+
+    def test_render_cache(self):
+        from pecan.templating import RenderCache
+
+        renders = []
+        def render(output):
+            def f():
+                renders.append(output)
+                return output
+            return f
+
+        cache = RenderCache(maxsize=2)
+        assert cache.render('a.html', {'x': [1]}, render('a1')) == 'a1'
+        assert cache.render('a.html', {'x': [1]}, render('a2')) == 'a1'
+        assert cache.render('a.html', {'x': [2]}, render('a3')) == 'a3'
+        assert cache.render('b.html', {'x': [1]}, render('b1')) == 'b1'
+        assert renders == ['a1', 'a3', 'b1']
+
+        stats = cache.stats
+        assert (stats.hits, stats.misses, stats.entries) == (1, 3, 2)
+        assert stats.size == len('a3') + len('b1')
+        assert stats.hit_rate == 0.25
+
+        # namespaces of anything but plain data aren't cached
+        assert cache.render('a.html', {'x': [{}.keys]}, render('c1')) == 'c1'
+        assert cache.render('a.html', {'x': [{}.keys]}, render('c2')) == 'c2'
+        class Model(object):
+            pass
+        model = Model()
+        assert cache.render('a.html', {'x': model}, render('c3')) == 'c3'
+        assert cache.render('a.html', {'x': model}, render('c4')) == 'c4'
+        assert renders[-4:] == ['c1', 'c2', 'c3', 'c4']
+
+        # values which compare equal but render differently are kept apart
+        from datetime import datetime
+        from decimal import Decimal
+        assert cache.render('d.html', {'x': 1}, render('d1')) == 'd1'
+        assert cache.render('d.html', {'x': True}, render('d2')) == 'd2'
+        assert cache.render('d.html', {'x': 1}, render('d3')) == 'd1'
+        assert cache.render('d.html', {'x': [('a', 1)]}, render('d4')) == 'd4'
+        assert cache.render('d.html', {'x': {'a': 1}}, render('d5')) == 'd5'
+        plain = {'when': datetime(2012, 1, 1), 'price': Decimal('1.5'), 'tags': set(['a']), 'none': None}
+        assert cache.render('e.html', plain, render('e1')) == 'e1'
+        assert cache.render('e.html', dict(plain), render('e2')) == 'e1'
+
+        # fragments are cached by name and arguments
+        assert cache.fragment('sidebar', render('s1')) == 's1'
+        assert cache.fragment('sidebar', render('s2')) == 's1'
+        fragments = RenderCache()
+        label = lambda text, suffix='': text + suffix
+        assert fragments.fragment('label', label, 'a') == 'a'
+        assert fragments.fragment('label', label, 'b') == 'b'
+        assert fragments.fragment('label', label, 'a', suffix='!') == 'a!'
+        assert fragments.fragment('label', lambda *a, **kw: 'other', 'a') == 'a'
+        # unless an argument isn't plain data
+        described = []
+        def describe(model):
+            described.append(model)
+            return 'model %d' % len(described)
+        assert fragments.fragment('model', describe, model) == 'model 1'
+        assert fragments.fragment('model', describe, model) == 'model 2'
+
+        # expired entries are rendered again
+        cache = RenderCache(ttl=-1)
+        assert cache.render('a.html', {}, render('e1')) == 'e1'
+        assert cache.render('a.html', {}, render('e2')) == 'e2'
+
+        # a key function can narrow down (or skip) caching
+        cache = RenderCache(key=lambda template, ns: ns.get('user'))
+        assert cache.render('a.html', {'user': 1, 'now': 1}, render('k1')) == 'k1'
+        assert cache.render('a.html', {'user': 1, 'now': 2}, render('k2')) == 'k1'
+        assert cache.render('a.html', {'now': 3}, render('k3')) == 'k3'
+        assert cache.render('a.html', {'now': 3}, render('k4')) == 'k4'
+
+    def test_render_cache_coalescing(self):
+        from pecan.templating import RenderCache
+        from threading import Event, Thread
+
+        renders = []
+        started = Event()
+        proceed = Event()
+        def render():
+            renders.append('slow')
+            started.set()
+            proceed.wait()
+            return 'slow'
+
+        # concurrent misses wait for the first render
+        cache = RenderCache()
+        outputs = []
+        def get():
+            outputs.append(cache.fragment('slow', render))
+        threads = [Thread(target=get) for i in range(4)]
+        threads[0].start()
+        started.wait()
+        for thread in threads[1:]:
+            thread.start()
+        proceed.set()
+        for thread in threads:
+            thread.join()
+        assert renders == ['slow']
+        assert outputs == ['slow'] * 4
+        assert len(cache.flights) == 0
+
+        # a render which fails lets the others render it themselves
+        def fail():
+            raise ValueError
+        self.assertRaises(ValueError, cache.fragment, 'fail', fail)
+        assert cache.fragment('fail', lambda: 'ok') == 'ok'
+
+        # a stale render is served while another thread renders it again
+        cache = RenderCache(ttl=-1, stale=60)
+        assert cache.fragment('a', lambda: 'a1') == 'a1'
+        cache.flights.acquire(cache.fragment_key('a', (), {}))
+        assert cache.fragment('a', lambda: 'a2') == 'a1'
+        cache.flights.release(cache.fragment_key('a', (), {}))
+        assert cache.fragment('a', lambda: 'a3') == 'a3'
+
+        # without coalescing, every miss renders
+        cache = RenderCache(ttl=-1, stale=60, coalesce=False)
+        assert cache.fragment('a', lambda: 'a1') == 'a1'
+        assert cache.fragment('a', lambda: 'a2') == 'a2'
+
+    def test_layered_namespace(self):
+        from pecan.templating import LayeredNamespace
+
+        controller = {'foo': 1}
+        helpers = {'foo': 2, 'helper': 3}
+        self.rf.extra_vars.update({'helper': 4, 'extra': 5})
+
+        ns = self.rf.extra_vars.layer(LayeredNamespace(controller, helpers))
+        assert ns['foo'] == 1
+        assert ns['helper'] == 3
+        assert ns['extra'] == 5
+        assert 'extra' in ns and 'missing' not in ns
+        assert ns.get('missing') is None
+        self.assertRaises(KeyError, lambda: ns['missing'])
+        assert sorted(ns.keys()) == ['extra', 'foo', 'helper']
+        assert ns.flatten() == {'foo': 1, 'helper': 3, 'extra': 5}
+        assert self.rf.extra_vars.make_ns(LayeredNamespace(controller, helpers)) == ns.flatten()
+
+        # assignments go to the first layer only
+        ns['extra'] = 6
+        assert controller == {'foo': 1, 'extra': 6}
+        assert self.rf.extra_vars.namespace['extra'] == 5
+
+    def test_renderers_per_template_path(self):
+        import os
+        template_path = os.path.join(os.path.dirname(__file__), 'templates')
+        static_path = os.path.join(os.path.dirname(__file__), 'static')
+
+        mako = self.rf.get('mako', template_path)
+        assert self.rf.get('mako', template_path) is mako
+        assert self.rf.get('mako', [template_path]) is mako
+        assert self.rf.get('mako', static_path) is not mako
+        assert self.rf.get('mako', [static_path, template_path]) is not mako
+
+    def test_template_index(self):
+        import os
+        import shutil
+        import tempfile
+        from pecan.templating import TemplateIndex
+
+        first, second = tempfile.mkdtemp(), tempfile.mkdtemp()
+        def write(path, name, body):
+            if not os.path.isdir(os.path.dirname(os.path.join(path, name))):
+                os.makedirs(os.path.dirname(os.path.join(path, name)))
+            f = open(os.path.join(path, name), 'w')
+            f.write('<p>%s</p>' % body)
+            f.close()
+
+        try:
+            write(first, 'page.html', 'first page')
+            write(second, 'page.html', 'second page')
+            write(second, 'sub/other.html', 'other')
+
+            index = TemplateIndex([first, second])
+            assert len(index) == 2
+            assert index.find('page.html') == os.path.join(first, 'page.html')
+            assert index.find('/sub/other.html') == os.path.join(second, 'sub', 'other.html')
+            assert index.find('missing.html') is None
+
+            rf = RendererFactory(index=True)
+            for engine in ('mako', 'jinja', 'genshi'):
+                if not rf.available(engine):
+                    continue
+                renderer = rf.get(engine, [first, second])
+                assert 'first page' in renderer.render('page.html', {})
+                assert 'other' in renderer.render('sub/other.html', {})
+
+                # templates added after the index was built are still found
+                write(second, 'new-%s.html' % engine, 'new')
+                assert 'new' in renderer.render('new-%s.html' % engine, {})
+
+            # as are those whose indexed file was removed since
+            for engine in ('mako', 'jinja', 'genshi'):
+                if not rf.available(engine):
+                    continue
+                write(first, 'page.html', 'first page')
+                rf = RendererFactory(index=True)
+                renderer = rf.get(engine, [first, second])
+                os.remove(os.path.join(first, 'page.html'))
+                assert 'second page' in renderer.render('page.html', {})
+                assert rf.index([first, second]).find('page.html') is None
+        finally:
+            shutil.rmtree(first)
+            shutil.rmtree(second)
@@ -1,4 +1,5 @@
-from pecan.util import compat_splitext
+from pecan.util import compat_splitext, LRUCache, SingleFlight
+from threading import Thread
 
 def test_compat_splitext():
     assert ('foo', '.bar') == compat_splitext('foo.bar')
@@ -9,3 +10,48 @@ def test_compat_splitext():
     assert ('/.bashrc', '') == compat_splitext('/.bashrc')
     assert ('/foo.bar/.bashrc', '') == compat_splitext('/foo.bar/.bashrc')
     assert ('/foo.js', '.js') == compat_splitext('/foo.js.js')
+
+def test_lru_cache():
+    cache = LRUCache(2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert 'b' not in cache
+    assert cache.get('b') is None
+    assert cache.get('c') == 3
+    assert (cache.hits, cache.misses) == (2, 1)
+    cache.delete('c')
+    assert 'c' not in cache
+    assert cache.get('a') == 1
+    cache.delete('missing')
+    cache.clear()
+    assert len(cache) == 0
+
+def test_single_flight():
+    flights = SingleFlight()
+    assert flights.acquire('a') is True
+    assert flights.acquire('a', wait=False) is False
+    assert flights.acquire('b') is True
+    assert len(flights) == 2
+
+    # other threads wait for the leader to be done
+    results = []
+    def follow():
+        results.append(flights.acquire('a'))
+    followers = [Thread(target=follow) for i in range(3)]
+    for follower in followers:
+        follower.start()
+    flights.release('a')
+    for follower in followers:
+        follower.join()
+    assert len(results) == 3
+
+    flights.release('b')
+    flights.release('missing')
+    assert flights.acquire('b') is True
+
+    # waiting gives up after the timeout
+    flights = SingleFlight(timeout=0.01)
+    assert flights.acquire('a') is True
+    assert flights.acquire('a') is False
@@ -1,4 +1,5 @@
 from formencode import ForEach, Schema, validators
+from webob import Request
 from webtest import TestApp
 
 import os.path
@@ -77,6 +78,63 @@ class TestValidation(object):
         assert r.status_int == 200
         assert r.body == 'Success!'
         
+    def test_json_body(self):
+        from pecan.hooks import PecanHook
+
+        parsed = []
+
+        class JsonHook(PecanHook):
+            def before(self, state):
+                parsed.append(state.request.pecan['json'])
+
+        class NameSchema(Schema):
+            name = validators.String(not_empty=True)
+
+        class RootController(object):
+            @expose(json_schema=NameSchema())
+            def index(self, data):
+                parsed.append(request.pecan['json'])
+                return data['name']
+
+            @expose()
+            def echo(self):
+                assert request.pecan['json'] == {'name': 'Ryan'}
+                return request.body
+
+        app = TestApp(make_app(RootController(), hooks=[JsonHook()], max_json_size=64))
+        r = app.post('/', dumps(dict(name='Ryan')), [('content-type', 'application/json')])
+        assert r.status_int == 200
+        assert r.body == 'Ryan'
+
+        # the body is parsed once, for the hook, validation and controller
+        assert parsed[0] == {'name': 'Ryan'}
+        assert parsed[0] is parsed[1]
+
+        # larger bodies are rejected before they are read
+        r = app.post('/', dumps(dict(name='Ryan' * 20)), [('content-type', 'application/json')], status=413)
+        assert r.status_int == 413
+
+        # chunked bodies are read up to the limit
+        def post(body, chunked=True, path='/'):
+            req = Request.blank(path, method='POST', body=body)
+            req.content_type = 'application/json'
+            del req.environ['CONTENT_LENGTH']
+            if chunked:
+                req.environ['HTTP_TRANSFER_ENCODING'] = 'chunked'
+            return req.get_response(app.app)
+        assert post(dumps(dict(name='Ryan'))).body == 'Ryan'
+        assert post(dumps(dict(name='Ryan' * 20))).status_int == 413
+
+        # and the body can still be read afterwards
+        assert post(dumps(dict(name='Ryan')), path='/echo').body == dumps(dict(name='Ryan'))
+
+        # without a length or chunked encoding, there is no body to read
+        assert post(dumps(dict(name='Ryan')), chunked=False).status_int == 400
+
+        # malformed bodies are a client error
+        r = app.post('/', '{"name": ', [('content-type', 'application/json')], status=400)
+        assert r.status_int == 400
+
     def test_simple_failure(self):
         class RegistrationSchema(Schema):
             first_name         = validators.String(not_empty=True)
@@ -688,6 +746,104 @@ class TestValidation(object):
         })
         assert r.status_int == 200
         assert r.body == _get_contents('form_login_invalid.html')
+
+    def test_htmlfill_fast(self):
+
+        if 'mako' not in builtin_renderers:
+            return
+
+        class LoginSchema(Schema):
+            username = validators.String(not_empty=True)
+            password = validators.String(not_empty=True)
+
+        class NameSchema(Schema):
+            name = validators.String(not_empty=True)
+
+        class RootController(object):
+
+            @expose(template='mako:form_login.html',
+                    schema=LoginSchema(),
+                    htmlfill=dict(fast=True))
+            def index(self, **kwargs):
+                return dict()
+
+            @expose(template='mako:form_name.html',
+                    schema=NameSchema(),
+                    htmlfill=dict(auto_insert_errors=True, fast=True))
+            def with_errors(self, **kwargs):
+                return kwargs
+
+            @expose(schema=NameSchema(),
+                    error_handler='/errors_with_handler',
+                    htmlfill=dict(auto_insert_errors=True, fast=True))
+            def with_handler(self, **kwargs):
+                return kwargs['name']
+
+            @expose('mako:form_name.html')
+            def errors_with_handler(self):
+                return dict()
+
+        def _get_contents(filename):
+            return open(os.path.join(self.template_path, filename), 'r').read()
+
+        app = TestApp(make_app(RootController(), template_path=self.template_path))
+        r = app.post('/', {
+            'username' : 'ryan',
+            'password' : ''
+        })
+        assert r.status_int == 200
+        assert r.body == _get_contents('form_login_invalid.html')
+
+        r = app.post('/with_errors', {
+            'name' : ''
+        })
+        assert r.status_int == 200
+        assert r.body == _get_contents('form_name_invalid.html')
+
+        r = app.post('/with_handler', {
+            'name' : ''
+        })
+        assert r.status_int == 200
+        assert r.body == _get_contents('form_name_invalid.html')
+
+    def test_formfill(self):
+        from formencode import htmlfill
+        from pecan import formfill
+
+        form = '\n'.join([
+            '<form><!-- <input name="name"> -->',
+            '<input type="text" name="name" value="a &amp; b" />',
+            '<input type="checkbox" name="agree" value="yes" checked>',
+            '<input type="radio" name="color" value="red">',
+            '<input type="radio" name="color" value="blue" checked>',
+            '<select name="choice"><option value="a" selected>A</option>',
+            '<option value="b">B</option></select>',
+            '<textarea name="notes">Old notes</textarea>',
+            '</form>'
+        ])
+        defaults = dict(name='Ryan', color='red', choice='b', notes='<new>')
+        errors = dict(name='Bad name', notes='Too short', missing='Missing')
+
+        for options in (
+            dict(),
+            dict(auto_insert_errors=False),
+            dict(prefix_error=False),
+            dict(force_defaults=False)
+        ):
+            expected = htmlfill.render(form, defaults=defaults, errors=errors, **options)
+            assert formfill.render(form, defaults=defaults, errors=errors, **options) == expected
+
+            # fill the form in chunks, as if it were streamed
+            chunks = [form[i:i + 7] for i in range(0, len(form), 7)]
+            assert ''.join(
+                formfill.iterfill(chunks, defaults=defaults, errors=errors, **options)
+            ) == expected
+
+        # options only htmlfill supports are handed over to it
+        options = dict(defaults=dict(name='Ryan', notes='<new>'), use_all_keys=True)
+        expected = htmlfill.render(form, **options)
+        assert formfill.render(form, **options) == expected
+        assert ''.join(formfill.iterfill(chunks, **options)) == expected
     
     def test_error_for(self):
         